@@ -16,8 +16,12 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 
 from NeighborsHub.middleware import TokenAuthMiddlewareChannels
+from NeighborsHub.snowflake import get_snowflake_generator
 from chat.routing import websocket_urlpatterns
 
+# consumers create messages on the event loop, lease the snowflake node id before serving
+get_snowflake_generator()
+
 # application = get_asgi_application()
 
 application = ProtocolTypeRouter({
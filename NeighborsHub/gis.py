@@ -0,0 +1,58 @@
+import math
+
+from django.contrib.gis.db.models.functions import GeoFunc
+from django.contrib.gis.geos import Point
+from django.db.models import FloatField
+
+# Length of the shortest degree of latitude, keeps degree bounds derived from meters conservative.
+METERS_PER_DEGREE = 110574
+
+
+class KNNDistance(GeoFunc):
+    """
+    Planar `<->` distance between two geometries. Ordering by it is answered by the GiST index of the
+    first argument (KNN scan) instead of computing the distance of every row.
+    """
+    function = ''
+    arg_joiner = ' <-> '
+    template = '(%(expressions)s)'
+    geom_param_pos = (0, 1)
+    output_field = FloatField()
+
+
+def meters_to_degrees(meters: float, location_point: Point) -> float | None:
+    """
+    Radius in degrees of SRID 4326 coordinates containing every point that is within `meters` of
+    `location_point`, suitable for index-assisted `dwithin` prefilters. Returns None close to the poles where
+    longitude degrees collapse and no useful bound exists.
+    """
+    max_latitude = abs(location_point.y) + meters / METERS_PER_DEGREE
+    if max_latitude >= 89:
+        return None
+    return 1.01 * meters / (METERS_PER_DEGREE * math.cos(math.radians(max_latitude)))
+
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_MAX_PRECISION = 12
+
+
+def encode_geohash(location_point: Point, precision: int = GEOHASH_MAX_PRECISION) -> str:
+    """Geohash of a SRID 4326 point, every prefix of it is the geohash of a coarser cell."""
+    latitude_range, longitude_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, char_index, bit, is_longitude = [], 0, 0, True
+    while len(geohash) < precision:
+        value_range, value = (longitude_range, location_point.x) if is_longitude else (latitude_range,
+                                                                                        location_point.y)
+        middle = (value_range[0] + value_range[1]) / 2
+        char_index <<= 1
+        if value >= middle:
+            char_index |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        is_longitude = not is_longitude
+        bit += 1
+        if bit == 5:
+            geohash.append(GEOHASH_BASE32[char_index])
+            char_index, bit = 0, 0
+    return ''.join(geohash)
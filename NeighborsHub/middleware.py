@@ -1,48 +1,113 @@
+import logging
+import time
+from collections import Counter, deque
+from urllib.parse import parse_qs
+
 from channels.auth import AuthMiddlewareStack
-from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth import get_user_model
 
 from rest_framework import exceptions
 from NeighborsHub.custom_jwt import verify_custom_token
+from NeighborsHub.exceptions import CustomException
 from NeighborsHub.redis_management import AuthenticationTokenRedis
+from NeighborsHub.token_cache import get_token_cache
 from django.utils.translation import gettext as _
 
+logger = logging.getLogger(__name__)
+
+
+class WebsocketConnectMetrics:
+    """Outcome counts, connect rate over the last `window` seconds and authentication latency of handshakes."""
+    window = 60  # seconds
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.outcomes = Counter()
+        self.recent = deque()
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.logged_at = clock()
+
+    def record(self, outcome: str, seconds: float) -> None:
+        now = self.clock()
+        self.outcomes[outcome] += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent.append(now)
+        while self.recent[0] <= now - self.window:
+            self.recent.popleft()
+        if now - self.logged_at >= self.window:
+            self.logged_at = now
+            logger.info('Websocket connects: %s', self.snapshot())
+
+    def snapshot(self) -> dict:
+        handshakes = sum(self.outcomes.values())
+        return {
+            'connects_per_second': len(self.recent) / self.window,
+            **self.outcomes,
+            'mean_auth_ms': self.total_seconds / handshakes * 1000 if handshakes else 0.0,
+            'max_auth_ms': self.max_seconds * 1000,
+        }
+
+
+connect_metrics = WebsocketConnectMetrics()
+
 
 class TokenAuthMiddlewareChannels(BaseMiddleware):
+    """
+    Authenticates the websocket handshake from the `token` query parameter without blocking the event loop: the
+    user comes from the process token cache, or the token is checked with the asyncio Redis client and the user
+    fetched with the async ORM.
+    """
+
     def __init__(self, inner):
         super().__init__(inner)
 
     @staticmethod
-    def get_user(user_id):
-        try:
-            user = get_user_model().objects.get(id=user_id)
-            return user
-        except get_user_model().DoesNotExist:
-            return None
+    def get_token(scope):
+        return parse_qs(scope['query_string'].decode()).get('token', [None])[0]
 
     @staticmethod
-    def _check_token_in_redis(token, user_id):
-        redis_user = AuthenticationTokenRedis().get(token)
+    async def get_user(user_id):
+        return await get_user_model().objects.filter(id=user_id).afirst()
+
+    @staticmethod
+    async def _check_token_in_redis(token, user_id):
+        redis_user = await AuthenticationTokenRedis().aget(token)
         if redis_user is None or int(user_id) != int(redis_user):
             raise exceptions.AuthenticationFailed(_('Token is not valid'))
         return True
 
-    async def __call__(self, scope, receive, send):
-        try:
-            token_key = (dict((x.split('=') for x in scope['query_string'].decode().split("&")))).get('token', None)
-        except ValueError:
-            token_key = None
+    async def authenticate(self, token):
+        """The user of the token and whether it came from the token cache."""
+        token_cache = get_token_cache()
+        if token_cache is not None:
+            user = token_cache.get(token)
+            if user is not None:
+                return user, 'cached'
+            cache_version = token_cache.version
 
-        has_error, payload = verify_custom_token(token_key) if token_key is not None else (True, None)
+        has_error, payload = verify_custom_token(token)
         if has_error:
             raise exceptions.AuthenticationFailed()
-        self._check_token_in_redis(token_key, payload['payload']['user_id'])
-        if token_key is None:
-            scope['user'] = None
-        else:
-            scope['user'] = await database_sync_to_async(self.get_user)(payload['payload']['user_id'])
-            print(scope['user'])
+        await self._check_token_in_redis(token, payload['payload']['user_id'])
+        user = await self.get_user(payload['payload']['user_id'])
+        if user is not None and token_cache is not None:
+            token_cache.set(token, user, payload['payload'].get('exp'), cache_version)
+        return user, 'verified'
+
+    async def __call__(self, scope, receive, send):
+        started = time.perf_counter()
+        token_key = self.get_token(scope)
+        try:
+            if token_key is None:
+                raise exceptions.AuthenticationFailed()
+            scope['user'], outcome = await self.authenticate(token_key)
+        except (exceptions.AuthenticationFailed, CustomException):
+            connect_metrics.record('rejected', time.perf_counter() - started)
+            raise
+        connect_metrics.record(outcome, time.perf_counter() - started)
         return await super().__call__(scope, receive, send)
 
 
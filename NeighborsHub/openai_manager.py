@@ -1,14 +1,43 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
 from langchain.chains import create_tagging_chain
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv(), override=True)
 
+
+@functools.lru_cache(maxsize=None)
+def get_chat_llm():
+    # one client per process, its http connection pool is reused by every task
+    return ChatOpenAI(temperature=0, model="gpt-3.5-turbo-0613")
+
+
+def _category_schema(categories: tuple[str], keys: tuple[str]):
+    return {
+        "properties": {
+            key: {
+                "type": "string",
+                "enum": list(categories),
+                "description": f"best category for {key}." if len(keys) > 1 else "best category for this text."
+            } for key in keys
+        },
+        "required": list(keys),
+    }
+
+
+@functools.lru_cache(maxsize=32)
+def get_tagging_chain(categories: tuple[str], keys: tuple[str]):
+    return create_tagging_chain(_category_schema(categories, keys), get_chat_llm())
+
+
 class GetPostCategory:
     def __init__(self, categories: list[str], text):
         self.categories = categories
         self.text = text
-        self.__llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo-0613")
 
     @property
     def categories(self):
@@ -22,18 +51,59 @@ class GetPostCategory:
 
     @property
     def _schema(self):
-        return {
-            "properties": {
-                "category": {
-                    "type": "string",
-                    "enum": self.categories,
-                    "description": "best category for this text."
-                }
-            },
-            "required": ["category", ],
-        }
+        return _category_schema(tuple(self.categories), ("category",))
 
     def run(self):
-        chain = create_tagging_chain(self._schema, self.__llm)
+        chain = get_tagging_chain(tuple(self.categories), ("category",))
         result = chain.run(self.text)
         return result.get("category", None)
+
+
+class GetPostsCategories(GetPostCategory):
+    """Categories of several texts with a single LLM call, the schema has one category property per text."""
+
+    def __init__(self, categories: list[str], texts: list[str]):
+        super().__init__(categories, None)
+        self.texts = texts
+
+    @property
+    def _keys(self):
+        return tuple(f"text_{index}" for index in range(len(self.texts)))
+
+    @property
+    def _schema(self):
+        return _category_schema(tuple(self.categories), self._keys)
+
+    def run(self):
+        chain = get_tagging_chain(tuple(self.categories), self._keys)
+        result = chain.run("\n\n".join(f"{key}:\n{text}" for key, text in zip(self._keys, self.texts)))
+        return [result.get(key, None) for key in self._keys]
+
+
+class StubPostsCategories(GetPostsCategories):
+    """
+    Offline stand-in of `GetPostsCategories`, picks the first category named in the text or a stable one
+    derived from the text, after sleeping `latency` seconds per call like a remote model would.
+    """
+
+    def __init__(self, categories: list[str], texts: list[str], latency: float = None):
+        super().__init__(categories, texts)
+        self.latency = settings.POST_CATEGORIZATION['STUB_LATENCY'] if latency is None else latency
+
+    def _pick(self, text):
+        lowered = text.lower()
+        for category in self.categories:
+            if category.lower() in lowered:
+                return category
+        return self.categories[int(hashlib.md5(text.encode()).hexdigest(), 16) % len(self.categories)]
+
+    def run(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._pick(text) for text in self.texts]
+
+
+def get_posts_categorizer(categories: list[str], texts: list[str]) -> GetPostsCategories:
+    if settings.POST_CATEGORIZATION['BACKEND'] == 'stub':
+        return StubPostsCategories(categories, texts)
+    return GetPostsCategories(categories, texts)
@@ -0,0 +1,248 @@
+import base64
+import datetime
+import decimal
+import json
+import operator
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward only keyset pagination over the view's `cursor_ordering` (or `get_cursor_ordering()`), e.g.
+    `('-created_at', '-id')`, whose last field must be unique. The cursor holds the ordering values of the last
+    row of the page, the next page is a range condition the index can seek to instead of an OFFSET, and no
+    count is run.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.request = None
+        self.ordering = ()
+        self.page = []
+        self.has_next = False
+
+    @staticmethod
+    def get_ordering(view):
+        ordering = view.get_cursor_ordering() if hasattr(view, 'get_cursor_ordering') else view.cursor_ordering
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def after(self, position):
+        """Rows after `position` in the ordering: `(a > x) | (a = x & b > y) | ...` with the directions applied."""
+        conditions, equal = [], Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            conditions.append(equal & Q(**{f'{name}__{"lt" if field.startswith("-") else "gt"}': value}))
+            equal &= Q(**{name: value})
+        return reduce(operator.or_, conditions)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [self.to_python(queryset, field.lstrip('-'), value) for field, value in zip(self.ordering, position)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(queryset, name, value):
+        """A cursor value as the type of the model field or annotation `name` orders by."""
+        if value is None:
+            raise ValueError(f'{name} of the cursor is null')
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field.to_python(value)
+        return queryset.model._meta.get_field(name).to_python(value)
+
+    def encode_cursor(self, instance):
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            elif isinstance(value, decimal.Decimal):
+                value = str(value)
+            position.append(value)
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'previous': None, 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ApproximateCountPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination whose `count` precision is picked per view with `count_precision`:
+
+    * `exact`: a plain `COUNT(*)`.
+    * `capped`: counts at most `count_cap + 1` rows, a larger result is reported as `count_cap` with
+      `count_precision` set to `capped`, i.e. "1000+".
+    * `estimate`: the planner's row estimate from `EXPLAIN`, small estimates fall back to a capped count so short
+      lists stay exact.
+
+    The next link does not depend on the count, one extra row is fetched to know whether there is a next page.
+    """
+    count_precision = 'exact'
+    count_precisions = ('exact', 'capped', 'estimate')
+    count_cap = 1000
+
+    def __init__(self):
+        self.precision = self.count_precision
+        self.has_next = False
+
+    def get_count_precision(self, view):
+        precision = getattr(view, 'count_precision', self.count_precision)
+        if precision not in self.count_precisions:
+            raise ValueError(f'Unknown count precision {precision!r}')
+        return precision
+
+    def get_count_cap(self, view):
+        return getattr(view, 'count_cap', self.count_cap)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.count, self.precision = self.get_approximate_count(
+            queryset, self.get_count_precision(view), self.get_count_cap(view))
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return results[:self.limit]
+
+    def get_approximate_count(self, queryset, precision, cap):
+        if precision == 'exact':
+            return self.get_count(queryset), 'exact'
+        if precision == 'estimate':
+            estimate = self.get_estimated_count(queryset)
+            if estimate is not None and estimate > cap:
+                return estimate, 'estimate'
+        return self.get_capped_count(queryset, cap)
+
+    @staticmethod
+    def get_capped_count(queryset, cap):
+        count = queryset.order_by()[:cap + 1].count()
+        if count > cap:
+            return cap, 'capped'
+        return count, 'exact'
+
+    @staticmethod
+    def get_estimated_count(queryset):
+        try:
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows'])
+        except (ValueError, TypeError, KeyError, IndexError):
+            # the backend has no JSON plans
+            return None
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'count_precision': self.precision,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_precision'] = {
+            'type': 'string',
+            'enum': list(self.count_precisions),
+            'example': 'exact',
+        }
+        return response_schema
+
+
+class LimitOffsetOrCursorPagination(BasePagination):
+    """
+    Limit/offset pagination by default, `?paginate=cursor` switches to keyset pagination which does not have to
+    count or skip rows, follow the `next` link to get the following page.
+    """
+    limit_offset_class = ApproximateCountPagination
+    cursor_class = KeysetPagination
+    mode_query_param = 'paginate'
+
+    def __init__(self):
+        self.paginator = None
+
+    def get_paginator(self, request):
+        if request.query_params.get(self.mode_query_param) == 'cursor':
+            return self.cursor_class()
+        return self.limit_offset_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.limit_offset_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.limit_offset_class().get_schema_operation_parameters(view)
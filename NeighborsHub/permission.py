@@ -7,6 +7,7 @@ from rest_framework.permissions import BasePermission
 
 from NeighborsHub.custom_jwt import verify_custom_token
 from NeighborsHub.redis_management import AuthenticationTokenRedis
+from NeighborsHub.token_cache import get_token_cache
 from users.models import CustomerUser, Address
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
@@ -25,14 +26,25 @@ class CustomAuthentication(authentication.BaseAuthentication):
         token = request.META.get('HTTP_AUTHORIZATION')
         if token is None or len(token.split()) < 2:
             raise exceptions.AuthenticationFailed(_('Access token is not exist.'))
-        has_error, payload = verify_custom_token(token.split()[1])
+        token = token.split()[1]
+        # a token validated in the last seconds is served from the process cache without a round trip
+        token_cache = get_token_cache()
+        if token_cache is not None:
+            user = token_cache.get(token)
+            if user is not None:
+                return user, None
+            cache_version = token_cache.version
+
+        has_error, payload = verify_custom_token(token)
         if has_error:
             raise exceptions.AuthenticationFailed(_(payload['error']))
-        self._check_token_in_redis(token.split()[1], payload['payload']['user_id'])
+        self._check_token_in_redis(token, payload['payload']['user_id'])
         try:
             user = get_user_model().objects.get(id=payload['payload']['user_id'])
         except CustomerUser.DoesNotExist:
             raise exceptions.AuthenticationFailed(_('User does not exist'))
+        if token_cache is not None:
+            token_cache.set(token, user, payload['payload'].get('exp'), cache_version)
         return user, None
 
 
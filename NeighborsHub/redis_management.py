@@ -1,11 +1,129 @@
-from redis import Redis
+import asyncio
+import datetime
+import threading
+import time
+import uuid
+import weakref
+
+from redis import BlockingConnectionPool, Redis
+from redis import asyncio as aioredis
+from redis.client import Pipeline, PubSub
 from django.conf import settings
 
 
+class RedisCommandMetrics:
+    """Per command count, total and worst latency of the Redis calls made by this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def record(self, command: str, seconds: float) -> None:
+        with self.lock:
+            count, total, worst = self.commands.get(command, (0, 0.0, 0.0))
+            self.commands[command] = (count + 1, total + seconds, max(worst, seconds))
+
+    def snapshot(self) -> dict[str, dict]:
+        with self.lock:
+            commands = dict(self.commands)
+        return {command: {'count': count, 'total': total, 'mean': total / count, 'max': worst}
+                for command, (count, total, worst) in commands.items()}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.commands.clear()
+
+
+redis_command_metrics = RedisCommandMetrics()
+
+
+class InstrumentedPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            redis_command_metrics.record('PIPELINE', time.perf_counter() - started)
+
+
+class InstrumentedRedis(Redis):
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            redis_command_metrics.record(str(args[0]).upper(), time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedAsyncPipeline(aioredis.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_metrics.record('PIPELINE', time.perf_counter() - started)
+
+
+class InstrumentedAsyncRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_metrics.record(str(args[0]).upper(), time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def redis_pool_options() -> dict:
+    return {
+        'host': settings.REDIS_ENGINE['host'],
+        'port': settings.REDIS_ENGINE['port'],
+        'db': 0,
+        'max_connections': settings.REDIS_ENGINE['max_connections'],
+        # seconds to wait for a free connection once the pool is exhausted
+        'timeout': settings.REDIS_ENGINE['socket_timeout'],
+        'socket_timeout': settings.REDIS_ENGINE['socket_timeout'],
+        'socket_connect_timeout': settings.REDIS_ENGINE['socket_connect_timeout'],
+        'health_check_interval': settings.REDIS_ENGINE['health_check_interval'],
+    }
+
+
+_redis_connection = None
+_redis_connection_lock = threading.Lock()
+_async_redis_connections = weakref.WeakKeyDictionary()  # event loop -> client
+
+
+def get_redis_connection() -> Redis:
+    """The process wide Redis client, its connection pool is shared by every helper and thread."""
+    global _redis_connection
+    if _redis_connection is None:
+        with _redis_connection_lock:
+            if _redis_connection is None:
+                client_class = InstrumentedRedis if settings.REDIS_ENGINE['command_metrics'] else Redis
+                _redis_connection = client_class(connection_pool=BlockingConnectionPool(**redis_pool_options()))
+    return _redis_connection
+
+
+def get_async_redis_connection() -> aioredis.Redis:
+    """The asyncio Redis client of the running event loop, asyncio connections can not be shared across loops."""
+    loop = asyncio.get_running_loop()
+    connection = _async_redis_connections.get(loop)
+    if connection is None:
+        client_class = InstrumentedAsyncRedis if settings.REDIS_ENGINE['command_metrics'] else aioredis.Redis
+        connection = client_class(connection_pool=aioredis.BlockingConnectionPool(**redis_pool_options()))
+        _async_redis_connections[loop] = connection
+    return connection
+
+
 class VerificationEmailRedis:
     def __init__(self, issued_for: str):
         self.issued_for = issued_for
-        self.connection = Redis(host=settings.REDIS_ENGINE['host'], port=settings.REDIS_ENGINE['port'], db=0)
+        self.connection = get_redis_connection()
         self.expire_time = 24 * 3600
 
     def create(self, keyword: str, token: str) -> None:
@@ -28,3 +146,267 @@ class AuthenticationTokenRedis(VerificationEmailRedis):
     def __init__(self):
         super().__init__(issued_for="Authorization")
         self.expire_time = settings.JWT_AUTH_TIME_DELTA * 24 * 3600
+        self.invalidation_channel = settings.AUTH_TOKEN_CACHE['CHANNEL']
+
+    def revoke(self, keyword: str) -> None:
+        super().revoke(keyword)
+        self.publish_invalidation(f"token:{keyword}")
+
+    async def aget(self, keyword: str) -> None | bytes:
+        return await get_async_redis_connection().get(f"{self.issued_for}_{keyword}")
+
+    def publish_invalidation(self, message: str) -> int:
+        """Tell every process to drop its cached `token:<token>` or `user:<user_id>` entries."""
+        return self.connection.publish(self.invalidation_channel, message)
+
+    def subscribe_invalidations(self) -> PubSub:
+        pubsub = self.connection.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.invalidation_channel)
+        return pubsub
+
+
+class SeenPostEventsRedis:
+    """
+    FIFO buffer of `user_id:post_id:timestamp` seen-post events waiting to be written to the database. A flush claims
+    a batch, which moves it to its own claim list, and acknowledges it once written. Claims that were released or
+    abandoned by a dead worker go back to the head of the buffer.
+    """
+    claim_script = """
+        local events = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+        for index = 1, #events, 1000 do
+            redis.call('RPUSH', KEYS[2], unpack(events, index, math.min(index + 999, #events)))
+        end
+        if #events > 0 then
+            redis.call('LTRIM', KEYS[1], #events, -1)
+            redis.call('ZADD', KEYS[3], ARGV[2], KEYS[2])
+        end
+        return events
+    """
+    release_script = """
+        local events = redis.call('LRANGE', KEYS[2], 0, -1)
+        for index = #events, 1, -1 do
+            redis.call('LPUSH', KEYS[1], events[index])
+        end
+        redis.call('DEL', KEYS[2])
+        redis.call('ZREM', KEYS[3], KEYS[2])
+        return #events
+    """
+
+    def __init__(self, key: str = 'SeenPost/events'):
+        self.key = key
+        self.claims_key = f"{key}/claims"
+        self.connection = get_redis_connection()
+
+    def push(self, user_id: int, post_ids: list[int], seen_at: float) -> int:
+        events = [f"{user_id}:{post_id}:{seen_at}" for post_id in post_ids]
+        return self.connection.rpush(self.key, *events)
+
+    def claim(self, count: int) -> tuple[str, list[tuple[int, int, float]]]:
+        """Move the oldest `count` events to a new claim list, its key and the events."""
+        claim_key = f"{self.key}/claim/{uuid.uuid4().hex}"
+        events = self.connection.eval(self.claim_script, 3, self.key, claim_key, self.claims_key, count, time.time())
+        result = []
+        for event in events:
+            user_id, post_id, seen_at = event.decode().split(':')
+            result.append((int(user_id), int(post_id), float(seen_at)))
+        return claim_key, result
+
+    def ack(self, claim_key: str) -> None:
+        pipeline = self.connection.pipeline(transaction=True)
+        pipeline.delete(claim_key)
+        pipeline.zrem(self.claims_key, claim_key)
+        pipeline.execute()
+
+    def release(self, claim_key: str) -> int:
+        """Put the claimed events back at the head of the buffer, the number of events."""
+        return self.connection.eval(self.release_script, 3, self.key, claim_key, self.claims_key)
+
+    def release_stale(self, older_than: float) -> int:
+        """Release the claims of flushes that died more than `older_than` seconds ago, the number of events."""
+        stale = self.connection.zrangebyscore(self.claims_key, 0, time.time() - older_than)
+        return sum(self.release(claim_key.decode()) for claim_key in stale)
+
+    def size(self) -> int:
+        return self.connection.llen(self.key)
+
+
+class HashtagTrendRedis:
+    """Hourly and daily sorted sets scoring every hashtag by the number of posts and comments that used it."""
+
+    def __init__(self, key_prefix: str = None):
+        self.key_prefix = key_prefix or settings.HASHTAG_TRENDS['KEY_PREFIX']
+        self.connection = get_redis_connection()
+
+    def hour_key(self, moment: datetime.datetime) -> str:
+        return f"{self.key_prefix}/hour/{moment:%Y%m%d%H}"
+
+    def day_key(self, day: datetime.date) -> str:
+        return f"{self.key_prefix}/day/{day:%Y%m%d}"
+
+    def increment(self, hashtag_titles, moment: datetime.datetime) -> None:
+        pipeline = self.connection.pipeline(transaction=False)
+        for key, ttl in ((self.hour_key(moment), settings.HASHTAG_TRENDS['HOURLY_TTL']),
+                         (self.day_key(moment), settings.HASHTAG_TRENDS['DAILY_TTL'])):
+            for title in hashtag_titles:
+                pipeline.zincrby(key, 1, title)
+            pipeline.expire(key, ttl)
+        pipeline.execute()
+
+    def top_of_days(self, days: int, limit: int, now: datetime.datetime) -> list[tuple[str, int]]:
+        return self.top([self.day_key(now - datetime.timedelta(days=offset)) for offset in range(days)], limit)
+
+    def top_of_hours(self, hours: int, limit: int, now: datetime.datetime) -> list[tuple[str, int]]:
+        return self.top([self.hour_key(now - datetime.timedelta(hours=offset)) for offset in range(hours)], limit)
+
+    def top(self, keys: list[str], limit: int) -> list[tuple[str, int]]:
+        """The `limit` best scored hashtags of the union of the `keys` buckets."""
+        if len(keys) == 1:
+            result = self.connection.zrevrange(keys[0], 0, limit - 1, withscores=True)
+        else:
+            union_key = f"{self.key_prefix}/union/{uuid.uuid4().hex}"
+            pipeline = self.connection.pipeline(transaction=True)
+            pipeline.zunionstore(union_key, keys)
+            pipeline.zrevrange(union_key, 0, limit - 1, withscores=True)
+            pipeline.delete(union_key)
+            _, result, _ = pipeline.execute()
+        return [(title.decode(), int(score)) for title, score in result]
+
+    def day_counts(self, day: datetime.date) -> dict[str, int]:
+        return {title.decode(): int(score)
+                for title, score in self.connection.zrange(self.day_key(day), 0, -1, withscores=True)}
+
+
+class PostCategorizationRedis:
+    """
+    Set of post ids waiting to be categorized, the failed attempts of each and the dead letter set of posts that
+    kept failing, and the category cache keyed by post body hash.
+    """
+
+    def __init__(self, key_prefix: str = 'PostCategory'):
+        self.pending_key = f"{key_prefix}/pending"
+        self.attempts_key = f"{key_prefix}/attempts"
+        self.dead_key = f"{key_prefix}/dead"
+        self.cache_prefix = f"{key_prefix}/cache"
+        self.connection = get_redis_connection()
+
+    def push_pending(self, post_ids: list[int]) -> int:
+        return self.connection.sadd(self.pending_key, *post_ids)
+
+    def pop_pending(self, count: int) -> list[int]:
+        return [int(post_id) for post_id in self.connection.spop(self.pending_key, count) or []]
+
+    def record_failure(self, post_ids: list[int], max_attempts: int) -> list[int]:
+        """Queue the posts again, those that failed `max_attempts` times go to the dead letter set and are returned."""
+        pipeline = self.connection.pipeline(transaction=False)
+        for post_id in post_ids:
+            pipeline.hincrby(self.attempts_key, post_id, 1)
+        attempts = pipeline.execute()
+        dead = [post_id for post_id, attempt in zip(post_ids, attempts) if attempt >= max_attempts]
+        retry = [post_id for post_id, attempt in zip(post_ids, attempts) if attempt < max_attempts]
+        pipeline = self.connection.pipeline(transaction=True)
+        if retry:
+            pipeline.sadd(self.pending_key, *retry)
+        if dead:
+            pipeline.sadd(self.dead_key, *dead)
+            pipeline.hdel(self.attempts_key, *dead)
+        pipeline.execute()
+        return dead
+
+    def clear_attempts(self, post_ids: list[int]) -> None:
+        if post_ids:
+            self.connection.hdel(self.attempts_key, *post_ids)
+
+    def dead_letters(self) -> set[int]:
+        return {int(post_id) for post_id in self.connection.smembers(self.dead_key)}
+
+    def get_cached(self, body_hashes: list[str]) -> dict[str, str]:
+        if not body_hashes:
+            return {}
+        titles = self.connection.mget([f"{self.cache_prefix}/{body_hash}" for body_hash in body_hashes])
+        return {body_hash: title.decode() for body_hash, title in zip(body_hashes, titles) if title is not None}
+
+    def set_cached(self, categories: dict[str, str], expire_time: int) -> None:
+        pipeline = self.connection.pipeline(transaction=False)
+        for body_hash, title in categories.items():
+            pipeline.set(f"{self.cache_prefix}/{body_hash}", title, expire_time)
+        pipeline.execute()
+
+
+class PresenceRedis:
+    """
+    Live websocket connections of every user: a sorted set per user scoring each connection by the time its
+    heartbeat expires. A user is online while one of their connections has not expired, so the connections of a
+    crashed process go offline on their own. The methods are coroutines on the asyncio client.
+    """
+
+    def __init__(self, key_prefix: str = None, ttl: float = None):
+        self.key_prefix = key_prefix or settings.PRESENCE['KEY_PREFIX']
+        self.ttl = ttl or settings.PRESENCE['TTL']
+
+    def key(self, user_id: int) -> str:
+        return f"{self.key_prefix}/user/{user_id}"
+
+    async def connect(self, user_id: int, connection_id: str) -> int:
+        """Register or refresh the connection, the number of live connections of the user."""
+        now, key = time.time(), self.key(user_id)
+        pipeline = get_async_redis_connection().pipeline(transaction=True)
+        pipeline.zremrangebyscore(key, '-inf', now)
+        pipeline.zadd(key, {connection_id: now + self.ttl})
+        pipeline.zcard(key)
+        pipeline.pexpire(key, int(self.ttl * 1000))
+        _, _, count, _ = await pipeline.execute()
+        return count
+
+    async def disconnect(self, user_id: int, connection_id: str) -> int:
+        """Remove the connection, the number of live connections the user has left."""
+        now, key = time.time(), self.key(user_id)
+        pipeline = get_async_redis_connection().pipeline(transaction=True)
+        pipeline.zrem(key, connection_id)
+        pipeline.zremrangebyscore(key, '-inf', now)
+        pipeline.zcard(key)
+        _, _, count = await pipeline.execute()
+        return count
+
+    async def online(self, user_ids: list[int]) -> set[int]:
+        now = time.time()
+        pipeline = get_async_redis_connection().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.zcount(self.key(user_id), now, '+inf')
+        counts = await pipeline.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+
+class SnowflakeNodeRedis:
+    """
+    Leases of the node ids of the snowflake generators: a key per node id holding its owner, which expires after
+    `ttl` seconds unless the owner renews it. A node id is handed out again only once its owner stopped renewing.
+    """
+    renew_script = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+
+    def __init__(self, key_prefix: str = 'Snowflake', ttl: float = None):
+        self.key_prefix = key_prefix
+        self.counter_key = f"{key_prefix}/node"
+        self.ttl = ttl or settings.SNOWFLAKE['LEASE_TTL']
+        self.connection = get_redis_connection()
+
+    def key(self, node_id: int) -> str:
+        return f"{self.key_prefix}/node/{node_id}"
+
+    def lease(self, node_bits: int, owner: str) -> int:
+        """A free node id leased to `owner`, the search starts after the node id leased last."""
+        size = 1 << node_bits
+        start = self.connection.incr(self.counter_key)
+        for offset in range(size):
+            node_id = (start + offset) % size
+            if self.connection.set(self.key(node_id), owner, nx=True, px=int(self.ttl * 1000)):
+                return node_id
+        raise RuntimeError(f'All {size} snowflake node ids are leased')
+
+    def renew(self, node_id: int, owner: str) -> bool:
+        """Extend the lease of `owner`, False when it expired and the node id may belong to another process."""
+        return bool(self.connection.eval(self.renew_script, 1, self.key(node_id), owner, int(self.ttl * 1000)))
@@ -13,6 +13,8 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv, find_dotenv
 
+from NeighborsHub.utils import is_testing
+
 load_dotenv(find_dotenv(), override=True)
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # 3rd party
     'rest_framework',
     'corsheaders',
@@ -153,7 +156,13 @@ AUTH_USER_MODEL = 'users.CustomerUser'
 
 REDIS_ENGINE = {
     'host': os.getenv('REDIS_IP'),
-    'port': os.getenv('REDIS_PORT')
+    'port': os.getenv('REDIS_PORT'),
+    # every helper shares one connection pool per process
+    'max_connections': int(os.getenv('REDIS_MAX_CONNECTIONS') or 50),
+    'socket_timeout': float(os.getenv('REDIS_SOCKET_TIMEOUT') or 5),  # seconds
+    'socket_connect_timeout': float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT') or 2),  # seconds
+    'health_check_interval': int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL') or 30),  # seconds
+    'command_metrics': (os.getenv('REDIS_COMMAND_METRICS') or 'True') == 'True',
 }
 
 JWT_AUTH_TIME_DELTA = 30  # days
@@ -165,12 +174,50 @@ REST_FRAMEWORK = {
 }
 
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-    }
+# Websocket groups fan out through Redis so the consumers of every Daphne process reach each other. Channels and
+# groups are sharded over HOSTS by consistent hashing. `pubsub` delivers group messages with Redis pub/sub, `core`
+# keeps group members in sorted sets that expire GROUP_EXPIRY seconds after joining (it must outlast the longest
+# websocket connection) and buffers up to CAPACITY messages per channel. `memory` only works within one process.
+CHANNEL_LAYER = {
+    'BACKEND': os.getenv('CHANNEL_LAYER_BACKEND') or ('memory' if is_testing() else 'pubsub'),
+    'HOSTS': (os.getenv('CHANNEL_LAYER_HOSTS')
+              or f"redis://{REDIS_ENGINE['host']}:{REDIS_ENGINE['port']}/1").split(','),
+    'PREFIX': os.getenv('CHANNEL_LAYER_PREFIX') or 'asgi',
+    'CAPACITY': int(os.getenv('CHANNEL_LAYER_CAPACITY') or 1000),
+    'EXPIRY': int(os.getenv('CHANNEL_LAYER_EXPIRY') or 60),  # seconds
+    'GROUP_EXPIRY': int(os.getenv('CHANNEL_LAYER_GROUP_EXPIRY') or 86400),  # seconds
 }
 
+if CHANNEL_LAYER['BACKEND'] == 'core':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": CHANNEL_LAYER['HOSTS'],
+                "prefix": CHANNEL_LAYER['PREFIX'],
+                "capacity": CHANNEL_LAYER['CAPACITY'],
+                "expiry": CHANNEL_LAYER['EXPIRY'],
+                "group_expiry": CHANNEL_LAYER['GROUP_EXPIRY'],
+            },
+        }
+    }
+elif CHANNEL_LAYER['BACKEND'] == 'pubsub':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {
+                "hosts": CHANNEL_LAYER['HOSTS'],
+                "prefix": CHANNEL_LAYER['PREFIX'],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+
 # GDAL_LIBRARY_PATH = '/lib/libogdi.so'
 
 MEDIA_URL = '/media/'
@@ -186,3 +233,94 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
 CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
 CELERY_ENABLE_UTC = True
+
+# Seen-post events are buffered in Redis and written to `UserSeenPost` in batches by a celery worker.
+SEEN_POST_BUFFER = {
+    'ENABLED': (os.getenv('SEEN_POST_BUFFER_ENABLED') or 'True') == 'True',
+    'BATCH_SIZE': int(os.getenv('SEEN_POST_BUFFER_BATCH_SIZE') or 1000),
+    'MAX_BATCHES': int(os.getenv('SEEN_POST_BUFFER_MAX_BATCHES') or 50),  # per flush run
+    'FLUSH_INTERVAL': float(os.getenv('SEEN_POST_BUFFER_FLUSH_INTERVAL') or 5),  # seconds
+    # seconds after which a batch claimed by a flush that never acknowledged it is flushed again
+    'CLAIM_TIMEOUT': float(os.getenv('SEEN_POST_BUFFER_CLAIM_TIMEOUT') or 300),
+}
+
+# Hashtag usage is counted in hourly and daily Redis sorted sets, daily counts are persisted to `HashtagDailyCount`.
+HASHTAG_TRENDS = {
+    'KEY_PREFIX': os.getenv('HASHTAG_TRENDS_KEY_PREFIX') or 'Hashtag/trend',
+    'HOURLY_TTL': int(os.getenv('HASHTAG_TRENDS_HOURLY_TTL') or 2 * 24 * 3600),  # seconds
+    'DAILY_TTL': int(os.getenv('HASHTAG_TRENDS_DAILY_TTL') or 31 * 24 * 3600),  # seconds
+    'ROLLUP_INTERVAL': float(os.getenv('HASHTAG_TRENDS_ROLLUP_INTERVAL') or 15 * 60),  # seconds
+}
+
+# Posts waiting for a category are collected in Redis and classified in batches, one model call per batch.
+POST_CATEGORIZATION = {
+    'BACKEND': os.getenv('POST_CATEGORIZATION_BACKEND') or 'openai',  # `openai` or the offline `stub`
+    'BATCH_SIZE': int(os.getenv('POST_CATEGORIZATION_BATCH_SIZE') or 20),  # posts per model call
+    'MAX_BATCHES': int(os.getenv('POST_CATEGORIZATION_MAX_BATCHES') or 10),  # per run
+    # runs a post may fail in before it is moved to the dead letter set
+    'MAX_ATTEMPTS': int(os.getenv('POST_CATEGORIZATION_MAX_ATTEMPTS') or 3),
+    'INTERVAL': float(os.getenv('POST_CATEGORIZATION_INTERVAL') or 10),  # seconds
+    'CACHE_TTL': int(os.getenv('POST_CATEGORIZATION_CACHE_TTL') or 30 * 24 * 3600),  # seconds
+    'STUB_LATENCY': float(os.getenv('POST_CATEGORIZATION_STUB_LATENCY') or 0),  # seconds per stub call
+    # local nearest-centroid classifier answering before the model, when its margin reaches the threshold
+    'LOCAL_CLASSIFIER': (os.getenv('POST_CATEGORIZATION_LOCAL_CLASSIFIER') or 'True') == 'True',
+    'LOCAL_THRESHOLD': float(os.getenv('POST_CATEGORIZATION_LOCAL_THRESHOLD') or 0.15),
+    'LOCAL_RETRAIN_INTERVAL': float(os.getenv('POST_CATEGORIZATION_LOCAL_RETRAIN_INTERVAL') or 3600),  # seconds
+    'LOCAL_TRAINING_POSTS': int(os.getenv('POST_CATEGORIZATION_LOCAL_TRAINING_POSTS') or 5000),
+}
+
+# Post search runs on a maintained tsvector, `simple` keeps the index language agnostic.
+POST_SEARCH = {
+    'CONFIG': os.getenv('POST_SEARCH_CONFIG') or 'simple',
+}
+
+# Websocket connections of every user are tracked in Redis, a connection that stops sending heartbeats is offline
+# after TTL seconds.
+PRESENCE = {
+    'KEY_PREFIX': os.getenv('PRESENCE_KEY_PREFIX') or 'Presence',
+    'HEARTBEAT_INTERVAL': float(os.getenv('PRESENCE_HEARTBEAT_INTERVAL') or 30),  # seconds
+    'TTL': float(os.getenv('PRESENCE_TTL') or 90),  # seconds
+}
+
+# Chat messages are broadcast first and written behind in batches of BATCH_SIZE or every FLUSH_INTERVAL seconds,
+# new messages are refused while MAX_PENDING wait for a failing database.
+CHAT_MESSAGE_WRITER = {
+    'BATCH_SIZE': int(os.getenv('CHAT_MESSAGE_WRITER_BATCH_SIZE') or 200),
+    'FLUSH_INTERVAL': float(os.getenv('CHAT_MESSAGE_WRITER_FLUSH_INTERVAL') or 0.05),  # seconds
+    'MAX_PENDING': int(os.getenv('CHAT_MESSAGE_WRITER_MAX_PENDING') or 10000),
+}
+
+# Time ordered ids of chat messages: milliseconds since EPOCH, NODE_BITS of node id and SEQUENCE_BITS of sequence.
+# Without SNOWFLAKE_NODE_ID every process leases a free one in Redis and renews it until it stops, a node id is free
+# again LEASE_TTL seconds later. Only set SNOWFLAKE_NODE_ID where a single process runs per value.
+# The ids are beyond the 2**53 web clients parse JSON numbers exactly to, the API and websocket send them as strings.
+SNOWFLAKE = {
+    'NODE_ID': int(os.getenv('SNOWFLAKE_NODE_ID')) if os.getenv('SNOWFLAKE_NODE_ID') else None,
+    'NODE_BITS': int(os.getenv('SNOWFLAKE_NODE_BITS') or 10),
+    'SEQUENCE_BITS': int(os.getenv('SNOWFLAKE_SEQUENCE_BITS') or 12),
+    'EPOCH': int(os.getenv('SNOWFLAKE_EPOCH') or 1704067200000),  # 2024-01-01 UTC in milliseconds
+    'LEASE_TTL': float(os.getenv('SNOWFLAKE_LEASE_TTL') or 60),  # seconds
+}
+
+# Validated access tokens are cached per process, revocations and user changes are broadcast over Redis pub/sub.
+AUTH_TOKEN_CACHE = {
+    'ENABLED': (os.getenv('AUTH_TOKEN_CACHE_ENABLED') or 'True') == 'True',
+    'MAX_SIZE': int(os.getenv('AUTH_TOKEN_CACHE_MAX_SIZE') or 10000),
+    'TTL': float(os.getenv('AUTH_TOKEN_CACHE_TTL') or 30),  # seconds
+    'CHANNEL': os.getenv('AUTH_TOKEN_CACHE_CHANNEL') or 'Authorization/invalidate',
+}
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-seen-posts': {
+        'task': 'post.task.celery_flush_seen_posts',
+        'schedule': SEEN_POST_BUFFER['FLUSH_INTERVAL'],
+    },
+    'persist-hashtag-rollups': {
+        'task': 'core.task.celery_persist_hashtag_rollups',
+        'schedule': HASHTAG_TRENDS['ROLLUP_INTERVAL'],
+    },
+    'categorize-pending-posts': {
+        'task': 'post.task.celery_categorize_pending_posts',
+        'schedule': POST_CATEGORIZATION['INTERVAL'],
+    },
+}
@@ -0,0 +1,101 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from NeighborsHub.redis_management import SnowflakeNodeRedis
+
+logger = logging.getLogger(__name__)
+
+
+class SnowflakeGenerator:
+    """
+    Time ordered 64 bit ids: the milliseconds since `epoch`, then the node (worker) id, then a sequence number within
+    the millisecond. Ids of one generator strictly increase, the clock going back is ignored and a millisecond whose
+    sequence is exhausted borrows the next one.
+    """
+
+    def __init__(self, node_id: int, node_bits: int = 10, sequence_bits: int = 12, epoch: int = 1704067200000,
+                 clock=time.time):
+        if not 0 <= node_id < 1 << node_bits:
+            raise ValueError(f'Node id {node_id} does not fit in {node_bits} bits')
+        self.node_id = node_id
+        self.node_bits = node_bits
+        self.sequence_bits = sequence_bits
+        self.timestamp_shift = node_bits + sequence_bits
+        self.max_sequence = (1 << sequence_bits) - 1
+        self.epoch = epoch
+        self.clock = clock
+        self.last_timestamp = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self.lock:
+            timestamp = max(int(self.clock() * 1000) - self.epoch, self.last_timestamp)
+            if timestamp == self.last_timestamp:
+                self.sequence = (self.sequence + 1) & self.max_sequence
+                if self.sequence == 0:
+                    timestamp += 1
+            else:
+                self.sequence = 0
+            self.last_timestamp = timestamp
+            return timestamp << self.timestamp_shift | self.node_id << self.sequence_bits | self.sequence
+
+    def set_node_id(self, node_id: int) -> None:
+        if not 0 <= node_id < 1 << self.node_bits:
+            raise ValueError(f'Node id {node_id} does not fit in {self.node_bits} bits')
+        with self.lock:
+            self.node_id = node_id
+
+    def datetime_of(self, snowflake_id: int) -> datetime.datetime:
+        milliseconds = (snowflake_id >> self.timestamp_shift) + self.epoch
+        return datetime.datetime.fromtimestamp(milliseconds / 1000, tz=datetime.timezone.utc)
+
+
+def keep_node_leased(generator: SnowflakeGenerator, leases: SnowflakeNodeRedis, owner: str) -> None:
+    """Renew the lease of the generator's node id for good, a lease that was lost is replaced by a new one."""
+    while True:
+        time.sleep(leases.ttl / 3)
+        try:
+            if not leases.renew(generator.node_id, owner):
+                logger.error('The lease of snowflake node id %s expired, leasing another one', generator.node_id)
+                generator.set_node_id(leases.lease(generator.node_bits, owner))
+        except Exception:
+            logger.exception('Could not renew the lease of snowflake node id %s', generator.node_id)
+
+
+_generator = None
+_generator_pid = None
+_generator_lock = threading.Lock()
+
+
+def get_snowflake_generator() -> SnowflakeGenerator:
+    """
+    The generator of this process, a forked child gets its own node id and sequence. Without SNOWFLAKE_NODE_ID the
+    node id is leased from Redis and renewed by a daemon thread, so live processes do not share one. The lease is a
+    blocking call, processes serving an event loop create the generator at startup.
+    """
+    global _generator, _generator_pid
+    if _generator is None or _generator_pid != os.getpid():
+        with _generator_lock:
+            if _generator is None or _generator_pid != os.getpid():
+                node_id, leases = settings.SNOWFLAKE['NODE_ID'], None
+                if node_id is None:
+                    leases, owner = SnowflakeNodeRedis(), f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'
+                    node_id = leases.lease(settings.SNOWFLAKE['NODE_BITS'], owner)
+                _generator = SnowflakeGenerator(node_id, settings.SNOWFLAKE['NODE_BITS'],
+                                                settings.SNOWFLAKE['SEQUENCE_BITS'], settings.SNOWFLAKE['EPOCH'])
+                _generator_pid = os.getpid()
+                if leases is not None:
+                    threading.Thread(target=keep_node_leased, args=(_generator, leases, owner), daemon=True).start()
+    return _generator
+
+
+def next_snowflake_id() -> int:
+    return get_snowflake_generator().next_id()
@@ -0,0 +1,159 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from redis import RedisError
+
+from NeighborsHub.redis_management import AuthenticationTokenRedis
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """
+    LRU cache of validated access tokens and the user they belong to. An entry lives `ttl` seconds at most (and
+    never past the token's own expiry), a copy of the cached user is handed out so requests do not share state.
+
+    `version` is bumped by every invalidation, a token validated before an invalidation is not cached: pass the
+    `version` read before validating to `set`.
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # token -> (expires_at, user)
+        self.user_tokens = {}  # user id -> tokens
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, token: str):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= self.clock():
+                self._remove(token)
+                return None
+            self.entries.move_to_end(token)
+        return copy.copy(user)
+
+    def set(self, token: str, user, token_expires_at: float = None, version: int = None) -> None:
+        expires_at = self.clock() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self.lock:
+            if version is not None and version != self.version:
+                return
+            self._remove(token)
+            self.entries[token] = (expires_at, copy.copy(user))
+            self.user_tokens.setdefault(user.id, set()).add(token)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_token(self, token: str) -> None:
+        with self.lock:
+            self.version += 1
+            self._remove(token)
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self.lock:
+            self.version += 1
+            for token in list(self.user_tokens.get(user_id, ())):
+                self._remove(token)
+
+    def invalidate(self, message: str) -> None:
+        """Apply a `token:<token>` or `user:<user_id>` invalidation message."""
+        kind, _, value = message.partition(':')
+        if kind == 'token':
+            self.invalidate_token(value)
+        elif kind == 'user':
+            self.invalidate_user(int(value))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+            self.user_tokens.clear()
+
+    def _remove(self, token: str) -> None:
+        entry = self.entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        tokens = self.user_tokens.get(user_id)
+        tokens.discard(token)
+        if not tokens:
+            del self.user_tokens[user_id]
+
+
+class TokenCacheInvalidationListener(threading.Thread):
+    """
+    Applies the invalidations published on the Redis channel to the process cache. The cache is only served while
+    subscribed: messages published while the subscription is down are lost, so the cache is emptied and bypassed
+    until the listener is back.
+    """
+    retry_interval = 5  # seconds
+    poll_interval = 1  # seconds, shorter than the socket timeout of the pooled connection
+
+    def __init__(self, cache: TokenCache):
+        super().__init__(name='token-cache-invalidation', daemon=True)
+        self.cache = cache
+        self.listening = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                pubsub = AuthenticationTokenRedis().subscribe_invalidations()
+                self.cache.clear()
+                self.listening.set()
+                while True:
+                    message = pubsub.get_message(timeout=self.poll_interval)
+                    if message is not None:
+                        self.cache.invalidate(message['data'].decode())
+            except RedisError as exc:
+                logger.warning('Token cache invalidations are unavailable, bypassing the cache: %s', exc)
+            self.listening.clear()
+            self.cache.clear()
+            time.sleep(self.retry_interval)
+
+
+_token_cache = None
+_token_cache_listener = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache() -> TokenCache | None:
+    """The process token cache, `None` while it is disabled or not subscribed to invalidations."""
+    global _token_cache, _token_cache_listener
+    if not settings.AUTH_TOKEN_CACHE['ENABLED']:
+        return None
+    if _token_cache_listener is None:
+        with _token_cache_lock:
+            if _token_cache_listener is None:
+                _token_cache = TokenCache(settings.AUTH_TOKEN_CACHE['MAX_SIZE'], settings.AUTH_TOKEN_CACHE['TTL'])
+                _token_cache_listener = TokenCacheInvalidationListener(_token_cache)
+                _token_cache_listener.start()
+    return _token_cache if _token_cache_listener.listening.is_set() else None
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop the cached tokens of the user in this process and in every other one."""
+    if _token_cache is not None:
+        _token_cache.invalidate_user(user_id)
+    try:
+        AuthenticationTokenRedis().publish_invalidation(f"user:{user_id}")
+    except RedisError as exc:
+        logger.warning('Could not publish the invalidation of user %s: %s', user_id, exc)
+
+
+def invalidate_cached_token(token: str) -> None:
+    if _token_cache is not None:
+        _token_cache.invalidate_token(token)
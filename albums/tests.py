@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from rest_framework.reverse import reverse
@@ -6,6 +8,7 @@ from rest_framework import status
 
 from NeighborsHub.test_function import test_object_attributes_existence
 from albums.models import Media, UserAvatar
+from albums.views import MyListGalleryAPI
 from users.tests import _create_user
 from rest_framework.test import APIClient
 
@@ -56,6 +59,24 @@ class TestMyListMedias(TestCase):
         self.assertIn('id', response_json['data']['medias']['results'][0]['post'])
         self.assertIn('title', response_json['data']['medias']['results'][0]['post'])
         self.assertIn('body', response_json['data']['medias']['results'][0]['post'])
+        self.assertEqual(12, response_json['data']['medias']['count'])
+        self.assertEqual('exact', response_json['data']['medias']['count_precision'])
+
+    def test_count_is_capped(self):
+        self.client.force_authenticate(self.user)
+        with patch.object(MyListGalleryAPI, 'count_cap', 5):
+            response = self.client.get(reverse('media_mylist'), data={'limit': 10})
+        medias = response.json()['data']['medias']
+        self.assertEqual(5, medias['count'])
+        self.assertEqual('capped', medias['count_precision'])
+        self.assertEqual(10, len(medias['results']))
+        self.assertIsNotNone(medias['next'])
+
+        with patch.object(MyListGalleryAPI, 'count_cap', 5):
+            response = self.client.get(reverse('media_mylist'), data={'limit': 10, 'offset': 10})
+        medias = response.json()['data']['medias']
+        self.assertEqual(2, len(medias['results']))
+        self.assertIsNone(medias['next'])
 
 
 class TestUserListMedias(TestCase):
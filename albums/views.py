@@ -2,6 +2,7 @@ from django.shortcuts import render
 from rest_framework import generics
 
 from NeighborsHub.custom_view_mixin import ExpressiveListModelMixin, ExpressiveCreateModelMixin
+from NeighborsHub.pagination import ApproximateCountPagination
 from NeighborsHub.permission import CustomAuthentication, CustomAuthenticationWithoutEffect
 from albums.models import Media, UserAvatar
 from albums.serializers import MyListMediaSerializer, UserListMediaSerializer, UserAvatarSerializer
@@ -10,6 +11,8 @@ from albums.serializers import MyListMediaSerializer, UserListMediaSerializer, U
 class MyListGalleryAPI(ExpressiveListModelMixin, generics.ListAPIView):
     authentication_classes = (CustomAuthentication,)
     serializer_class = MyListMediaSerializer
+    pagination_class = ApproximateCountPagination
+    count_precision = 'capped'
     plural_name = 'medias'
 
     def get_queryset(self):
@@ -1,101 +1,142 @@
+import asyncio
 import json
+import logging
+import uuid
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.utils import timezone
+from .message_writer import get_message_writer
 from .models import ChatRoom, ChatMessage
-from users.models import CustomerUser, OnlineUser
+from .presence import Presence, get_contact_ids, personal_group
+from users.models import CustomerUser
+
+logger = logging.getLogger(__name__)
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     user = None
     room_id = None
     user_rooms = None
+    presence = None
+    heartbeat_task = None
+    sender = None
 
     @staticmethod
     def get_user(user_id):
         return CustomerUser.objects.get(id=user_id)
 
     @staticmethod
-    def get_online_users():
-        online_users = OnlineUser.objects.all()
-        return [onlineUser.user.id for onlineUser in online_users]
-
-    @staticmethod
-    def add_online_user(user):
+    def get_chat_room(room_id, user):
         try:
-            OnlineUser.objects.create(user=user)
-        except:
-            pass
+            return ChatRoom.objects.get(room_id=room_id, member=user)
+        except ChatRoom.DoesNotExist:
+            return None
+
+    def get_sender(self):
+        """Name and avatar of the connected user, sent along every message of the connection."""
+        user_avatar = self.user.get_avatar()
+        return {
+            'user_image': {
+                'thumbnail': user_avatar.avatar_thumbnail.url if user_avatar else None,
+            },
+            'user_name': f'{self.user.first_name or ""} {self.user.last_name or ""}',
+        }
 
     @staticmethod
-    def delete_online_user(user):
+    def get_client_id(value):
         try:
-            OnlineUser.objects.get(user=user).delete()
-        except:
-            pass
+            return uuid.UUID(str(value)) if value is not None else uuid.uuid4()
+        except ValueError:
+            return uuid.uuid4()
 
     @staticmethod
-    def get_chat_room(room_id, user):
-        try:
-            return ChatRoom.objects.get(room_id=room_id, member=user)
-        except ChatRoom.DoesNotExist:
+    def get_reference_id(value):
+        """A reply or post id sent by the client, ValueError when it cannot be one."""
+        if value is None:
             return None
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f'{value!r} is not an id')
+        value = int(value)
+        if not 0 < value < 1 << 63:
+            raise ValueError(f'{value} is out of range')
+        return value
 
-    def save_message(self, message, chat_obj, reply_to, post_id):
+    def save_message(self, message, chat_obj, reply_to, post_id, client_id):
+        """
+        Hand the message to the write-behind writer, the payload to broadcast right away or None when the message is
+        invalid or refused. The database would reject an invalid message only after it was broadcast.
+        """
+        if not isinstance(message, str) or len(message) > ChatMessage._meta.get_field('message').max_length:
+            return None
+        try:
+            reply_to, post_id = self.get_reference_id(reply_to), self.get_reference_id(post_id)
+        except ValueError:
+            return None
         user_obj = self.user
-        chat_message_obj = ChatMessage.objects.create(
-            chat=chat_obj, user=user_obj, message=message, reply_to_id=reply_to, post_id=post_id
+        chat_message_obj = ChatMessage(
+            chat=chat_obj, user=user_obj, message=message, reply_to_id=reply_to, post_id=post_id,
+            client_id=client_id, created_at=timezone.now()
         )
-        user_avatar = self.user.get_avatar()
+        if not get_message_writer().enqueue(chat_message_obj):
+            return None
         return {
-            'id': chat_message_obj.id,
+            'id': str(chat_message_obj.id),
+            'client_id': str(chat_message_obj.client_id),
             'action': 'message',
-            'reply_id': reply_to,
+            'reply_id': str(reply_to) if reply_to is not None else None,
             'post_id': post_id,
             'user': user_obj.id,
             'room_id': chat_obj.room_id,
             'message': message,
-            'user_image': {
-                'thumbnail': user_avatar.avatar_thumbnail.url if user_avatar else None,
-            },
-            'user_name': user_obj.first_name + " " + user_obj.last_name,
+            **self.sender,
             'created_at': str(chat_message_obj.created_at)
         }
 
-    async def send_online_user_list(self):
-        online_user_list = await database_sync_to_async(self.get_online_users)()
-        chat_messages = {
-            'type': 'chat_message',
-            'message': {
-                'action': 'onlineUser',
-                'user_list': online_user_list
-            }
-        }
-        await self.channel_layer.group_send('onlineUser', chat_messages)
+    async def send_online_user_list(self, online_user_list):
+        await self.send(text_data=json.dumps({'action': 'onlineUser', 'user_list': online_user_list}))
+
+    async def send_heartbeats(self):
+        while True:
+            await asyncio.sleep(self.presence.heartbeat_interval)
+            try:
+                await self.presence.heartbeat()
+            except Exception:
+                # the next heartbeat renews the connection before its ttl runs out
+                logger.exception('Presence heartbeat of user %s failed', self.user.id)
 
     async def connect(self):
         self.user_id = self.scope['url_route']['kwargs']['user_id']
         if int(self.user_id) != self.scope.get('user').id:
             await self.close(403, reason='You are not authorized.')
-        self.user_rooms = await database_sync_to_async(
+            return
+        # room_id -> ChatRoom of the rooms this connection joined, kept in sync by `membership_changed` events
+        self.user_rooms = {room.room_id: room for room in await database_sync_to_async(
             list
-        )(ChatRoom.objects.filter(member=self.user_id))
-        for room in self.user_rooms:
+        )(ChatRoom.objects.filter(member=self.user_id))}
+        for room_id in self.user_rooms:
             await self.channel_layer.group_add(
-                room.room_id,
+                room_id,
                 self.channel_name
             )
-        await self.channel_layer.group_add('onlineUser', self.channel_name)
         self.user = self.scope.get('user')
-        await database_sync_to_async(self.add_online_user)(self.user)
-        await self.send_online_user_list()
+        self.sender = await database_sync_to_async(self.get_sender)()
+        await self.channel_layer.group_add(personal_group(self.user.id), self.channel_name)
         await self.accept()
+        contact_ids = await database_sync_to_async(get_contact_ids)(self.user.id)
+        self.presence = Presence(self.channel_layer, self.user.id, self.channel_name, contact_ids)
+        await self.send_online_user_list(await self.presence.connect())
+        self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
 
     async def disconnect(self, close_code):
-        await database_sync_to_async(self.delete_online_user)(self.user)
-        await self.send_online_user_list()
-        for room in self.user_rooms:
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        if self.presence is not None:
+            await self.presence.disconnect()
+        if self.user is not None:
+            await self.channel_layer.group_discard(personal_group(self.user.id), self.channel_name)
+        for room_id in self.user_rooms or {}:
             await self.channel_layer.group_discard(
-                room.room_id,
+                room_id,
                 self.channel_name
             )
 
@@ -103,7 +144,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         text_data_json = json.loads(text_data)
         action = text_data_json['action']
         room_id = text_data_json['room_id']
-        chat_obj = await database_sync_to_async(self.get_chat_room)(room_id, self.user)
+        chat_obj = self.user_rooms.get(room_id)
         if chat_obj is None:
             return {'error': 'Room not found'}
         chat_message = {}
@@ -111,9 +152,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             message = text_data_json['message']
             reply_to_id = text_data_json.get('reply_id')
             post_id = text_data_json.get('post_id')
-            chat_message = await database_sync_to_async(
-                self.save_message
-            )(message, chat_obj, reply_to_id, post_id)
+            client_id = self.get_client_id(text_data_json.get('client_id'))
+            chat_message = self.save_message(message, chat_obj, reply_to_id, post_id, client_id)
+            if chat_message is None:
+                # invalid or the writer is backed up, only the sender learns the message was not sent
+                await self.send(text_data=json.dumps(
+                    {'action': 'message_failed', 'room_id': room_id, 'id': None, 'client_id': str(client_id)}))
+                return
         elif action == 'typing':
             chat_message = text_data_json
         await self.channel_layer.group_send(
@@ -130,3 +175,22 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def chat_message(self, event):
         message = event['message']
         await self.send(text_data=json.dumps(message))
+
+    async def membership_changed(self, event):
+        room_id = event['room_id']
+        if event['joined'] and room_id not in self.user_rooms:
+            room = await database_sync_to_async(self.get_chat_room)(room_id, self.user)
+            if room is None:
+                return
+            self.user_rooms[room_id] = room
+            await self.channel_layer.group_add(room_id, self.channel_name)
+        elif not event['joined'] and self.user_rooms.pop(room_id, None) is not None:
+            await self.channel_layer.group_discard(room_id, self.channel_name)
+        else:
+            return
+        await self.contacts_changed(event)
+
+    async def contacts_changed(self, event):
+        """A member joined or left one of the user's rooms, presence deltas go to the new contacts."""
+        if self.presence is not None:
+            self.presence.contact_ids = await database_sync_to_async(get_contact_ids)(self.user.id)
@@ -0,0 +1,101 @@
+import asyncio
+import multiprocessing
+import statistics
+import time
+import uuid
+
+import django
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import InMemoryChannelLayer, channel_layers
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def receive_all(layer, channel, messages, timeout):
+    latencies, lost = [], 0
+    for _ in range(messages):
+        try:
+            message = await asyncio.wait_for(layer.receive(channel), timeout)
+        except asyncio.TimeoutError:
+            lost += 1
+            continue
+        latencies.append(time.time() - message['sent_at'])
+    return latencies, lost
+
+
+def run_members(group, members, messages, timeout, ready, results):
+    """A consumer process: `members` channels join `group` and wait for the `messages` the load test sends."""
+    django.setup()
+
+    async def main():
+        layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+        channels = [await layer.new_channel() for _ in range(members)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+        ready.put(members)
+        received = await asyncio.gather(*(receive_all(layer, channel, messages, timeout) for channel in channels))
+        for channel in channels:
+            await layer.group_discard(group, channel)
+        return [latency for latencies, _ in received for latency in latencies], sum(lost for _, lost in received)
+
+    results.put(asyncio.run(main()))
+
+
+class Command(BaseCommand):
+    help = ('Spread the members of a websocket group over several consumer processes on the configured channel '
+            'layer, send messages to the group and report the fan-out latency to every member. Run it against a '
+            'local Redis with CHANNEL_LAYER_BACKEND=pubsub or core.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group-sizes', default='2,50,500')
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--messages', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=0.05, help='seconds between two group sends')
+        parser.add_argument('--timeout', type=float, default=10, help='seconds a member waits for a message')
+
+    def handle(self, *args, **options):
+        if isinstance(channel_layers.make_backend(DEFAULT_CHANNEL_LAYER), InMemoryChannelLayer):
+            raise CommandError('The in-memory channel layer does not span processes, set CHANNEL_LAYER_BACKEND.')
+        context = multiprocessing.get_context('spawn')
+        for size in (int(size) for size in options['group_sizes'].split(',')):
+            self.run_group(context, size, options)
+
+    def run_group(self, context, size, options):
+        group = f'loadtest.{uuid.uuid4().hex}'
+        processes = min(options['processes'], size)
+        ready, results = context.Queue(), context.Queue()
+        workers = [
+            context.Process(target=run_members, args=(group, members, options['messages'], options['timeout'],
+                                                      ready, results))
+            for members in (size // processes + (index < size % processes) for index in range(processes))
+        ]
+        for worker in workers:
+            worker.start()
+        joined = sum(ready.get(timeout=60) for _ in workers)
+
+        async def send():
+            layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+            for index in range(options['messages']):
+                await layer.group_send(group, {'type': 'loadtest.message', 'index': index, 'sent_at': time.time()})
+                await asyncio.sleep(options['interval'])
+
+        asyncio.run(send())
+        latencies, lost = [], 0
+        for _ in workers:
+            worker_latencies, worker_lost = results.get()
+            latencies.extend(worker_latencies)
+            lost += worker_lost
+        for worker in workers:
+            worker.join()
+        self.report(size, joined, processes, options['messages'], sorted(latencies), lost)
+
+    def report(self, size, joined, processes, messages, latencies, lost):
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'group of {size}: no message delivered'))
+            return
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f'group of {size:>4} ({joined} members in {processes} processes): '
+            f'{len(latencies)}/{joined * messages} delivered, {lost} lost, '
+            f'p50 {statistics.median(latencies) * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, '
+            f'max {latencies[-1] * 1000:.2f} ms'
+        )
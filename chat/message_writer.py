@@ -0,0 +1,156 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DataError, DatabaseError, IntegrityError, transaction
+
+from chat.models import ChatMessage, ChatRoom, ChatRoomUserState
+from chat.utils import notify_messages_dropped, notify_unread_counts
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageWriter:
+    """
+    Write-behind buffer of the chat messages consumers already broadcast. Messages are written with one
+    `bulk_create` as soon as `batch_size` are pending or after `flush_interval` seconds. A batch the database
+    refuses is put back and retried, while `max_pending` messages wait new ones are refused, and what is still pending
+    when the process exits is written by an atexit hook. The rooms are told about every message that is not written.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wakeup = None
+        self.task = None
+
+    def enqueue(self, message: ChatMessage) -> bool:
+        """Buffer the message, False when `max_pending` messages already wait. Must be called from the event loop."""
+        with self.lock:
+            accepted = len(self.pending) < self.max_pending
+            if accepted:
+                self.pending.append(message)
+            full = len(self.pending) >= self.batch_size
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        if full:
+            self.wakeup.set()
+        return accepted
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await database_sync_to_async(self.flush)()
+            except Exception:
+                # the messages stay pending for the next round
+                logger.exception('Flushing chat messages failed')
+
+    def take(self) -> list[ChatMessage]:
+        with self.lock:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+        return batch
+
+    def flush(self) -> int:
+        """Write the pending messages, the number written."""
+        written = 0
+        while batch := self.take():
+            try:
+                self.write(batch)
+            except DatabaseError as exc:
+                logger.warning('Could not write %s chat messages, retrying: %s', len(batch), exc)
+                self.put_back(batch)
+                break
+            except BaseException:
+                # a batch that was taken is never lost, whatever failed
+                self.put_back(batch)
+                raise
+            written += len(batch)
+        return written
+
+    def put_back(self, batch: list[ChatMessage]) -> None:
+        with self.lock:
+            self.pending[:0] = batch
+
+    def close(self) -> None:
+        """Write what is pending at exit, the messages the database still refuses are lost and reported."""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing chat messages at exit failed')
+        with self.lock:
+            lost, self.pending = self.pending, []
+        if lost:
+            logger.error('Lost %s chat messages at exit', len(lost))
+            try:
+                notify_messages_dropped(lost)
+            except Exception:
+                logger.exception('Could not report the lost chat messages')
+
+    def write(self, batch: list[ChatMessage]) -> None:
+        # copies of a resent message in the batch would conflict with each other in one INSERT
+        unique = {}
+        for message in batch:
+            unique.setdefault(message.client_id, message)
+        batch = list(unique.values())
+        try:
+            with transaction.atomic():
+                self.insert(batch)
+                self.update_rooms(batch)
+        except (IntegrityError, DataError, ValueError):
+            # one message replying to a deleted message, sharing a deleted post or not fitting its columns fails the
+            # whole batch
+            inserted, dropped = [], []
+            for message in batch:
+                try:
+                    with transaction.atomic():
+                        self.insert([message])
+                    inserted.append(message)
+                except (IntegrityError, DataError, ValueError) as exc:
+                    logger.warning('Dropping chat message %s: %s', message.client_id, exc)
+                    dropped.append(message)
+            with transaction.atomic():
+                # a dropped message may share its id with a written one
+                self.update_rooms(inserted)
+            notify_messages_dropped(dropped)
+
+    @staticmethod
+    def insert(messages: list[ChatMessage]) -> None:
+        """
+        A resent message conflicts on its client_id and leaves the written row as it is, while an id taken by another
+        message raises rather than dropping this one unnoticed.
+        """
+        ChatMessage.objects.bulk_create(messages, update_conflicts=True, unique_fields=['client_id'],
+                                        update_fields=['client_id'])
+
+    @staticmethod
+    def update_rooms(batch: list[ChatMessage]) -> None:
+        """Last messages and unread counters of the rooms, only for the messages written rather than ignored."""
+        written = ChatMessage.objects.filter(id__in=[message.id for message in batch], chat__isnull=False)
+        written = list(written.values_list('chat_id', 'user_id'))
+        ChatRoom.objects.refresh_last_message({room_id for room_id, _ in written})
+        notify_unread_counts(ChatRoomUserState.objects.record_messages(written))
+
+
+_message_writer = None
+
+
+def get_message_writer() -> ChatMessageWriter:
+    global _message_writer
+    if _message_writer is None:
+        _message_writer = ChatMessageWriter(settings.CHAT_MESSAGE_WRITER['BATCH_SIZE'],
+                                            settings.CHAT_MESSAGE_WRITER['FLUSH_INTERVAL'],
+                                            settings.CHAT_MESSAGE_WRITER['MAX_PENDING'])
+        atexit.register(_message_writer.close)
+    return _message_writer
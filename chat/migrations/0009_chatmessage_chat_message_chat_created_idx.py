@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2024-06-25 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_alter_chatmessage_chat_alter_chatroom_admin_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', '-created_at', '-id'], name='chat_message_chat_created_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2024-06-28 15:04
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chatmessage_chat_message_chat_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='client_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            "UPDATE chat_chatmessage SET client_id = md5(id::text || random()::text)::uuid WHERE client_id IS NULL",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='client_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
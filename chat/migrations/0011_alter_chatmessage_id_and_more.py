@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2024-07-01 11:20
+
+import NeighborsHub.snowflake
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_chatmessage_client_id_alter_chatmessage_created_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='id',
+            field=models.BigIntegerField(default=NeighborsHub.snowflake.next_snowflake_id, editable=False,
+                                         primary_key=True, serialize=False),
+        ),
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chat_message_chat_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', '-id'], name='chat_message_chat_id_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2024-07-03 09:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_alter_chatmessage_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    related_name='+', to='chat.chatmessage'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE chat_chatroom room SET
+                last_message_id = latest.id,
+                last_activity_at = COALESCE(latest.created_at, room.created_at)
+            FROM chat_chatroom target
+            LEFT JOIN LATERAL (
+                SELECT id, created_at FROM chat_chatmessage WHERE chat_id = target.id ORDER BY id DESC LIMIT 1
+            ) latest ON TRUE
+            WHERE target.id = room.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2024-07-05 14:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0012_chatroom_last_activity_at_chatroom_last_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatRoomUserState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_read_message', models.ForeignKey(blank=True, null=True,
+                                                        on_delete=django.db.models.deletion.SET_NULL,
+                                                        related_name='+', to='chat.chatmessage')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_states',
+                                           to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                           related_name='chat_room_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'room')},
+            },
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO chat_chatroomuserstate (user_id, room_id, last_read_message_id, unread_count)
+            SELECT member.customeruser_id, member.chatroom_id, seen.last_read_message_id, (
+                SELECT count(*) FROM chat_chatmessage message
+                WHERE message.chat_id = member.chatroom_id
+                  AND message.id > COALESCE(seen.last_read_message_id, 0)
+                  AND message.user_id IS DISTINCT FROM member.customeruser_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM chat_chatmessage_deleted_by deleted
+                      WHERE deleted.chatmessage_id = message.id AND deleted.customeruser_id = member.customeruser_id
+                  )
+            )
+            FROM chat_chatroom_member member
+            LEFT JOIN LATERAL (
+                SELECT max(seen.message_id) AS last_read_message_id
+                FROM chat_userseenmessage seen JOIN chat_chatmessage message ON message.id = seen.message_id
+                WHERE seen.user_id = member.customeruser_id AND message.chat_id = member.chatroom_id
+            ) seen ON TRUE
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
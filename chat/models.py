@@ -1,11 +1,50 @@
-from django.db import models
+import uuid
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Prefetch, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from albums.models import UserAvatar
 from users.models import CustomerUser
 from shortuuidfield import ShortUUIDField
 from django.utils.translation import gettext as _
 
+from NeighborsHub.snowflake import next_snowflake_id
+
 
 # Create your models here.
 
+class ChatRoomManager(models.Manager):
+    def refresh_last_message(self, room_ids):
+        """Point the rooms at their newest message with one UPDATE, rooms without messages keep their activity."""
+        latest = ChatMessage.objects.filter(chat=OuterRef('pk')).order_by('-id')
+        return self.filter(id__in=room_ids).update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_activity_at=Case(When(Exists(latest), then=Subquery(latest.values('created_at')[:1])),
+                                  default=F('last_activity_at')),
+        )
+
+    def inbox(self, user):
+        """
+        Rooms of the user by recent activity with the other members and their avatars prefetched. The id of the last
+        message the user sees is annotated as `last_visible_message_id`, it is only searched for in the rooms whose
+        last message the user deleted for themselves, and the user's `unread_count` is annotated too.
+        """
+        deleted_for_user = ChatMessage.deleted_by.through.objects.filter(
+            chatmessage_id=OuterRef('last_message_id'), customeruser_id=user.id)
+        latest_visible = ChatMessage.objects.filter(chat=OuterRef('pk')).exclude(deleted_by=user).order_by('-id')
+        unread_count = ChatRoomUserState.objects.filter(room=OuterRef('pk'), user=user)
+        counterparts = CustomerUser.objects.exclude(id=user.id).order_by('id').prefetch_related(
+            Prefetch('avatar', queryset=UserAvatar.objects.order_by('id')))
+        return self.filter(member=user).annotate(
+            last_visible_message_id=Case(When(Exists(deleted_for_user), then=Subquery(latest_visible.values('id')[:1])),
+                                         default=F('last_message_id'), output_field=models.BigIntegerField()),
+            unread_count=Coalesce(Subquery(unread_count.values('unread_count')[:1]), 0),
+        ).prefetch_related(Prefetch('member', queryset=counterparts, to_attr='counterparts')).order_by(
+            '-last_activity_at', '-id')
+
+
 class ChatRoom(models.Model):
     CHAT_ROOM_CHOICES = (
         ('direct', 'Direct Chat'),
@@ -19,18 +58,29 @@ class ChatRoom(models.Model):
     admin = models.ManyToManyField(CustomerUser, related_name='admins', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # denormalized for the inbox, kept up to date by `ChatRoomManager.refresh_last_message`
+    last_message = models.ForeignKey('ChatMessage', on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
+    objects = ChatRoomManager()
 
     def __str__(self):
         return self.room_id + ' -> ' + str(self.name)
 
 
 class ChatMessage(models.Model):
+    # time ordered, assigned when the message is sent so it is broadcast with its id before it is written
+    id = models.BigIntegerField(primary_key=True, default=next_snowflake_id, editable=False)
     chat = models.ForeignKey(ChatRoom, on_delete=models.SET_NULL, null=True, related_name='messages',)
     user = models.ForeignKey(CustomerUser, on_delete=models.SET_NULL, null=True)
     message = models.CharField(max_length=255)
     reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True)
     post = models.ForeignKey('post.Post', on_delete=models.SET_NULL, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # generated by the sender (or the consumer) so a message is known before it is written, resends are ignored
+    client_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # set when the message is sent rather than when the write-behind buffer writes it
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
 
     deleted_by = models.ManyToManyField(CustomerUser, related_name='deleted_by', blank=True)
@@ -38,6 +88,19 @@ class ChatMessage(models.Model):
     seen = models.ManyToManyField(CustomerUser, through='UserSeenMessage',
                                   related_name='user_seen_messages', blank=True)
 
+    class Meta:
+        indexes = [
+            # room history is read newest first and paged by id
+            models.Index(fields=['chat', '-id'], name='chat_message_chat_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding and self.chat_id is not None:
+            ChatRoom.objects.refresh_last_message([self.chat_id])
+            ChatRoomUserState.objects.record_messages([(self.chat_id, self.user_id)])
+
     def __str__(self):
         return self.message
 
@@ -50,3 +113,72 @@ class UserSeenMessage(models.Model):
 
     class Meta:
         unique_together = ('user', 'message')
+
+
+class ChatRoomUserStateManager(models.Manager):
+    def record_messages(self, messages):
+        """
+        Count written messages, `(room_id, sender_id)` pairs, as unread for the other members of their rooms, the
+        states with unread messages of those rooms. Missing states are created, one UPDATE runs per room and sender.
+        """
+        messages = Counter(messages)
+        room_ids = {room_id for room_id, _ in messages}
+        if not room_ids:
+            return []
+        members = ChatRoom.member.through.objects.filter(chatroom_id__in=room_ids).values_list(
+            'chatroom_id', 'customeruser_id')
+        existing = set(self.filter(room_id__in=room_ids).values_list('room_id', 'user_id'))
+        self.bulk_create([self.model(room_id=room_id, user_id=user_id) for room_id, user_id in members
+                          if (room_id, user_id) not in existing], ignore_conflicts=True)
+        for (room_id, sender_id), count in messages.items():
+            self.filter(room_id=room_id).exclude(user_id=sender_id).update(unread_count=F('unread_count') + count)
+        return list(self.filter(room_id__in=room_ids, unread_count__gt=0).select_related('room'))
+
+    def mark_read(self, user_id, room_id, message_id):
+        """
+        Move the user's read pointer of the room up to `message_id` and recount the messages of others after it, the
+        updated state. The state stays locked while counting, a flush counting new messages waits and adds to the
+        recount instead of being overwritten by it.
+        """
+        self.get_or_create(user_id=user_id, room_id=room_id)
+        with transaction.atomic():
+            state = self.select_related('room').select_for_update(of=('self',)).get(user_id=user_id, room_id=room_id)
+            if state.last_read_message_id is None or state.last_read_message_id < message_id:
+                state.last_read_message_id = message_id
+            unread = ChatMessage.objects.filter(chat_id=room_id, id__gt=state.last_read_message_id)
+            state.unread_count = unread.exclude(user_id=user_id).exclude(deleted_by=user_id).count()
+            state.save(update_fields=['last_read_message', 'unread_count'])
+        return state
+
+    def recount(self, room_id, user_ids=None):
+        """
+        Recount the unread messages of the room's members, or of `user_ids`, with one UPDATE after messages were
+        deleted, the updated states. Like `mark_read` the states stay locked while counting.
+        """
+        states = self.filter(room_id=room_id)
+        if user_ids is not None:
+            states = states.filter(user_id__in=user_ids)
+        deleted = ChatMessage.deleted_by.through.objects.filter(chatmessage_id=OuterRef('id'),
+                                                                customeruser_id=OuterRef(OuterRef('user_id')))
+        unread = ChatMessage.objects.filter(
+            chat_id=room_id, id__gt=Coalesce(OuterRef('last_read_message_id'), Value(0))
+        ).exclude(user_id=OuterRef('user_id')).exclude(Exists(deleted))
+        unread = unread.order_by().values('chat_id').annotate(count=Count('id')).values('count')
+        with transaction.atomic():
+            list(states.select_for_update().order_by('id').values_list('id', flat=True))
+            states.update(unread_count=Coalesce(Subquery(unread), Value(0)))
+        return list(states.select_related('room'))
+
+
+class ChatRoomUserState(models.Model):
+    """Unread counter and read pointer of a member of a room, what the inbox badges are rendered from."""
+    user = models.ForeignKey(CustomerUser, on_delete=models.CASCADE, related_name='chat_room_states')
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='user_states')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_message = models.ForeignKey(ChatMessage, on_delete=models.SET_NULL, null=True, blank=True,
+                                          related_name='+')
+
+    objects = ChatRoomUserStateManager()
+
+    class Meta:
+        unique_together = ('user', 'room')
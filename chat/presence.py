@@ -0,0 +1,50 @@
+from django.conf import settings
+
+from NeighborsHub.redis_management import PresenceRedis
+from chat.models import ChatRoom
+
+
+def personal_group(user_id: int) -> str:
+    """The channel layer group of every websocket connection of the user."""
+    return f'user_{user_id}'
+
+
+def get_contact_ids(user_id: int) -> list[int]:
+    """Users sharing a chat room with the user, the only ones told about their presence."""
+    memberships = ChatRoom.member.through.objects.filter(chatroom__member=user_id).exclude(customeruser_id=user_id)
+    return list(memberships.values_list('customeruser_id', flat=True).distinct())
+
+
+class Presence:
+    """
+    Presence of one websocket connection. The user's contacts that are online get a `presence` delta on their
+    personal group when the user's first connection opens and when the last one closes, the connecting client gets
+    the list of its online contacts once.
+    """
+    heartbeat_interval = settings.PRESENCE['HEARTBEAT_INTERVAL']
+
+    def __init__(self, channel_layer, user_id: int, connection_id: str, contact_ids: list[int], redis=None):
+        self.channel_layer = channel_layer
+        self.user_id = user_id
+        self.connection_id = connection_id
+        self.contact_ids = contact_ids
+        self.redis = redis or PresenceRedis()
+
+    async def connect(self) -> list[int]:
+        """Register the connection, the online contacts of the user."""
+        online_contacts = await self.redis.online(self.contact_ids)
+        if await self.redis.connect(self.user_id, self.connection_id) == 1:
+            await self.announce(online_contacts, online=True)
+        return sorted(online_contacts)
+
+    async def heartbeat(self) -> None:
+        await self.redis.connect(self.user_id, self.connection_id)
+
+    async def disconnect(self) -> None:
+        if await self.redis.disconnect(self.user_id, self.connection_id) == 0:
+            await self.announce(await self.redis.online(self.contact_ids), online=False)
+
+    async def announce(self, contact_ids, online: bool) -> None:
+        message = {'type': 'chat_message', 'message': {'action': 'presence', 'user': self.user_id, 'online': online}}
+        for contact_id in contact_ids:
+            await self.channel_layer.group_send(personal_group(contact_id), message)
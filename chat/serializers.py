@@ -91,6 +91,9 @@ class UserSeenMessageSerializer(serializers.ModelSerializer):
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
+    # snowflake ids do not fit in the doubles JavaScript parses JSON numbers to
+    id = serializers.CharField(read_only=True)
+    reply_to = serializers.CharField(source='reply_to_id', read_only=True)
     user_name = serializers.SerializerMethodField()
     user_avatar = serializers.ImageField(source='user.avatar')
     is_seen = serializers.SerializerMethodField()
@@ -101,6 +104,8 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_is_seen(obj):
+        if 'seen' in getattr(obj, '_prefetched_objects_cache', {}):
+            return bool(obj.seen.all())
         return obj.seen.exists()
 
     @staticmethod
@@ -127,26 +132,44 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     type = serializers.ChoiceField(required=True, choices=ChatRoom.CHAT_ROOM_CHOICES)
     members = serializers.ListField(write_only=True, min_length=1)
     last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
     name = serializers.SerializerMethodField('get_name')
     avatar = serializers.SerializerMethodField('get_avatar')
 
+    def get_counterpart(self, obj):
+        # rooms of `ChatRoom.objects.inbox` come with the other members prefetched
+        if hasattr(obj, 'counterparts'):
+            return obj.counterparts[-1] if obj.counterparts else None
+        return obj.member.all().exclude(id=self.context['request'].user.id).last()
+
     def get_name(self, obj):
         if obj.type == 'direct':
-            member = obj.member.all().exclude(id=self.context['request'].user.id).last()
+            member = self.get_counterpart(obj)
             return f'{member.first_name} {member.last_name}'
         return obj.name
 
     def get_avatar(self, obj):
         if obj.type == 'direct':
-            member = obj.member.all().exclude(id=self.context['request'].user.id).last()
+            member = self.get_counterpart(obj)
             qs = member.get_avatar()
             return UserAvatarSerializer(instance=qs, many=False, context=self.context).data
         return ''
 
     def get_last_message(self, obj):
-        message = obj.messages.order_by('-id').exclude(deleted_by=self.context['request'].user).first()
+        # set by `ChatRoomView.attach_last_messages`
+        if hasattr(obj, 'last_visible_message'):
+            message = obj.last_visible_message
+        else:
+            message = obj.messages.order_by('-id').exclude(deleted_by=self.context['request'].user).first()
         return ChatMessageSerializer(message, many=False, context=self.context).data if message else None
 
+    def get_unread_count(self, obj):
+        # annotated by `ChatRoom.objects.inbox`
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
+        state = obj.user_states.filter(user=self.context['request'].user).first()
+        return state.unread_count if state else 0
+
     def validate(self, attrs):
         if attrs.get('type') == 'direct' and len(attrs.get('members')) > 1:
             raise serializers.ValidationError({'members': 'In direct message can`t be more than one member'})
@@ -174,3 +197,4 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatRoom
         exclude = ['id', 'member', 'admin', ]
+        read_only_fields = ['last_activity_at']
@@ -1,9 +1,29 @@
-from django.test import TestCase
+import asyncio
+import time
+import uuid
+
+from unittest.mock import AsyncMock, Mock, patch
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.db import DatabaseError, IntegrityError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
+from redis.exceptions import RedisError
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
 
+from NeighborsHub.middleware import TokenAuthMiddlewareChannels, WebsocketConnectMetrics, connect_metrics
+from NeighborsHub.redis_management import PresenceRedis, SnowflakeNodeRedis, get_redis_connection
+from NeighborsHub.snowflake import SnowflakeGenerator
 from NeighborsHub.test_function import test_object_attributes_existence
-from chat.models import ChatRoom, ChatMessage, UserSeenMessage
+from chat.consumers import ChatConsumer
+from chat.message_writer import ChatMessageWriter
+from chat.models import ChatRoom, ChatMessage, ChatRoomUserState, UserSeenMessage
+from chat.presence import Presence, get_contact_ids, personal_group
+from chat.utils import notify_membership_changed, notify_unread_counts
+from chat.views import DeleteChatMessagesAPI
 from users.models import CustomerUser
 from users.tests import _create_user
 from rest_framework.test import APIClient
@@ -137,6 +157,48 @@ class TestListUserChatRoom(TestCase):
         self.assertIn('last_message', response_json['data'][0])
         self.assertIsNone(response_json['data'][0]['last_message'])
 
+    def test_last_message_skips_messages_deleted_for_me(self):
+        message = baker.make(ChatMessage, chat=self.ch_1, user=self.dummy_user, message='Bye')
+        message.deleted_by.add(self.user)
+        self.client.force_authenticate(self.user)
+        response_json = self.client.get(reverse('chatRoom'), format='json').json()
+        self.assertEqual(str(self.message.id), response_json['data'][0]['last_message']['id'])
+
+    def test_rooms_ordered_by_last_activity(self):
+        ch_2 = baker.make(ChatRoom, type='group', member=[self.user])
+        self.client.force_authenticate(self.user)
+        response_json = self.client.get(reverse('chatRoom'), format='json').json()
+        self.assertEqual([ch_2.room_id, self.ch_1.room_id], [room['room_id'] for room in response_json['data']])
+
+        message = baker.make(ChatMessage, chat=self.ch_1, user=self.user, message='Hi')
+        self.ch_1.refresh_from_db()
+        self.assertEqual(message, self.ch_1.last_message)
+        self.assertEqual(message.created_at, self.ch_1.last_activity_at)
+        response_json = self.client.get(reverse('chatRoom'), format='json').json()
+        self.assertEqual([self.ch_1.room_id, ch_2.room_id], [room['room_id'] for room in response_json['data']])
+        self.assertEqual('Hi', response_json['data'][0]['last_message']['message'])
+
+    def test_inbox_queries_do_not_grow_with_rooms(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as one_room:
+            self.client.get(reverse('chatRoom'), format='json')
+        for _ in range(3):
+            room = baker.make(ChatRoom, type='direct', member=[self.user, baker.make(CustomerUser)])
+            baker.make(ChatMessage, chat=room, user=self.user, message='Hello')
+        with CaptureQueriesContext(connection) as four_rooms:
+            response = self.client.get(reverse('chatRoom'), format='json')
+        self.assertEqual(4, len(response.json()['data']))
+        self.assertEqual(len(one_room), len(four_rooms))
+
+    def test_deleting_the_last_message_for_all_moves_the_pointer(self):
+        baker.make(ChatMessage, chat=self.ch_1, user=self.user, message='Bye')
+        self.client.force_authenticate(self.user)
+        self.client.delete(reverse('chat_room_leave', kwargs={'room_id': self.ch_1.room_id}),
+                           data={'delete_my_messages_for_all': True, 'delete_all_message_for_me': False},
+                           format='json')
+        self.ch_1.refresh_from_db()
+        self.assertEqual(self.message, self.ch_1.last_message)
+
 
 class TestChatRoomMemberListMessage(TestCase):
     def setUp(self) -> None:
@@ -170,8 +232,10 @@ class TestChatRoomMemberListMessage(TestCase):
             'admins': [{'id': anonymous.id}],
             'delete_admins': [{'id': self.tmp_user.id}]
         }
-        response = self.client.put(reverse('membersList', kwargs={'room_id': self.chat_room.room_id}),
-                                   data=data, format='json')
+        with patch('chat.views.notify_membership_changed') as mock_notify:
+            response = self.client.put(reverse('membersList', kwargs={'room_id': self.chat_room.room_id}),
+                                       data=data, format='json')
+        mock_notify.assert_called_once_with(self.chat_room.room_id, joined_ids={anonymous.id}, left_ids=set())
         response_json = response.json()
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual('ok', response_json['status'])
@@ -241,10 +305,12 @@ class TestLeaveChatRoom(TestCase):
             'delete_my_messages_for_all': True
         }
         self.client.force_authenticate(self.user)
-        response = self.client.delete(reverse('chat_room_leave',
-                                              kwargs={'room_id': self.chat_room.room_id}),
-                                      data=data, format='json')
+        with patch('chat.views.notify_membership_changed') as mock_notify:
+            response = self.client.delete(reverse('chat_room_leave',
+                                                  kwargs={'room_id': self.chat_room.room_id}),
+                                          data=data, format='json')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        mock_notify.assert_called_once_with(self.chat_room.room_id, left_ids=[self.user.id])
         messages = ChatMessage.objects.filter(chat=self.chat_room, deleted_by=self.user)
         self.assertEqual(10, messages.count())
         messages = ChatMessage.objects.filter(chat=self.chat_room)
@@ -343,6 +409,19 @@ class TestListMessages(TestCase):
         self.assertIn('updated_at', response_json['data']['chat_messages']['results'][0])
         self.assertEqual(10, response_json['data']['chat_messages']['count'])
 
+    def test_list_messages_with_cursor(self):
+        self.client.force_authenticate(self.user)
+        messages = baker.make(ChatMessage, chat=self.chat_room, user=self.user, _quantity=5)
+        url = reverse('message_list', kwargs={'room_id': self.chat_room.room_id})
+        response_json = self.client.get(url, data={'paginate': 'cursor', 'limit': 3}).json()
+        self.assertNotIn('count', response_json['data']['chat_messages'])
+        ids = [message['id'] for message in response_json['data']['chat_messages']['results']]
+        response_json = self.client.get(response_json['data']['chat_messages']['next']).json()
+        ids += [message['id'] for message in response_json['data']['chat_messages']['results']]
+        self.assertIsNone(response_json['data']['chat_messages']['next'])
+        self.assertEqual([str(message_id) for message_id in sorted([message.id for message in messages], reverse=True)],
+                         ids)
+
     def test_is_seen_field(self):
         message = baker.make(ChatMessage, chat=self.chat_room, user=self.tmp_user)
         UserSeenMessage.objects.create(user_id=self.user.id, message=message)
@@ -405,3 +484,405 @@ class TestListSeenMessage(TestCase):
         self.assertIn('user_name', response_json['data']['user_seen_messages']['results'][0])
         self.assertIn('user_avatar', response_json['data']['user_seen_messages']['results'][0])
         self.assertIn('created_at', response_json['data']['user_seen_messages']['results'][0])
+
+
+class TestTokenAuthMiddleware(TestCase):
+    def test_get_token(self):
+        scope = {'query_string': b'room=1&token=abc.def%3D'}
+        self.assertEqual('abc.def=', TokenAuthMiddlewareChannels.get_token(scope))
+        self.assertIsNone(TokenAuthMiddlewareChannels.get_token({'query_string': b'token'}))
+
+    def test_rejects_missing_token(self):
+        middleware = TokenAuthMiddlewareChannels(None)
+        rejected = connect_metrics.outcomes['rejected']
+        with self.assertRaises(AuthenticationFailed):
+            async_to_sync(middleware)({'type': 'websocket', 'query_string': b''}, None, None)
+        self.assertEqual(rejected + 1, connect_metrics.outcomes['rejected'])
+
+    def test_connect_metrics(self):
+        now = [0.0]
+        metrics = WebsocketConnectMetrics(clock=lambda: now[0])
+        metrics.record('cached', 0.001)
+        metrics.record('verified', 0.003)
+        now[0] = 61.0
+        metrics.record('rejected', 0.002)
+        snapshot = metrics.snapshot()
+        self.assertEqual(1, snapshot['cached'])
+        self.assertEqual(1, snapshot['rejected'])
+        self.assertAlmostEqual(1 / 60, snapshot['connects_per_second'])
+        self.assertAlmostEqual(2.0, snapshot['mean_auth_ms'])
+        self.assertAlmostEqual(3.0, snapshot['max_auth_ms'])
+
+
+async def _drain(channel_layer, channel):
+    messages = []
+    while True:
+        try:
+            messages.append(await asyncio.wait_for(channel_layer.receive(channel), 0.05))
+        except asyncio.TimeoutError:
+            return messages
+
+
+class TestPresence(TestCase):
+    def setUp(self) -> None:
+        self.user = _create_user()
+        self.contact = baker.make(CustomerUser)
+        self.stranger = baker.make(CustomerUser)
+        baker.make(ChatRoom, member=[self.user, self.contact])
+        self.redis = PresenceRedis(key_prefix='Presence/test')
+        self.channel_layer = InMemoryChannelLayer()
+
+    def tearDown(self) -> None:
+        get_redis_connection().delete(*[self.redis.key(user.id) for user in (self.user, self.contact, self.stranger)])
+
+    def presence(self, user, connection_id):
+        return Presence(self.channel_layer, user.id, connection_id, get_contact_ids(user.id), redis=self.redis)
+
+    def test_contacts(self):
+        self.assertEqual([self.contact.id], get_contact_ids(self.user.id))
+        self.assertEqual([], get_contact_ids(self.stranger.id))
+
+    def test_online_contacts_get_deltas(self):
+        async_to_sync(self.channel_layer.group_add)(personal_group(self.contact.id), 'contact-connection')
+        self.assertEqual([], async_to_sync(self.presence(self.contact, 'contact-connection').connect)())
+
+        first, second = self.presence(self.user, 'first'), self.presence(self.user, 'second')
+        self.assertEqual([self.contact.id], async_to_sync(first.connect)())
+        async_to_sync(second.connect)()
+        async_to_sync(first.disconnect)()
+        self.assertEqual({self.user.id, self.contact.id},
+                         async_to_sync(self.redis.online)([self.user.id, self.contact.id, self.stranger.id]))
+        async_to_sync(second.disconnect)()
+
+        messages = async_to_sync(_drain)(self.channel_layer, 'contact-connection')
+        self.assertEqual([{'action': 'presence', 'user': self.user.id, 'online': True},
+                          {'action': 'presence', 'user': self.user.id, 'online': False}],
+                         [message['message'] for message in messages])
+        self.assertEqual(set(), async_to_sync(self.redis.online)([self.user.id]))
+
+    def test_expired_connection_is_offline(self):
+        self.redis.ttl = 0.01
+        async_to_sync(self.presence(self.user, 'first').connect)()
+        time.sleep(0.05)
+        self.assertEqual(set(), async_to_sync(self.redis.online)([self.user.id]))
+
+
+class TestChatConsumerRooms(TransactionTestCase):
+    # database_sync_to_async closes the connection of a TestCase transaction
+    def setUp(self) -> None:
+        self.user = _create_user()
+        self.chat_room = baker.make(ChatRoom, type='group', member=[self.user])
+        self.consumer = ChatConsumer()
+        self.consumer.channel_layer = InMemoryChannelLayer()
+        self.consumer.channel_name = 'connection'
+        self.consumer.user = self.user
+        self.consumer.user_rooms = {}
+
+    def test_membership_changed(self):
+        event = {'type': 'membership_changed', 'room_id': self.chat_room.room_id, 'joined': True}
+        async_to_sync(self.consumer.membership_changed)(event)
+        self.assertEqual(self.chat_room.id, self.consumer.user_rooms[self.chat_room.room_id].id)
+        self.assertIn('connection', self.consumer.channel_layer.groups[self.chat_room.room_id])
+
+        async_to_sync(self.consumer.membership_changed)({**event, 'joined': False})
+        self.assertEqual({}, self.consumer.user_rooms)
+        self.assertNotIn(self.chat_room.room_id, self.consumer.channel_layer.groups)
+
+    def test_rejects_joining_a_room_of_others(self):
+        other_room = baker.make(ChatRoom, type='group')
+        event = {'type': 'membership_changed', 'room_id': other_room.room_id, 'joined': True}
+        async_to_sync(self.consumer.membership_changed)(event)
+        self.assertEqual({}, self.consumer.user_rooms)
+
+    def test_notify_membership_changed(self):
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)(personal_group(self.user.id), 'connection')
+        async_to_sync(channel_layer.group_add)(self.chat_room.room_id, 'member-connection')
+        notify_membership_changed(self.chat_room.room_id, left_ids=[self.user.id])
+        event = async_to_sync(channel_layer.receive)('connection')
+        self.assertEqual({'type': 'membership_changed', 'room_id': self.chat_room.room_id, 'joined': False}, event)
+        self.assertEqual({'type': 'contacts_changed'}, async_to_sync(channel_layer.receive)('member-connection'))
+        async_to_sync(channel_layer.group_discard)(personal_group(self.user.id), 'connection')
+        async_to_sync(channel_layer.group_discard)(self.chat_room.room_id, 'member-connection')
+
+    def test_contacts_changed(self):
+        self.consumer.presence = Presence(self.consumer.channel_layer, self.user.id, 'connection', [], redis=Mock())
+        member = baker.make(CustomerUser)
+        self.chat_room.member.add(member)
+        async_to_sync(self.consumer.contacts_changed)({'type': 'contacts_changed'})
+        self.assertEqual([member.id], self.consumer.presence.contact_ids)
+
+    def test_heartbeats_survive_a_failure(self):
+        self.consumer.presence = Mock(heartbeat_interval=0,
+                                      heartbeat=AsyncMock(side_effect=[RedisError(), asyncio.CancelledError()]))
+        with self.assertLogs('chat.consumers', 'ERROR'), self.assertRaises(asyncio.CancelledError):
+            async_to_sync(self.consumer.send_heartbeats)()
+        self.assertEqual(2, self.consumer.presence.heartbeat.await_count)
+
+
+class TestChatMessageWriter(TestCase):
+    def setUp(self) -> None:
+        self.user = _create_user()
+        self.chat_room = baker.make(ChatRoom, type='group', member=[self.user])
+        self.writer = ChatMessageWriter(batch_size=2, flush_interval=60, max_pending=3)
+
+    def message(self, **kwargs):
+        return ChatMessage(chat=self.chat_room, user=self.user, message='hello', **kwargs)
+
+    def test_flush_in_batches(self):
+        self.writer.pending = [self.message() for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(3, self.writer.flush())
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "chat_chatmessage"')]
+        self.assertEqual(2, len(inserts))
+        self.assertEqual(3, ChatMessage.objects.filter(chat=self.chat_room).count())
+        self.assertEqual([], self.writer.pending)
+        self.chat_room.refresh_from_db()
+        self.assertEqual(ChatMessage.objects.filter(chat=self.chat_room).latest('id'), self.chat_room.last_message)
+
+    def test_resent_message_is_written_once(self):
+        message = self.message()
+        self.writer.pending = [message, self.message(client_id=message.client_id)]
+        self.writer.flush()
+        self.assertEqual(1, ChatMessage.objects.filter(client_id=message.client_id).count())
+
+    def test_consumer_broadcasts_before_writing(self):
+        consumer = ChatConsumer()
+        consumer.user = self.user
+        consumer.sender = {'user_image': {'thumbnail': None}, 'user_name': 'Milad Tavakoli'}
+        client_id = consumer.get_client_id('2f1d1a4e-8d7c-4c59-9a8e-3c1b2d4e5f60')
+
+        async def send():
+            payload = consumer.save_message('hello', self.chat_room, None, None, client_id)
+            self.writer.task.cancel()
+            return payload
+
+        with patch('chat.consumers.get_message_writer', return_value=self.writer):
+            payload = async_to_sync(send)()
+        self.assertEqual(str(client_id), payload['client_id'])
+        self.assertEqual('Milad Tavakoli', payload['user_name'])
+        self.assertFalse(ChatMessage.objects.filter(client_id=client_id).exists())
+        self.assertEqual(1, self.writer.flush())
+        self.assertTrue(ChatMessage.objects.filter(id=payload['id'], client_id=client_id, chat=self.chat_room).exists())
+        self.assertNotEqual(client_id, consumer.get_client_id('not an uuid'))
+
+    def test_refuses_messages_while_the_database_is_failing(self):
+        consumer = ChatConsumer()
+        consumer.user = self.user
+        consumer.sender = {'user_image': {'thumbnail': None}, 'user_name': 'Milad Tavakoli'}
+
+        async def send():
+            payloads = [consumer.save_message('hello', self.chat_room, None, None, consumer.get_client_id(None))
+                        for _ in range(4)]
+            self.writer.task.cancel()
+            return payloads
+
+        with patch('chat.consumers.get_message_writer', return_value=self.writer):
+            payloads = async_to_sync(send)()
+        self.assertIsNone(payloads[3])
+        self.assertEqual([payload['client_id'] for payload in payloads[:3]],
+                         [str(message.client_id) for message in self.writer.pending])
+
+    def test_id_clash_is_reported_instead_of_ignored(self):
+        written = self.message()
+        self.writer.write([written])
+        clash = self.message(id=written.id)
+        with patch('chat.message_writer.notify_messages_dropped') as mock_notify:
+            self.writer.write([clash])
+        mock_notify.assert_called_once_with([clash])
+        self.assertEqual(written.client_id, ChatMessage.objects.get(id=written.id).client_id)
+
+    def test_messages_not_fitting_their_columns_are_dropped_alone(self):
+        kept, too_long, bad_reply = self.message(), self.message(message='x' * 256), self.message(reply_to_id='x')
+        with patch('chat.message_writer.notify_messages_dropped') as mock_notify:
+            self.writer.write([kept, too_long, bad_reply])
+        mock_notify.assert_called_once_with([too_long, bad_reply])
+        self.assertEqual([kept.id], list(ChatMessage.objects.filter(chat=self.chat_room).values_list('id', flat=True)))
+
+    def test_flush_keeps_a_batch_it_could_not_write(self):
+        self.writer.pending = [self.message() for _ in range(3)]
+        with patch.object(self.writer, 'write', side_effect=RuntimeError()), self.assertRaises(RuntimeError):
+            self.writer.flush()
+        self.assertEqual(3, len(self.writer.pending))
+
+    def test_consumer_refuses_invalid_messages(self):
+        consumer = ChatConsumer()
+        consumer.user = self.user
+        consumer.sender = {'user_image': {'thumbnail': None}, 'user_name': 'Milad Tavakoli'}
+        with patch('chat.consumers.get_message_writer', return_value=self.writer):
+            for message, reply_to, post_id in (('x' * 256, None, None), (None, None, None), ('hello', 'x', None),
+                                               ('hello', None, 1 << 63), ('hello', None, [1])):
+                self.assertIsNone(consumer.save_message(message, self.chat_room, reply_to, post_id, uuid.uuid4()))
+        self.assertEqual([], self.writer.pending)
+        self.assertEqual(12, consumer.get_reference_id('12'))
+
+    def test_dropped_messages_are_reported_to_the_room(self):
+        kept, dropped = self.message(), self.message()
+        bulk_create = patch.object(ChatMessage.objects, 'bulk_create',
+                                   side_effect=[IntegrityError(), [kept], IntegrityError()])
+        with bulk_create, patch('chat.message_writer.notify_messages_dropped') as mock_notify:
+            self.writer.write([kept, dropped])
+        mock_notify.assert_called_once_with([dropped])
+
+    def test_close_reports_messages_the_database_refuses(self):
+        self.writer.pending = [self.message()]
+        with patch.object(self.writer, 'write', side_effect=DatabaseError()), \
+                patch('chat.message_writer.notify_messages_dropped') as mock_notify, \
+                self.assertLogs('chat.message_writer', 'ERROR'):
+            self.writer.close()
+        self.assertEqual([], self.writer.pending)
+        self.assertEqual(1, len(mock_notify.call_args.args[0]))
+
+    def test_run_survives_a_failed_flush(self):
+        writer = ChatMessageWriter(batch_size=2, flush_interval=0, max_pending=3)
+        flush = AsyncMock(side_effect=[RuntimeError(), asyncio.CancelledError()])
+
+        async def run():
+            writer.wakeup = asyncio.Event()
+            await writer.run()
+
+        with patch('chat.message_writer.database_sync_to_async', return_value=flush), \
+                self.assertLogs('chat.message_writer', 'ERROR'), self.assertRaises(asyncio.CancelledError):
+            async_to_sync(run)()
+        self.assertEqual(2, flush.await_count)
+
+    def test_flush_counts_unread_messages_of_other_members(self):
+        other = baker.make(CustomerUser)
+        self.chat_room.member.add(other)
+        self.writer.pending = [self.message() for _ in range(3)]
+        with patch('chat.message_writer.notify_unread_counts') as mock_notify:
+            self.writer.flush()
+        self.assertEqual(3, ChatRoomUserState.objects.get(user=other, room=self.chat_room).unread_count)
+        self.assertEqual(0, ChatRoomUserState.objects.get(user=self.user, room=self.chat_room).unread_count)
+        self.assertEqual([2, 3], [call.args[0][0].unread_count for call in mock_notify.call_args_list])
+
+
+class TestSnowflakeGenerator(TestCase):
+    def setUp(self) -> None:
+        self.now = 1719835200.0  # 2024-07-01 12:00 UTC
+        self.generator = SnowflakeGenerator(node_id=5, node_bits=10, sequence_bits=12, clock=lambda: self.now)
+
+    def test_id_layout(self):
+        snowflake_id = self.generator.next_id()
+        self.assertEqual(5, snowflake_id >> 12 & 1023)
+        self.assertEqual(0, snowflake_id & 4095)
+        self.assertEqual(self.now, self.generator.datetime_of(snowflake_id).timestamp())
+        self.assertLess(snowflake_id, 1 << 63)
+
+    def test_ids_increase_within_a_millisecond_and_when_the_clock_goes_back(self):
+        ids = [self.generator.next_id() for _ in range(3)]
+        self.now -= 5
+        ids.append(self.generator.next_id())
+        self.assertEqual(sorted(set(ids)), ids)
+        self.assertEqual([0, 1, 2, 3], [snowflake_id & 4095 for snowflake_id in ids])
+
+    def test_exhausted_sequence_borrows_the_next_millisecond(self):
+        generator = SnowflakeGenerator(node_id=1, node_bits=5, sequence_bits=2, clock=lambda: self.now)
+        ids = [generator.next_id() for _ in range(6)]
+        self.assertEqual(sorted(set(ids)), ids)
+        self.assertEqual(ids[0] + (1 << 7), ids[4])
+
+    def test_rejects_node_id_out_of_range(self):
+        with self.assertRaises(ValueError):
+            SnowflakeGenerator(node_id=1024, node_bits=10)
+
+    def test_node_ids_are_leased_until_they_expire(self):
+        leases = SnowflakeNodeRedis(key_prefix='Snowflake/test', ttl=60)
+        try:
+            node_ids = [leases.lease(node_bits=2, owner=f'process {index}') for index in range(4)]
+            self.assertEqual([0, 1, 2, 3], sorted(node_ids))
+            with self.assertRaises(RuntimeError):
+                leases.lease(node_bits=2, owner='process 4')
+            self.assertTrue(leases.renew(node_ids[0], 'process 0'))
+            self.assertFalse(leases.renew(node_ids[0], 'process 1'))
+            get_redis_connection().delete(leases.key(node_ids[2]))
+            self.assertEqual(node_ids[2], leases.lease(node_bits=2, owner='process 4'))
+        finally:
+            get_redis_connection().delete(leases.counter_key, *[leases.key(node_id) for node_id in range(4)])
+
+    def test_messages_get_time_ordered_ids(self):
+        chat_room = baker.make(ChatRoom, type='group')
+        first = ChatMessage(chat=chat_room, message='first')
+        second = ChatMessage(chat=chat_room, message='second')
+        self.assertLess(first.id, second.id)
+
+
+class TestUnreadCounts(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = _create_user()
+        self.tmp_user = baker.make(CustomerUser, first_name='John', last_name='Doe')
+        self.chat_room = baker.make(ChatRoom, type='group', member=[self.user, self.tmp_user])
+        self.messages = baker.make(ChatMessage, chat=self.chat_room, user=self.tmp_user, _quantity=3)
+
+    def state(self, user):
+        return ChatRoomUserState.objects.get(user=user, room=self.chat_room)
+
+    def test_messages_of_others_are_unread(self):
+        baker.make(ChatMessage, chat=self.chat_room, user=self.user)
+        self.assertEqual(3, self.state(self.user).unread_count)
+        self.assertEqual(1, self.state(self.tmp_user).unread_count)
+
+    def test_inbox_shows_unread_count(self):
+        self.client.force_authenticate(self.user)
+        response_json = self.client.get(reverse('chatRoom'), format='json').json()
+        self.assertEqual(3, response_json['data'][0]['unread_count'])
+
+    def test_seen_messages_move_the_read_pointer(self):
+        self.client.force_authenticate(self.user)
+        with patch('chat.views.notify_unread_counts') as mock_notify:
+            response = self.client.post(reverse('seen_message', kwargs={'room_id': self.chat_room.room_id}),
+                                        data={'messages_id': [self.messages[1].id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        state = self.state(self.user)
+        self.assertEqual(self.messages[1].id, state.last_read_message_id)
+        self.assertEqual(1, state.unread_count)
+        mock_notify.assert_called_once_with([state])
+
+    def test_read_pointer_never_moves_back(self):
+        ChatRoomUserState.objects.mark_read(self.user.id, self.chat_room.id, self.messages[2].id)
+        state = ChatRoomUserState.objects.mark_read(self.user.id, self.chat_room.id, self.messages[0].id)
+        self.assertEqual(self.messages[2].id, state.last_read_message_id)
+        self.assertEqual(0, state.unread_count)
+
+    def test_unread_count_is_pushed_to_the_user(self):
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(personal_group(self.user.id), channel_name)
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_unread_counts([self.state(self.user)])
+        message = async_to_sync(channel_layer.receive)(channel_name)['message']
+        self.assertEqual({'action': 'unread', 'room_id': self.chat_room.room_id, 'unread_count': 3}, message)
+
+    def test_mark_read_locks_the_state(self):
+        with CaptureQueriesContext(connection) as queries:
+            ChatRoomUserState.objects.mark_read(self.user.id, self.chat_room.id, self.messages[0].id)
+        self.assertTrue(any('FOR UPDATE' in query['sql'] for query in queries))
+
+    def test_leaving_with_messages_deleted_for_all_recounts_the_others(self):
+        ChatRoomUserState.objects.mark_read(self.user.id, self.chat_room.id, self.messages[0].id)
+        self.client.force_authenticate(self.tmp_user)
+        with patch('chat.views.notify_unread_counts') as mock_notify:
+            self.client.delete(reverse('chat_room_leave', kwargs={'room_id': self.chat_room.room_id}),
+                               data={'delete_my_messages_for_all': True, 'delete_all_message_for_me': False},
+                               format='json')
+        self.assertEqual(0, self.state(self.user).unread_count)
+        mock_notify.assert_called_once_with([self.state(self.user)])
+
+    def test_hiding_messages_for_me_recounts_my_state(self):
+        view = DeleteChatMessagesAPI()
+        view.request = Mock(user=self.user)
+        with patch('chat.views.notify_unread_counts') as mock_notify:
+            view.delete_all_message_for_me(self.chat_room, [{'id': message.id} for message in self.messages[:2]])
+        self.assertEqual(1, self.state(self.user).unread_count)
+        self.assertEqual(0, self.state(self.tmp_user).unread_count)
+        mock_notify.assert_called_once_with([self.state(self.user)])
+
+    def test_recount_skips_read_own_and_deleted_messages(self):
+        baker.make(ChatMessage, chat=self.chat_room, user=self.user)
+        ChatRoomUserState.objects.mark_read(self.user.id, self.chat_room.id, self.messages[0].id)
+        self.messages[1].deleted_by.add(self.user)
+        ChatRoomUserState.objects.filter(room=self.chat_room).update(unread_count=10)
+        states = ChatRoomUserState.objects.recount(self.chat_room.id)
+        self.assertEqual({self.user.id: 1, self.tmp_user.id: 1},
+                         {state.user_id: state.unread_count for state in states})
@@ -0,0 +1,62 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from chat.presence import personal_group
+
+
+def notify_membership_changed(room_id: str, joined_ids=(), left_ids=()) -> None:
+    """
+    Tell the websocket connections of the users who joined or left the room, once the change is committed, so they
+    update the rooms they listen to, and the other members of the room, so they update the contacts told about their
+    presence.
+    """
+    events = [(user_id, True) for user_id in joined_ids] + [(user_id, False) for user_id in left_ids]
+    if not events:
+        return
+
+    def send():
+        channel_layer = get_channel_layer()
+        for user_id, joined in events:
+            async_to_sync(channel_layer.group_send)(
+                personal_group(user_id), {'type': 'membership_changed', 'room_id': room_id, 'joined': joined})
+        async_to_sync(channel_layer.group_send)(room_id, {'type': 'contacts_changed'})
+
+    transaction.on_commit(send)
+
+
+def notify_unread_counts(states) -> None:
+    """Push the unread count of each `ChatRoomUserState` to the user's websocket connections once committed."""
+    events = [(state.user_id, state.room.room_id, state.unread_count) for state in states]
+    if not events:
+        return
+
+    def send():
+        channel_layer = get_channel_layer()
+        for user_id, room_id, unread_count in events:
+            async_to_sync(channel_layer.group_send)(personal_group(user_id), {
+                'type': 'chat_message',
+                'message': {'action': 'unread', 'room_id': room_id, 'unread_count': unread_count},
+            })
+
+    transaction.on_commit(send)
+
+
+def notify_messages_dropped(messages) -> None:
+    """
+    Tell the rooms of broadcast `ChatMessage`s that could not be written that they are gone, once committed, so the
+    clients take them out of the conversation.
+    """
+    events = [(message.chat.room_id, str(message.id), str(message.client_id)) for message in messages]
+    if not events:
+        return
+
+    def send():
+        channel_layer = get_channel_layer()
+        for room_id, message_id, client_id in events:
+            async_to_sync(channel_layer.group_send)(room_id, {
+                'type': 'chat_message',
+                'message': {'action': 'message_failed', 'room_id': room_id, 'id': message_id, 'client_id': client_id},
+            })
+
+    transaction.on_commit(send)
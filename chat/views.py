@@ -8,19 +8,30 @@ from rest_framework.pagination import LimitOffsetPagination
 from NeighborsHub.custom_view_mixin import ExpressiveListModelMixin, ExpressiveUpdateModelMixin, \
     ExpressiveCreateModelMixin
 from NeighborsHub.exceptions import YouAreNotGroupAdminException
+from NeighborsHub.pagination import LimitOffsetOrCursorPagination
 from NeighborsHub.permission import CustomAuthentication
 from users.models import CustomerUser
 from .serializers import ChatRoomSerializer, ChatMessageSerializer, ChatRoomMembersSerializer, \
     RemoveChatMessageSerializer, LeaveChatRoomSerializer, UserSeenMessageSerializer
-from .models import ChatRoom, ChatMessage, UserSeenMessage
+from .models import ChatRoom, ChatMessage, ChatRoomUserState, UserSeenMessage
+from .utils import notify_membership_changed, notify_unread_counts
 from django.utils.translation import gettext as _
 
 
 class ChatRoomView(APIView):
     authentication_classes = (CustomAuthentication,)
 
+    @staticmethod
+    def attach_last_messages(chat_rooms):
+        """Fetch the last message of every room of the inbox at once."""
+        messages = ChatMessage.objects.select_related('user').prefetch_related('seen').in_bulk(
+            [room.last_visible_message_id for room in chat_rooms if room.last_visible_message_id is not None])
+        for room in chat_rooms:
+            room.last_visible_message = messages.get(room.last_visible_message_id)
+        return chat_rooms
+
     def get(self, request):
-        chat_rooms = ChatRoom.objects.filter(member=self.request.user)
+        chat_rooms = self.attach_last_messages(list(ChatRoom.objects.inbox(self.request.user)))
         serializer = ChatRoomSerializer(
             chat_rooms, many=True, context={"request": request}
         )
@@ -32,7 +43,8 @@ class ChatRoomView(APIView):
             data=request.data, context={"request": request}
         )
         if serializer.is_valid():
-            serializer.save()
+            chat_room = serializer.save()
+            notify_membership_changed(chat_room.room_id, joined_ids=chat_room.member.values_list('id', flat=True))
             return Response({"status": "ok", "data": serializer.data, "message": "ChatRoom Created"},
                             status=status.HTTP_201_CREATED)
         return Response({"status": "error", 'data': serializer.errors, 'message': 'Inputs has errors'}
@@ -62,20 +74,27 @@ class ChatRoomMembersView(ExpressiveListModelMixin, ExpressiveUpdateModelMixin,
         if self.request.user not in obj.admin.all() and \
                 (len(serializer.validated_data['admins']) > 0 or len(serializer.validated_data['delete_admins']) > 0):
             raise YouAreNotGroupAdminException()
+        member_ids = set(obj.member.values_list('id', flat=True))
         serializer.save()
+        new_member_ids = set(obj.member.values_list('id', flat=True))
+        ChatRoomUserState.objects.filter(room=obj, user_id__in=member_ids - new_member_ids).delete()
+        notify_membership_changed(obj.room_id, joined_ids=new_member_ids - member_ids,
+                                  left_ids=member_ids - new_member_ids)
 
 
 class MessagesView(ExpressiveListModelMixin, ListAPIView):
     authentication_classes = (CustomAuthentication,)
     serializer_class = ChatMessageSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = LimitOffsetOrCursorPagination
+    count_precision = 'capped'
+    cursor_ordering = '-id'
     plural_name = 'chat_messages'
 
     def get_queryset(self):
         if not ChatRoom.objects.filter(room_id=self.kwargs['room_id'], member=self.request.user).exists():
             raise PermissionDenied()
         chats = ChatMessage.objects.filter(chat__room_id=self.kwargs['room_id'])
-        chats = chats.exclude(deleted_by=self.request.user).order_by('-created_at')
+        chats = chats.exclude(deleted_by=self.request.user).order_by(self.cursor_ordering).prefetch_related('seen')
         return chats
 
 
@@ -100,16 +119,22 @@ class LeaveChatRoomAPI(DestroyAPIView):
         return ChatRoom.objects.get(room_id=self.kwargs['room_id'])
 
     def delete_my_message_for_all(self, chatroom):
-        return ChatMessage.objects.filter(chat=chatroom, user=self.request.user).delete()
+        result = ChatMessage.objects.filter(chat=chatroom, user=self.request.user).delete()
+        ChatRoom.objects.refresh_last_message([chatroom.id])
+        notify_unread_counts(ChatRoomUserState.objects.recount(chatroom.id))
+        return result
 
     def delete_all_message_for_me(self, chatroom):
         chat_messages = ChatMessage.objects.filter(chat=chatroom)
         for chat_message in chat_messages:
             chat_message.deleted_by.add(self.request.user)
+        notify_unread_counts(ChatRoomUserState.objects.recount(chatroom.id, [self.request.user.id]))
         return
 
     def perform_destroy(self, instance):
         instance.member.remove(self.request.user)
+        ChatRoomUserState.objects.filter(room=instance, user=self.request.user).delete()
+        notify_membership_changed(instance.room_id, left_ids=[self.request.user.id])
 
         serializer = LeaveChatRoomSerializer(data=self.request.data)
         serializer.is_valid(raise_exception=False)
@@ -135,13 +160,17 @@ class DeleteChatMessagesAPI(DestroyAPIView):
         return ChatRoom.objects.get(room_id=self.kwargs['room_id'])
 
     def delete_my_message_for_all(self, chatroom, message_ids):
-        return ChatMessage.objects.filter(chat=chatroom, id__in=[m['id'] for m in message_ids],
-                                          user=self.request.user).delete()
+        result = ChatMessage.objects.filter(chat=chatroom, id__in=[m['id'] for m in message_ids],
+                                            user=self.request.user).delete()
+        ChatRoom.objects.refresh_last_message([chatroom.id])
+        notify_unread_counts(ChatRoomUserState.objects.recount(chatroom.id))
+        return result
 
     def delete_all_message_for_me(self, chatroom, message_ids):
         chat_messages = ChatMessage.objects.filter(chat=chatroom, id__in=[m['id'] for m in message_ids])
         for chat_message in chat_messages:
             chat_message.deleted_by.add(self.request.user)
+        notify_unread_counts(ChatRoomUserState.objects.recount(chatroom.id, [self.request.user.id]))
         return
 
     def perform_destroy(self, instance):
@@ -166,6 +195,13 @@ class CreateUserSeenMessagesAPI(ExpressiveCreateModelMixin, CreateAPIView):
     serializer_class = UserSeenMessageSerializer
     singular_name = 'seen_messages'
 
+    def perform_create(self, serializer):
+        seen_messages = serializer.save()
+        if seen_messages:
+            state = ChatRoomUserState.objects.mark_read(self.request.user.id, seen_messages[0].message.chat_id,
+                                                        max(seen.message_id for seen in seen_messages))
+            notify_unread_counts([state])
+
     def create(self, request, *args, **kwargs):
         if not ChatRoom.objects.filter(room_id=self.kwargs.get('room_id'),
                                        member=self.request.user).exists():
@@ -0,0 +1,56 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from redis import Redis
+
+from NeighborsHub.redis_management import get_redis_connection, redis_command_metrics
+
+
+class Command(BaseCommand):
+    help = ('Compare opening a Redis connection per request, as the helpers used to, with the shared connection '
+            'pool. Every simulated request runs a token lookup style GET and a SET with expiry.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        key = f'Benchmark/redis/{uuid.uuid4().hex}'
+
+        def per_request_connection():
+            connection = Redis(host=settings.REDIS_ENGINE['host'], port=settings.REDIS_ENGINE['port'], db=0)
+            try:
+                return self.simulate_request(connection, key)
+            finally:
+                connection.close()
+
+        def pooled_connection():
+            return self.simulate_request(get_redis_connection(), key)
+
+        self.report('connection per request', per_request_connection, options['requests'], options['threads'])
+        redis_command_metrics.reset()
+        self.report('shared pool', pooled_connection, options['requests'], options['threads'])
+        for command, metrics in sorted(redis_command_metrics.snapshot().items()):
+            self.stdout.write(f"{command:>20}: {metrics['count']} calls, {metrics['mean'] * 1000:.3f} ms mean, "
+                              f"{metrics['max'] * 1000:.3f} ms max")
+        get_redis_connection().delete(key)
+
+    @staticmethod
+    def simulate_request(connection, key):
+        started = time.perf_counter()
+        connection.get(key)
+        connection.set(key, 1, 60)
+        return time.perf_counter() - started
+
+    def report(self, name, request, requests, threads):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = sorted(executor.map(lambda _: request(), range(requests)))
+        elapsed = time.perf_counter() - started
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(f'{name:>24}: {requests / elapsed:.0f} requests/s, '
+                          f'p50 {statistics.median(latencies) * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms')
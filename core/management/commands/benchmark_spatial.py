@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from NeighborsHub.gis import meters_to_degrees
+from core.models import City, Country, State
+from users.models import Address
+
+
+class Command(BaseCommand):
+    help = ('Seed synthetic cities and addresses inside a transaction and compare query plans and timings of '
+            'the full-scan and index-assisted nearest city / distance queries. Data is rolled back unless --keep.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=100_000)
+        parser.add_argument('--addresses', type=int, default=1_000_000)
+        parser.add_argument('--distance', type=float, default=2_000, help='to_distance in meters')
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help='keep the seeded rows')
+
+    @staticmethod
+    def random_point():
+        return Point(random.uniform(-125, -65), random.uniform(25, 50), srid=4326)
+
+    def seed(self, cities, addresses, batch_size):
+        country, _ = Country.objects.get_or_create(code='ZZ', defaults={
+            'name': 'Benchmark', 'name_code': 'benchmark', 'population': 0, 'capital': 'Benchmark'})
+        state = State.objects.create(name='Benchmark', name_code='benchmark', abbreviation='BM', country=country)
+        for start in range(0, cities, batch_size):
+            City.objects.bulk_create([
+                City(name=f'city {i}', name_code=f'city_{i}', location=self.random_point(), state=state)
+                for i in range(start, min(start + batch_size, cities))
+            ])
+        for start in range(0, addresses, batch_size):
+            Address.objects.bulk_create([
+                Address(location=self.random_point()) for _ in range(start, min(start + batch_size, addresses))
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {City._meta.db_table}')
+            cursor.execute(f'ANALYZE {Address._meta.db_table}')
+
+    def report(self, title, build_queryset, runs):
+        queryset = build_queryset(self.random_point())
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(queryset.explain(analyze=True))
+        started = time.perf_counter()
+        for _ in range(runs):
+            list(build_queryset(self.random_point()))
+        elapsed = (time.perf_counter() - started) / runs
+        self.stdout.write(self.style.SUCCESS(f'{title}: {elapsed * 1000:.2f} ms/query over {runs} runs\n'))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['cities']} cities and {options['addresses']} addresses ...")
+            self.seed(options['cities'], options['addresses'], options['batch_size'])
+            distance = options['distance']
+
+            def full_scan_nearest_city(point):
+                return City.objects.annotate(
+                    distance=Distance('location', point, output_field=models.FloatField())
+                ).order_by('distance')[:1]
+
+            def knn_nearest_city(point):
+                return City.objects.nearest_cities(point)[:1]
+
+            def full_scan_distance(point):
+                return Address.objects.annotate(
+                    distance=Distance('location', point, output_field=models.FloatField())
+                ).filter(distance__lte=distance)
+
+            def dwithin_distance(point):
+                return Address.objects.filter(
+                    location__dwithin=(point, meters_to_degrees(distance, point))
+                ).annotate(
+                    distance=Distance('location', point, output_field=models.FloatField())
+                ).filter(distance__lte=distance)
+
+            self.report('Nearest city (full scan)', full_scan_nearest_city, options['runs'])
+            self.report('Nearest city (KNN)', knn_nearest_city, options['runs'])
+            self.report('Addresses within distance (full scan)', full_scan_distance, options['runs'])
+            self.report('Addresses within distance (dwithin prefilter)', dwithin_distance, options['runs'])
+
+            if not options['keep']:
+                transaction.set_rollback(True)
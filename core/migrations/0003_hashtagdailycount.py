@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2024-06-11 09:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_feedback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashtagDailyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_counts', to='core.hashtag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='core_hashtagdailycount_day_idx')],
+                'unique_together': {('hashtag', 'day')},
+            },
+        ),
+    ]
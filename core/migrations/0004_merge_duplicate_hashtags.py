@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2024-06-14 16:02
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_hashtags(apps, schema_editor):
+    """Point every reference of a duplicated hashtag title to its oldest hashtag and delete the others."""
+    Hashtag = apps.get_model('core', 'Hashtag')
+    duplicates = Hashtag.objects.values('hashtag_title').annotate(keep_id=Min('id'), total=Count('id'))
+    kept_ids = {row['hashtag_title']: row['keep_id'] for row in duplicates.filter(total__gt=1)}
+    if not kept_ids:
+        return
+    remap = dict(Hashtag.objects.filter(hashtag_title__in=kept_ids).exclude(id__in=kept_ids.values())
+                 .values_list('id', 'hashtag_title'))
+    remap = {hashtag_id: kept_ids[title] for hashtag_id, title in remap.items()}
+
+    for model in apps.get_models(include_auto_created=True):
+        for field in model._meta.fields:
+            if not field.many_to_one or field.related_model._meta.label_lower != 'core.hashtag':
+                continue
+            # rows are identified by their unique fields or else by their foreign keys, e.g. (post, hashtag)
+            key_fields = next((fields for fields in model._meta.unique_together if field.name in fields), None)
+            key_fields = key_fields or [other.name for other in model._meta.fields if other.many_to_one]
+            key_attnames = [model._meta.get_field(name).attname for name in key_fields]
+
+            rows = model.objects.filter(**{f'{field.attname}__in': set(remap) | set(remap.values())})
+            # rows already on the kept hashtag come first so moved rows never hit a unique constraint
+            rows = sorted(rows, key=lambda row: (getattr(row, field.attname) in remap, row.pk))
+            kept_rows = {}
+            for row in rows:
+                hashtag_id = getattr(row, field.attname)
+                setattr(row, field.attname, remap.get(hashtag_id, hashtag_id))
+                key = tuple(getattr(row, attname) for attname in key_attnames)
+                if key not in kept_rows:
+                    kept_rows[key] = row
+                    if hashtag_id in remap:
+                        row.save(update_fields=[field.name])
+                    continue
+                if model._meta.label_lower == 'core.hashtagdailycount':
+                    kept_rows[key].count += row.count
+                    kept_rows[key].save(update_fields=['count'])
+                row.delete()
+
+    Hashtag.objects.filter(id__in=remap).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_hashtagdailycount'),
+        ('albums', '0006_alter_media_file'),
+        ('post', '0011_post_counters'),
+        ('users', '0011_address_geohash_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_hashtags, migrations.RunPython.noop),
+    ]
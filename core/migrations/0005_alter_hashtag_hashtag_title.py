@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2024-06-14 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_merge_duplicate_hashtags'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hashtag',
+            name='hashtag_title',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
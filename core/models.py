@@ -3,6 +3,8 @@ from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point
 from django.utils.translation import gettext as _
 
+from NeighborsHub.gis import KNNDistance
+
 
 # Create your models here.
 class States(models.Model):
@@ -15,16 +17,42 @@ class States(models.Model):
         return f"{self.status_title}"
 
 
+class HashtagManager(models.Manager):
+    def resolve(self, hashtag_titles) -> list:
+        """Hashtags of `hashtag_titles`, creating the missing ones, in two queries whatever the number of titles."""
+        hashtag_titles = set(hashtag_titles)
+        if not hashtag_titles:
+            return []
+        self.bulk_create([self.model(hashtag_title=title) for title in hashtag_titles], ignore_conflicts=True)
+        return list(self.filter(hashtag_title__in=hashtag_titles))
+
+
 class Hashtag(models.Model):
     id = models.AutoField(primary_key=True)
-    hashtag_title = models.CharField(max_length=255)
+    hashtag_title = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = HashtagManager()
+
     def __str__(self):
         return self.hashtag_title
 
 
+class HashtagDailyCount(models.Model):
+    """Daily usage of a hashtag by posts and comments, persisted from the Redis trend buckets."""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='daily_counts')
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('hashtag', 'day')
+        indexes = [models.Index(fields=['day'], name='core_hashtagdailycount_day_idx')]
+
+    def __str__(self):
+        return f"HashtagDailyCount(hashtag={self.hashtag_id}, day={self.day}, count={self.count})"
+
+
 class BaseModel(models.Model):
     state = models.ForeignKey(States, null=True, blank=True, on_delete=models.PROTECT)
     hashtags = models.ManyToManyField(Hashtag, blank=True)
@@ -38,6 +66,23 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+    def sync_hashtags(self, hashtag_titles) -> set:
+        """
+        Make `hashtag_titles` the hashtags of this object by inserting and deleting only the difference of its
+        through rows, returns the newly added titles.
+        """
+        hashtag_titles = set(hashtag_titles)
+        through = self.hashtags.through
+        source, target = self.hashtags.source_field_name, self.hashtags.target_field_name
+        rows = through.objects.filter(**{source: self})
+        current = set(rows.values_list(f'{target}__hashtag_title', flat=True))
+        if current - hashtag_titles:
+            rows.filter(**{f'{target}__hashtag_title__in': current - hashtag_titles}).delete()
+        added = hashtag_titles - current
+        through.objects.bulk_create([through(**{source: self, target: hashtag})
+                                     for hashtag in Hashtag.objects.resolve(added)])
+        return added
+
 
 class Country(models.Model):
     name = models.CharField(max_length=100)
@@ -67,9 +112,15 @@ class State(models.Model):
 
 
 class CityManager(models.Manager):
+    def nearest_cities(self, location_point: Point, candidates: int = 10):
+        # KNN scan of the location index picks the candidates, only those get an exact spheroid distance.
+        nearest = self.exclude(location=None).order_by(KNNDistance('location', location_point))
+        return self.filter(id__in=nearest.values('id')[:candidates]).annotate(
+            distance=Distance('location', location_point, output_field=models.FloatField())
+        ).order_by('distance')
+
     def find_nearest_city(self, location_point: Point):
-        return self.annotate(distance=Distance('location', location_point,
-                                               output_field=models.FloatField())).order_by('distance').first()
+        return self.nearest_cities(location_point).first()
 
 
 class City(models.Model):
@@ -1,5 +1,3 @@
-import datetime
-
 from rest_framework import serializers
 
 from core.models import City, Country, State, Hashtag, Feedback
@@ -27,20 +25,24 @@ class CitySerializer(serializers.ModelSerializer):
 
 
 class HashtagSerializer(serializers.ModelSerializer):
-    count = serializers.SerializerMethodField('get_count_hashtags')
-
-    def get_count_hashtags(self, obj):
-        from_days = self.context['request'].query_params.get('from_days')
-        if from_days is not None:
-            from_datetime = datetime.datetime.now() - datetime.timedelta(days=int(from_days))
-            return obj.post_set.filter(created_at__gte=from_datetime).count()
-        return obj.post_set.all().count()
+    count = serializers.IntegerField(source='posts_count', read_only=True)
 
     class Meta:
         model = Hashtag
         fields = ['id', 'hashtag_title', 'count']
 
 
+class TrendingHashtagsParamsSerializer(serializers.Serializer):
+    days = serializers.IntegerField(required=False, min_value=1, max_value=30, default=1)
+    hours = serializers.IntegerField(required=False, min_value=1, max_value=48)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=100, default=10)
+
+
+class TrendingHashtagSerializer(serializers.Serializer):
+    hashtag_title = serializers.CharField()
+    count = serializers.IntegerField()
+
+
 class FeedbackSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=True)
     email = serializers.EmailField(required=True)
@@ -0,0 +1,8 @@
+from NeighborsHub.celery import app as celery_app
+
+
+@celery_app.task(ignore_result=True)
+def celery_persist_hashtag_rollups() -> None:
+    from core.utils import persist_hashtag_rollups
+
+    persist_hashtag_rollups()
@@ -1,11 +1,19 @@
-from django.test import TestCase
+import datetime
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from model_bakery import baker
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 
 from NeighborsHub.test_function import test_object_attributes_existence
-from core.models import Country, State, City, Hashtag, Feedback
+from NeighborsHub.redis_management import HashtagTrendRedis, AuthenticationTokenRedis, SeenPostEventsRedis, \
+    RedisCommandMetrics, get_redis_connection
+from core.models import Country, State, City, Hashtag, Feedback, HashtagDailyCount
+from core.utils import trending_hashtags, persist_hashtag_rollups
 from post.models import Post
 
 
@@ -56,6 +64,13 @@ class TestCityModel(TestCase):
         test_obj = State.objects.filter(id=created_city.id).first()
         self.assertIsNotNone(test_obj)
 
+    def test_find_nearest_city(self):
+        city = baker.make(City, location=Point(-87.650175, 41.850385))
+        baker.make(City, location=Point(-89, 32.23))
+        baker.make(City, location=Point(87.650175, 88.850385))
+        baker.make(City, location=None)
+        self.assertEqual(city, City.objects.find_nearest_city(Point(-87.6, 41.8, srid=4326)))
+
 
 class TestListCountry(TestCase):
     def setUp(self) -> None:
@@ -146,6 +161,57 @@ class TestListHashtags(TestCase):
         self.assertEqual(1, len(response_json['data']['hashtags']['results']))
         self.assertEqual('hello', response_json['data']['hashtags']['results'][0]['hashtag_title'])
         self.assertEqual(10, response_json['data']['hashtags']['results'][0]['count'])
+        self.assertIn(response_json['data']['hashtags']['count_precision'], ('exact', 'estimate'))
+
+    def test_count_from_days(self):
+        Post.objects.update(created_at=timezone.now() - datetime.timedelta(days=5))
+        baker.make(Post, body='#hello')
+        response = self.client.get(reverse('core_list_hashtags'), data={'from_days': 2}, format='json')
+        self.assertEqual(1, response.json()['data']['hashtags']['results'][0]['count'])
+
+
+class TestTrendingHashtags(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.trends = HashtagTrendRedis(key_prefix='Hashtag/trend/test')
+        now = timezone.now()
+        self.trends.increment(['hello', 'world'], now)
+        self.trends.increment(['hello'], now)
+        self.trends.increment(['world'], now - datetime.timedelta(days=1))
+        self.trends.increment(['world'], now - datetime.timedelta(days=1))
+
+    def tearDown(self) -> None:
+        keys = self.trends.connection.keys('Hashtag/trend/test/*')
+        if keys:
+            self.trends.connection.delete(*keys)
+
+    def test_top_merges_day_buckets(self):
+        self.assertEqual([('hello', 2), ('world', 1)], trending_hashtags(limit=10, days=1, trends=self.trends))
+        self.assertEqual([('world', 3), ('hello', 2)], trending_hashtags(limit=10, days=2, trends=self.trends))
+        self.assertEqual([('world', 3)], trending_hashtags(limit=1, days=7, trends=self.trends))
+
+    def test_top_of_hours(self):
+        self.assertEqual([('hello', 2), ('world', 1)], trending_hashtags(limit=10, hours=1, trends=self.trends))
+
+    def test_persist_rollups(self):
+        baker.make(Hashtag, hashtag_title='hello')
+        baker.make(Hashtag, hashtag_title='world')
+        self.assertEqual(3, persist_hashtag_rollups(days=2, trends=self.trends))
+        persist_hashtag_rollups(days=2, trends=self.trends)
+        self.assertEqual(3, HashtagDailyCount.objects.count())
+        self.assertEqual(2, HashtagDailyCount.objects.get(hashtag__hashtag_title='world',
+                                                           day__lt=timezone.now().date()).count)
+
+    @override_settings(HASHTAG_TRENDS={**settings.HASHTAG_TRENDS, 'KEY_PREFIX': 'Hashtag/trend/test'})
+    def test_trending_api(self):
+        response = self.client.get(reverse('core_trending_hashtags'), data={'days': 2, 'limit': 1}, format='json')
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([{'hashtag_title': 'world', 'count': 3}], response_json['data']['hashtags'])
+
+    def test_trending_api_rejects_invalid_days(self):
+        response = self.client.get(reverse('core_trending_hashtags'), data={'days': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
 class TestFeedbackModel(TestCase):
@@ -194,4 +260,22 @@ class TestCreateFeedback(TestCase):
         self.assertEqual('ok', response_json['status'])
         self.assertIn('message', response_json['data']['feedback'])
         self.assertIn('name', response_json['data']['feedback'])
-        self.assertIn('email', response_json['data']['feedback'])
\ No newline at end of file
+        self.assertIn('email', response_json['data']['feedback'])
+
+
+class TestRedisConnectionPool(TestCase):
+    def test_helpers_share_the_connection(self):
+        self.assertIs(get_redis_connection(), AuthenticationTokenRedis().connection)
+        self.assertIs(get_redis_connection(), SeenPostEventsRedis().connection)
+
+    def test_command_metrics(self):
+        metrics = RedisCommandMetrics()
+        metrics.record('GET', 0.002)
+        metrics.record('GET', 0.004)
+        metrics.record('SET', 0.001)
+        snapshot = metrics.snapshot()
+        self.assertEqual(2, snapshot['GET']['count'])
+        self.assertAlmostEqual(0.003, snapshot['GET']['mean'])
+        self.assertAlmostEqual(0.004, snapshot['GET']['max'])
+        metrics.reset()
+        self.assertEqual({}, metrics.snapshot())
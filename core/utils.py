@@ -0,0 +1,57 @@
+import datetime
+import logging
+
+from django.utils import timezone
+from django.db.models import Sum
+from redis.exceptions import RedisError
+
+from NeighborsHub.redis_management import HashtagTrendRedis
+from NeighborsHub.utils import is_testing
+from core.models import Hashtag, HashtagDailyCount
+
+logger = logging.getLogger(__name__)
+
+
+def record_hashtag_usage(hashtag_titles, moment: datetime.datetime = None) -> None:
+    """Count newly tagged posts/comments in the trend buckets, losing a count is better than failing the save."""
+    if not hashtag_titles or is_testing():
+        return
+    try:
+        HashtagTrendRedis().increment(hashtag_titles, moment or timezone.now())
+    except RedisError as exc:
+        logger.warning('Hashtag trends are unavailable, usage of %s is not counted: %s', hashtag_titles, exc)
+
+
+def trending_hashtags(limit: int, days: int = None, hours: int = None, trends: HashtagTrendRedis = None):
+    """
+    The `limit` most used hashtags of the last `hours` hours or `days` days as (hashtag_title, count) pairs.
+    Falls back to the persisted daily rollups when Redis is unavailable.
+    """
+    trends = trends or HashtagTrendRedis()
+    now = timezone.now()
+    try:
+        if hours is not None:
+            return trends.top_of_hours(hours, limit, now)
+        return trends.top_of_days(days or 1, limit, now)
+    except RedisError as exc:
+        logger.warning('Hashtag trends are unavailable, reading daily rollups: %s', exc)
+    days = days or max(1, -(-hours // 24))
+    rollups = HashtagDailyCount.objects.filter(day__gt=(now - datetime.timedelta(days=days)).date())
+    rollups = rollups.values('hashtag__hashtag_title').annotate(total=Sum('count')).order_by('-total')[:limit]
+    return [(rollup['hashtag__hashtag_title'], rollup['total']) for rollup in rollups]
+
+
+def persist_hashtag_rollups(days: int = 2, trends: HashtagTrendRedis = None) -> int:
+    """Upsert the daily counts of the last `days` days from Redis into `HashtagDailyCount`."""
+    trends = trends or HashtagTrendRedis()
+    now = timezone.now()
+    rollups = []
+    for offset in range(days):
+        day = (now - datetime.timedelta(days=offset)).date()
+        counts = trends.day_counts(day)
+        hashtag_ids = dict(Hashtag.objects.filter(hashtag_title__in=counts).values_list('hashtag_title', 'id'))
+        rollups += [HashtagDailyCount(hashtag_id=hashtag_ids[title], day=day, count=count)
+                    for title, count in counts.items() if title in hashtag_ids]
+    HashtagDailyCount.objects.bulk_create(rollups, update_conflicts=True,
+                                          unique_fields=['hashtag', 'day'], update_fields=['count'])
+    return len(rollups)
@@ -1,13 +1,20 @@
 import datetime
 
+from django.db.models import Count, Q
 from django.shortcuts import render
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics
 from rest_framework.filters import SearchFilter
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from NeighborsHub.custom_view_mixin import ExpressiveListModelMixin, ExpressiveCreateModelMixin
+from NeighborsHub.pagination import ApproximateCountPagination
 from core.models import Country, State, City, Hashtag
-from core.serializers import CountrySerializer, StateSerializer, CitySerializer, HashtagSerializer, FeedbackSerializer
+from core.serializers import CountrySerializer, StateSerializer, CitySerializer, HashtagSerializer, FeedbackSerializer, \
+    TrendingHashtagsParamsSerializer, TrendingHashtagSerializer
+from core.utils import trending_hashtags
 
 
 class ListCountryView(ExpressiveListModelMixin, generics.ListAPIView):
@@ -39,10 +46,31 @@ class ListCityView(ExpressiveListModelMixin, generics.ListAPIView):
 
 class ListHashtagsView(ExpressiveListModelMixin, generics.ListAPIView):
     plural_name = "hashtags"
-    queryset = Hashtag.objects.all()
     serializer_class = HashtagSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter]
     search_fields = ['hashtag_title', ]
+    pagination_class = ApproximateCountPagination
+    count_precision = 'estimate'
+
+    def get_queryset(self):
+        posts = Q()
+        from_days = self.request.query_params.get('from_days')
+        if from_days is not None and from_days.isdigit():
+            posts = Q(post__created_at__gte=timezone.now() - datetime.timedelta(days=int(from_days)))
+        return Hashtag.objects.annotate(posts_count=Count('post', filter=posts)).order_by('id')
+
+
+class TrendingHashtagsView(APIView):
+    """Most used hashtags of the last `hours` hours or `days` days, merged from the Redis trend buckets."""
+
+    @staticmethod
+    def get(request):
+        params = TrendingHashtagsParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        hashtags = trending_hashtags(**params.validated_data)
+        data = TrendingHashtagSerializer([{'hashtag_title': title, 'count': count} for title, count in hashtags],
+                                         many=True).data
+        return Response(data={'status': 'ok', 'data': {'hashtags': data}})
 
 
 class CreateFeedbackView(ExpressiveCreateModelMixin, generics.CreateAPIView):
@@ -4,7 +4,11 @@ from post.models import Post, Category, Comment, LikePost
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    pass
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if 'category' in form.changed_data:
+            # categories picked by hand are what the local classifier is evaluated on
+            Post.objects.filter(id=form.instance.id).update(category_source='curated')
 
 
 @admin.register(Comment)
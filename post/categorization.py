@@ -0,0 +1,132 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
+
+from NeighborsHub.openai_manager import get_posts_categorizer
+from NeighborsHub.redis_management import PostCategorizationRedis
+from NeighborsHub.utils import is_testing
+from post.classifier import get_category_classifier
+from post.task import celery_get_category_post
+
+logger = logging.getLogger(__name__)
+
+
+def hash_post_body(body: str) -> str:
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def enqueue_post_categorization(post_id: int) -> None:
+    """Queue the post for the next categorization batch, or for its own task when Redis is not reachable."""
+    if is_testing():
+        return
+    try:
+        PostCategorizationRedis().push_pending([post_id])
+    except RedisError as exc:
+        logger.warning('Categorization queue is unavailable, categorizing post %s alone: %s', post_id, exc)
+        try:
+            celery_get_category_post.s(post_id).apply_async()
+        except OperationalError as exc:
+            logger.warning('Could not enqueue categorization of post %s: %s', post_id, exc)
+
+
+def classify_bodies(bodies: dict[str, str], categories: list[str], batch_size: int) -> dict[str, str]:
+    """Category title of every body of `bodies` (keyed by hash), one model call per `batch_size` bodies."""
+    items = list(bodies.items())
+    results = {}
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        titles = get_posts_categorizer(categories, [body for _, body in batch]).run()
+        results.update({body_hash: title for (body_hash, _), title in zip(batch, titles) if title in categories})
+    return results
+
+
+def classify_bodies_locally(bodies: dict[str, str], threshold: float) -> dict[str, str]:
+    """Categories the local classifier is confident about, the remaining bodies are left for the model."""
+    if not bodies:
+        return {}
+    predictions = get_category_classifier().predict(list(bodies.values()))
+    return {body_hash: title for body_hash, (title, confidence) in zip(bodies, predictions)
+            if title is not None and confidence >= threshold}
+
+
+def categorize_posts(post_ids: list[int], cache: PostCategorizationRedis = None) -> int:
+    """
+    Set the category of the posts, bodies already classified are read from the cache, the local classifier
+    answers the ones it is confident about and identical bodies are sent to the model once. Only model answers
+    are cached. Returns the number of categorized posts.
+    """
+    from post.models import Category, Post
+
+    cache = cache or PostCategorizationRedis()
+    categories = dict(Category.objects.values_list('title', 'id'))
+    posts = list(Post.objects.filter(id__in=post_ids).only('id', 'body', 'body_hash'))
+    if not categories or not posts:
+        return 0
+    body_hashes = {post.id: post.body_hash or hash_post_body(post.body) for post in posts}
+
+    try:
+        results = cache.get_cached(list(set(body_hashes.values())))
+    except RedisError as exc:
+        logger.warning('Category cache is unavailable: %s', exc)
+        results = {}
+    results = {body_hash: title for body_hash, title in results.items() if title in categories}
+    pending = {body_hashes[post.id]: post.body for post in posts if body_hashes[post.id] not in results}
+    local = {}
+    if settings.POST_CATEGORIZATION['LOCAL_CLASSIFIER']:
+        local = classify_bodies_locally(pending, settings.POST_CATEGORIZATION['LOCAL_THRESHOLD'])
+        local = {body_hash: title for body_hash, title in local.items() if title in categories}
+        results.update(local)
+        pending = {body_hash: body for body_hash, body in pending.items() if body_hash not in results}
+    classified = classify_bodies(pending, list(categories), settings.POST_CATEGORIZATION['BATCH_SIZE'])
+    try:
+        cache.set_cached(classified, settings.POST_CATEGORIZATION['CACHE_TTL'])
+    except RedisError as exc:
+        logger.warning('Category cache is unavailable: %s', exc)
+    results.update(classified)
+
+    categorized = [post.id for post in posts if body_hashes[post.id] in results]
+    through = Post.category.through
+    through.objects.filter(post_id__in=categorized).delete()
+    through.objects.bulk_create([through(post_id=post_id, category_id=categories[results[body_hashes[post_id]]])
+                                 for post_id in categorized])
+    # cached answers came from the model too
+    locally = [post_id for post_id in categorized if body_hashes[post_id] in local]
+    Post.objects.filter(id__in=locally).update(category_source='local')
+    Post.objects.filter(id__in=set(categorized) - set(locally)).update(category_source='model')
+    return len(categorized)
+
+
+def categorize_pending_posts(queue: PostCategorizationRedis = None, batch_size: int = None,
+                             max_batches: int = None) -> int:
+    """
+    Categorize the queued posts `batch_size` at a time, returns the number of categorized posts. The posts of a
+    failing batch are queued for the next run, posts failing `MAX_ATTEMPTS` runs go to the dead letter set, and
+    the other batches go on.
+    """
+    queue = queue or PostCategorizationRedis()
+    batch_size = batch_size or settings.POST_CATEGORIZATION['BATCH_SIZE']
+    max_batches = max_batches or settings.POST_CATEGORIZATION['MAX_BATCHES']
+
+    categorized, failed = 0, []
+    for _ in range(max_batches):
+        post_ids = queue.pop_pending(batch_size)
+        if not post_ids:
+            break
+        try:
+            categorized += categorize_posts(post_ids, cache=queue)
+        except Exception:
+            # the model call is the usual suspect, the posts are queued again once this run is over
+            logger.exception('Could not categorize posts %s', post_ids)
+            failed.extend(post_ids)
+        else:
+            queue.clear_attempts(post_ids)
+        if len(post_ids) < batch_size:
+            break
+    if failed:
+        dead = queue.record_failure(failed, settings.POST_CATEGORIZATION['MAX_ATTEMPTS'])
+        if dead:
+            logger.error('Gave up categorizing posts %s', dead)
+    return categorized
@@ -0,0 +1,111 @@
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class CategoryClassifier:
+    """
+    Nearest-centroid classifier over signed hashed n-gram vectors: words, word bigrams and character trigrams
+    are hashed into `dimensions` buckets, every category is the normalized mean of its training vectors and
+    a text gets the category of the most similar centroid.
+    """
+
+    def __init__(self, dimensions: int = 2 ** 14):
+        self.dimensions = dimensions
+        self.labels = []
+        self.centroids = np.zeros((0, dimensions), dtype=np.float32)
+
+    @staticmethod
+    def features(text: str) -> list[str]:
+        words = WORD_PATTERN.findall(text.lower())
+        features = [f'w:{word}' for word in words]
+        features += [f'b:{first} {second}' for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f' {word} '
+            features += [f'c:{padded[index:index + 3]}' for index in range(len(padded) - 2)]
+        return features
+
+    def vectorize(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                hashed = zlib.crc32(feature.encode())
+                vectors[row, hashed % self.dimensions] += 1.0 if hashed & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def fit(self, texts: list[str], labels: list[str]) -> 'CategoryClassifier':
+        vectors = self.vectorize(texts)
+        self.labels = sorted(set(labels))
+        label_index = {label: index for index, label in enumerate(self.labels)}
+        centroids = np.zeros((len(self.labels), self.dimensions), dtype=np.float32)
+        np.add.at(centroids, [label_index[label] for label in labels], vectors)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+        return self
+
+    def predict(self, texts: list[str]) -> list[tuple[str | None, float]]:
+        """
+        (label, confidence) of every text, confidence is the margin between the similarity to the best and
+        the second best centroid, 0 when the classifier knows less than two labels.
+        """
+        if len(self.labels) < 2 or not texts:
+            return [(self.labels[0] if self.labels else None, 0.0) for _ in texts]
+        similarities = self.vectorize(texts) @ self.centroids.T
+        best_two = np.argsort(-similarities, axis=1)[:, :2]
+        rows = np.arange(len(texts))
+        margins = similarities[rows, best_two[:, 0]] - similarities[rows, best_two[:, 1]]
+        return [(self.labels[best], float(margin)) for best, margin in zip(best_two[:, 0], margins)]
+
+
+def category_samples() -> list[tuple[str, str]]:
+    """(title and description, title) of every category, so categories without posts are known too."""
+    from post.models import Category
+
+    return [(f'{title} {description or ""}', title)
+            for title, description in Category.objects.values_list('title', 'description')]
+
+
+def categorized_post_samples(limit: int, sources=('model', 'curated')) -> list[tuple[str, str]]:
+    """
+    (body, category title) of the `limit` latest posts categorized by `sources`. Labels of the local classifier
+    itself are left out, it would otherwise learn its own mistakes.
+    """
+    from post.models import Post
+
+    categorized = Post.category.through.objects.filter(post__category_source__in=sources).order_by('-post_id')
+    return list(categorized[:limit].values_list('post__body', 'category__title'))
+
+
+def training_set(limit: int) -> tuple[list[str], list[str]]:
+    samples = category_samples() + categorized_post_samples(limit)
+    return [text for text, _ in samples], [label for _, label in samples]
+
+
+_classifier = None
+_trained_at = 0.0
+_lock = threading.Lock()
+
+
+def get_category_classifier() -> CategoryClassifier:
+    """The classifier of this worker process, retrained every `LOCAL_RETRAIN_INTERVAL` seconds."""
+    global _classifier, _trained_at
+    retrain_interval = settings.POST_CATEGORIZATION['LOCAL_RETRAIN_INTERVAL']
+    with _lock:
+        if _classifier is None or time.monotonic() - _trained_at > retrain_interval:
+            texts, labels = training_set(settings.POST_CATEGORIZATION['LOCAL_TRAINING_POSTS'])
+            _classifier = CategoryClassifier().fit(texts, labels)
+            _trained_at = time.monotonic()
+        return _classifier
+
+
+def reset_category_classifier() -> None:
+    global _classifier
+    with _lock:
+        _classifier = None
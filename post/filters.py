@@ -2,6 +2,7 @@ import datetime
 
 import django_filters
 from django.db.models import Q
+from rest_framework.filters import SearchFilter
 from rest_framework_gis.filters import InBBoxFilter
 from django.utils import timezone
 
@@ -14,11 +15,16 @@ class ListPostFilter(django_filters.FilterSet):
     hashtag_title = django_filters.CharFilter(method='hashtag_comment_or_post')
     from_days = django_filters.NumberFilter(method='from_days_method')
     is_seen = django_filters.BooleanFilter()
+    geohash = django_filters.CharFilter(method='geohash_prefix_method')
 
     def hashtag_comment_or_post(self, queryset, name, value):
         return (queryset.filter(hashtags__hashtag_title=value) |
                 queryset.filter(comment_post__hashtags__hashtag_title=value))
 
+    def geohash_prefix_method(self, queryset, name, value):
+        prefixes = [prefix.strip().lower() for prefix in value.split(',') if prefix.strip()]
+        return Post.objects.filter_geohash_prefixes(prefixes, queryset)
+
     def from_days_method(self, queryset, name, value):
         try:
             value = int(value)
@@ -29,5 +35,20 @@ class ListPostFilter(django_filters.FilterSet):
 
     class Meta:
         model = Post
-        fields = ['address_id', 'hashtag_title', 'from_days', 'category', 'is_seen']
+        fields = ['address_id', 'hashtag_title', 'from_days', 'category', 'is_seen', 'geohash']
         search_fields = ['title', 'body']
+
+
+class PostSearchFilter(SearchFilter):
+    """
+    `?search=` over the full-text index of posts instead of `icontains` scans, `?fuzzy=true` also matches similar
+    titles. Results are ordered by rank unless the view sets `search_ranked = False`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        return Post.objects.search(text, posts=queryset,
+                                   fuzzy=request.query_params.get('fuzzy', '').lower() == 'true',
+                                   ranked=getattr(view, 'search_ranked', True))
@@ -0,0 +1,88 @@
+import random
+import time
+import uuid
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from NeighborsHub.openai_manager import StubPostsCategories
+from NeighborsHub.redis_management import PostCategorizationRedis
+from post.categorization import categorize_pending_posts, classify_bodies, hash_post_body
+from post.models import Category, Post
+
+WORDS = ('neighbor', 'street', 'party', 'lost', 'cat', 'garden', 'sale', 'bike', 'noise', 'school', 'market',
+         'repair', 'water', 'concert', 'help', 'tonight', 'weekend', 'free', 'park', 'library')
+CATEGORIES = ('sport', 'music', 'sale', 'lost and found', 'help', 'event')
+
+
+class Command(BaseCommand):
+    help = ('Compare categorizing posts one model call each with the shipped pipeline, `categorize_pending_posts` '
+            'on a Redis queue and cache, offline against the stub model. The posts and categories are written in '
+            'a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=0.2, help='seconds per stub model call')
+        parser.add_argument('--duplicates', type=float, default=0.2, help='share of posts repeating a body')
+        parser.add_argument('--local-classifier', action='store_true', help='let the local classifier answer')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        bodies = []
+        for _ in range(options['posts']):
+            if bodies and rng.random() < options['duplicates']:
+                bodies.append(rng.choice(bodies))
+            else:
+                bodies.append(' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))))
+
+        calls = []
+
+        def stub_categorizer(categories, texts):
+            calls.append(len(texts))
+            return StubPostsCategories(categories, texts, latency=options['latency'])
+
+        categorization = {**settings.POST_CATEGORIZATION, 'LOCAL_CLASSIFIER': options['local_classifier']}
+        with patch('post.categorization.get_posts_categorizer', stub_categorizer), \
+                override_settings(POST_CATEGORIZATION=categorization):
+            started = time.perf_counter()
+            for body in bodies:
+                classify_bodies({hash_post_body(body): body}, list(CATEGORIES), batch_size=1)
+            self.report('one call per post', len(bodies), len(calls), time.perf_counter() - started)
+
+            calls.clear()
+            elapsed, categorized = self.run_pipeline(bodies, options['batch_size'])
+            self.report('shipped pipeline', categorized, len(calls), elapsed)
+
+    @staticmethod
+    def run_pipeline(bodies, batch_size):
+        key_prefix = f'PostCategory/benchmark/{uuid.uuid4().hex}'
+        queue = PostCategorizationRedis(key_prefix=key_prefix)
+        with transaction.atomic():
+            for title in CATEGORIES:
+                Category.objects.get_or_create(title=title, defaults={'internal_code': title})
+            # bulk_create skips `Post.save`, which would queue the posts on the real queue
+            posts = Post.objects.bulk_create([
+                Post(title=f'benchmark {index}', body=body, body_hash=hash_post_body(body))
+                for index, body in enumerate(bodies)
+            ])
+            try:
+                queue.push_pending([post.id for post in posts])
+                started = time.perf_counter()
+                categorized = categorize_pending_posts(queue, batch_size=batch_size,
+                                                       max_batches=len(posts) // batch_size + 1)
+                elapsed = time.perf_counter() - started
+            finally:
+                keys = queue.connection.keys(f'{key_prefix}/*')
+                if keys:
+                    queue.connection.delete(*keys)
+                transaction.set_rollback(True)
+        return elapsed, categorized
+
+    def report(self, name, posts, calls, elapsed):
+        self.stdout.write(f'{name:>20}: {posts} posts, {calls} model calls, {elapsed:.2f}s, '
+                          f'{posts / elapsed:.1f} posts/s')
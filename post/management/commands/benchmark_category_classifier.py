@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from post.classifier import CategoryClassifier, category_samples, categorized_post_samples
+
+
+class Command(BaseCommand):
+    help = ('Train the local category classifier on model and curated labels, evaluate it on a held out share of '
+            'the curated posts and report precision, coverage and latency at the escalation threshold.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=settings.POST_CATEGORIZATION['LOCAL_TRAINING_POSTS'])
+        parser.add_argument('--holdout', type=float, default=0.2)
+        parser.add_argument('--threshold', type=float, default=settings.POST_CATEGORIZATION['LOCAL_THRESHOLD'])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        curated = categorized_post_samples(options['limit'], sources=('curated',))
+        random.Random(options['seed']).shuffle(curated)
+        test_size = int(len(curated) * options['holdout'])
+        # category titles and descriptions always stay in the training share, labels of the local classifier are
+        # never used, the test set only holds labels picked by hand
+        train = category_samples() + categorized_post_samples(options['limit'], sources=('model',))
+        train, test = train + curated[test_size:], curated[:test_size]
+        if not test:
+            raise CommandError('Not enough curated posts to hold out a test set, categorize some in the admin')
+
+        started = time.perf_counter()
+        classifier = CategoryClassifier().fit([text for text, _ in train], [label for _, label in train])
+        train_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        predictions = classifier.predict([text for text, _ in test])
+        predict_time = time.perf_counter() - started
+
+        confident = [(label, predicted) for (_, label), (predicted, confidence) in zip(test, predictions)
+                     if confidence >= options['threshold']]
+        accuracy = sum(label == predicted for (_, label), (predicted, _) in zip(test, predictions)) / len(test)
+        precision = sum(label == predicted for label, predicted in confident) / len(confident) if confident else 0
+        self.stdout.write(f'trained on {len(train)} texts in {train_time * 1000:.1f}ms, '
+                          f'tested on {len(test)} curated posts')
+        self.stdout.write(f'accuracy: {accuracy:.3f}')
+        self.stdout.write(f'threshold {options["threshold"]}: precision {precision:.3f}, '
+                          f'answered locally {len(confident) / len(test):.1%}, '
+                          f'escalated to the model {1 - len(confident) / len(test):.1%}')
+        self.stdout.write(f'latency: {predict_time / len(test) * 1e6:.1f}us per post')
+        for category in classifier.labels:
+            answered = [label for label, predicted in confident if predicted == category]
+            if answered:
+                self.stdout.write(f'  {category}: precision {answered.count(category) / len(answered):.3f} '
+                                  f'on {len(answered)} posts')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from post.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute the like/comment/seen counters stored on posts and repair the drifted ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = Post.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        repaired = 0
+        for start in range(0, last_id + 1, chunk_size):
+            repaired += Post.objects.reconcile_counters(Post.objects.filter(id__gte=start, id__lt=start + chunk_size))
+        self.stdout.write(self.style.SUCCESS(f'Repaired counters of {repaired} posts'))
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2024-06-02 09:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0009_userseenpost'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userseenpost',
+            name='first_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='userseenpost',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
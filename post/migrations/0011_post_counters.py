@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2024-06-08 10:17
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('post', 'Post')
+    LikePost = apps.get_model('post', 'LikePost')
+    Comment = apps.get_model('post', 'Comment')
+    UserSeenPost = apps.get_model('post', 'UserSeenPost')
+
+    def count_of(model, **filters):
+        rows = model.objects.filter(post_id=OuterRef('pk'), **filters).order_by().values('post_id')
+        return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count')), 0)
+
+    Post.objects.update(
+        support_count=count_of(LikePost, type='support'),
+        like_count=count_of(LikePost, type='like'),
+        dislike_count=count_of(LikePost, type='dislike'),
+        comment_count=count_of(Comment),
+        seen_count=count_of(UserSeenPost),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0010_alter_userseenpost_first_seen_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='dislike_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='seen_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='support_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
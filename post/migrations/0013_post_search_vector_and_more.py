@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2024-06-21 14:08
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def fill_search_vector(apps, schema_editor):
+    from django.conf import settings
+
+    Post = apps.get_model('post', 'Post')
+    config = settings.POST_SEARCH['CONFIG']
+    Post.objects.update(search_vector=SearchVector('title', weight='A', config=config) +
+                        SearchVector('body', weight='B', config=config))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0012_post_body_hash'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_post_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='post_post_title_trgm_gin', opclasses=['gin_trgm_ops']),
+        ),
+    ]
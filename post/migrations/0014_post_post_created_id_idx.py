@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2024-06-25 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0013_post_search_vector_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='post_post_created_id_idx'),
+        ),
+    ]
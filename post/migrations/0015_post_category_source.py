@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2024-07-08 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0014_post_post_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='category_source',
+            field=models.CharField(blank=True, choices=[('model', 'Model'), ('local', 'Local classifier'),
+                                                        ('curated', 'Curated')], max_length=10, null=True),
+        ),
+    ]
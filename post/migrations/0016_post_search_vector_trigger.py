@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2024-07-09 16:03
+
+import re
+
+from django.db import migrations
+
+
+def create_trigger(apps, schema_editor):
+    from django.conf import settings
+
+    config = settings.POST_SEARCH['CONFIG']
+    if not re.fullmatch(r'\w+', config):
+        raise ValueError(f'Invalid text search configuration {config!r}')
+    schema_editor.execute(f"""
+        CREATE OR REPLACE FUNCTION post_post_search_vector() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := setweight(to_tsvector('{config}', coalesce(NEW.title, '')), 'A') ||
+                                 setweight(to_tsvector('{config}', coalesce(NEW.body, '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    # every insert and the updates writing the title or body, counter updates leave the vector alone
+    schema_editor.execute("""
+        CREATE TRIGGER post_post_search_vector BEFORE INSERT OR UPDATE OF title, body, search_vector ON post_post
+        FOR EACH ROW EXECUTE FUNCTION post_post_search_vector()
+    """)
+    # rows written by queryset updates and bulk_create since the vector was filled from `Post.save`
+    schema_editor.execute("UPDATE post_post SET search_vector = NULL")
+
+
+def drop_trigger(apps, schema_editor):
+    schema_editor.execute("DROP TRIGGER IF EXISTS post_post_search_vector ON post_post")
+    schema_editor.execute("DROP FUNCTION IF EXISTS post_post_search_vector()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0015_post_category_source'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
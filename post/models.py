@@ -1,26 +1,107 @@
 import re
 
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.gis.geos import Point
 from django.contrib.gis.db.models.functions import Distance
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
-from NeighborsHub.utils import is_testing
+from NeighborsHub.gis import meters_to_degrees
 from albums.models import Media
 from core.models import BaseModel, Hashtag
-from NeighborsHub.celery import app as celery_app
-from post.task import celery_get_category_post
+from core.utils import record_hashtag_usage
+from post.categorization import enqueue_post_categorization, hash_post_body
 from users.models import Address
 
 
 class PostManager(models.Manager):
-    def filter_post_distance_of_location(self, location_point: Point, to_distance=None, from_distance=None):
-        posts = self.annotate(distance=Distance(
+    @staticmethod
+    def _filter_distance(posts, location_point: Point, to_distance=None, from_distance=None):
+        if to_distance:
+            # index-assisted bounding prefilter, the exact distance is only computed for the remaining rows
+            radius = meters_to_degrees(float(to_distance), location_point)
+            posts = posts.filter(address__location__dwithin=(location_point, radius)) if radius else posts
+        posts = posts.annotate(distance=Distance(
             'address__location', location_point, output_field=models.FloatField()))
         posts = posts.filter(distance__lte=to_distance) if to_distance else posts
         posts = posts.filter(distance__gte=from_distance) if from_distance else posts
         return posts
 
+    def filter_post_distance_of_location(self, location_point: Point, to_distance=None, from_distance=None):
+        return self._filter_distance(self.all(), location_point, to_distance, from_distance)
+
+    def filter_geohash_prefixes(self, prefixes, posts=None):
+        """Posts whose address lies in any of the geohash cells, each prefix is an index range scan."""
+        posts = self.all() if posts is None else posts
+        condition = models.Q()
+        for prefix in prefixes:
+            condition |= models.Q(address__geohash__startswith=prefix)
+        return posts.filter(condition) if prefixes else posts
+
+    @staticmethod
+    def search_query(text: str):
+        """Query matching posts containing every word of `text`, the last one also as a prefix of a longer word."""
+        words = re.findall(r'\w+', text.lower())
+        if not words:
+            return None
+        terms = [f"'{word}'" for word in words[:-1]] + [f"'{words[-1]}':*"]
+        return SearchQuery(' & '.join(terms), search_type='raw', config=settings.POST_SEARCH['CONFIG'])
+
+    def search(self, text: str, posts=None, fuzzy=False, ranked=True):
+        """
+        Posts matching `text` through the GIN indexed `search_vector`, with `fuzzy` titles similar to `text` match
+        too. `ranked` annotates `search_rank` and orders by it.
+        """
+        posts = self.all() if posts is None else posts
+        query = self.search_query(text)
+        if query is None:
+            return posts
+        condition = models.Q(search_vector=query)
+        if fuzzy:
+            # `%` operator, served by the trigram index with the `pg_trgm.similarity_threshold` cut off
+            condition |= models.Q(title__trigram_similar=text)
+        posts = posts.filter(condition)
+        if ranked:
+            # ts_rank is a float4, as a float8 the rank a keyset cursor stores compares equal to it
+            search_rank = Cast(SearchRank(F('search_vector'), query), models.FloatField())
+            posts = posts.annotate(search_rank=search_rank).order_by('-search_rank', '-id')
+        return posts
+
+    def update_counters(self, post_ids, **deltas):
+        """Atomically shift the denormalized counters of posts, e.g. `update_counters([1], like_count=1)`."""
+        deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        return self.filter(id__in=post_ids).update(**deltas) if deltas else 0
+
+    @staticmethod
+    def counter_expressions():
+        """Counters computed from the source tables, used to repair drift of the stored ones."""
+        def count_of(model, **filters):
+            rows = model.objects.filter(post_id=OuterRef('pk'), **filters).order_by().values('post_id')
+            return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count')), 0)
+
+        counters = {f'{like_type}_count': count_of(LikePost, type=like_type) for like_type, _ in Like.LIKE_CHOICES}
+        counters['comment_count'] = count_of(Comment)
+        counters['seen_count'] = count_of(UserSeenPost)
+        return counters
+
+    def reconcile_counters(self, posts=None):
+        """Rewrite the counters of the drifted posts among `posts`, returns the number of repaired posts."""
+        posts = self.all() if posts is None else posts
+        counters = self.counter_expressions()
+        drifted = models.Q()
+        for field in counters:
+            drifted |= ~models.Q(**{field: F(f'real_{field}')})
+        drifted_ids = list(posts.annotate(**{f'real_{field}': expression for field, expression in counters.items()})
+                           .filter(drifted).values_list('id', flat=True))
+        if drifted_ids:
+            self.filter(id__in=drifted_ids).update(**counters)
+        return len(drifted_ids)
+
     def filter_post_location(self, post_location: Point):
         return self.filter(address__location=post_location)
 
@@ -28,12 +109,7 @@ class PostManager(models.Manager):
         posts = self.filter(address__isnull=False)
         posts = posts.filter(address__location=post_location) if post_location is not None else posts
         if user_location is not None:
-            posts = posts.annotate(distance=Distance(
-                'address__location', user_location, output_field=models.FloatField())
-            )
-
-            posts = posts.filter(distance__lte=to_distance) if to_distance else posts
-            posts = posts.filter(distance__gte=from_distance) if from_distance else posts
+            posts = self._filter_distance(posts, user_location, to_distance, from_distance)
         return posts
 
 
@@ -44,25 +120,62 @@ class Post(BaseModel):
     media = models.ManyToManyField(Media, null=True, blank=True, related_name='post')
     address = models.ForeignKey(Address, null=True, blank=True,
                                 related_name='post_address', on_delete=models.SET_NULL)
+    CATEGORY_SOURCE_CHOICES = (
+        ('model', 'Model'),
+        ('local', 'Local classifier'),
+        ('curated', 'Curated'),
+    )
     category = models.ManyToManyField('Category', verbose_name=_('category'), blank=True)
+    # who labeled `category`, the local classifier only learns from the model and curated labels
+    category_source = models.CharField(max_length=10, choices=CATEGORY_SOURCE_CHOICES, null=True, blank=True)
+    # sha256 of `body`, categorization only runs again when it changes and is cached by it
+    body_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # denormalized counters, kept in step by the like/comment/seen writers and `reconcile_post_counters`
+    support_count = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+    dislike_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+    seen_count = models.IntegerField(default=0)
+    # weighted tsvector of title (A) and body (B), maintained by the `post_post_search_vector` trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    counter_fields = ('support_count', 'like_count', 'dislike_count', 'comment_count', 'seen_count')
 
     objects = PostManager()
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='post_post_search_vector_gin'),
+            GinIndex(fields=['title'], name='post_post_title_trgm_gin', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['-created_at', '-id'], name='post_post_created_id_idx'),
+        ]
+
+    @property
+    def likes_summary(self):
+        likes = [{'type': like_type, 'count': getattr(self, f'{like_type}_count')} for like_type, _ in Like.LIKE_CHOICES]
+        return [like for like in likes if like['count']]
+
     def extract_hashtags(self):
         hashtags = re.findall(r'#(\w+)', self.body)
         return hashtags
 
     def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # the counters are only written by `update_counters`, saving their stale in-memory values would undo
+            # concurrent increments
+            skipped = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.attname not in skipped]
+        body_hash = hash_post_body(self.body)
+        body_changed = body_hash != self.body_hash
+        self.body_hash = body_hash
         super().save(*args, **kwargs)
-        if not is_testing():
-            celery_get_category_post.s(self.id,).apply_async()
-
-        hashtags = [hashtag.lower() for hashtag in self.extract_hashtags()]
-        self.posthashtag_set.exclude(hashtag__hashtag_title__in=hashtags).delete()
-        for tag in hashtags:
-            hashtag, created = Hashtag.objects.get_or_create(hashtag_title=tag)
-            self.hashtags.add(hashtag)
+        if body_changed:
+            # the categorization beat task must find the post once it pops its id
+            transaction.on_commit(lambda: enqueue_post_categorization(self.id))
 
+        added = self.sync_hashtags(hashtag.lower() for hashtag in self.extract_hashtags())
+        record_hashtag_usage(added)
 
     def __str__(self):
         return (f"Post(id={self.id}, title={self.title}, state={self.state},"
@@ -70,6 +183,32 @@ class Post(BaseModel):
                 f" created_by={self.created_by}, updated_by={self.updated_by})")
 
 
+class CommentManager(models.Manager):
+    def thread_of(self, root_ids, max_depth, replies_limit):
+        """
+        Replies under the `root_ids` comments down to `max_depth` levels in a single recursive query, keeping
+        the oldest `replies_limit` replies of every comment. Every reply carries its `depth`, roots are depth 0.
+        """
+        if not root_ids:
+            return []
+        table = self.model._meta.db_table
+        return list(self.raw(f"""
+            WITH RECURSIVE thread AS (
+                SELECT reply.*, 1 AS depth FROM {table} reply WHERE reply.reply_to_id = ANY(%s)
+                UNION ALL
+                SELECT reply.*, thread.depth + 1 FROM {table} reply
+                JOIN thread ON reply.reply_to_id = thread.id
+                WHERE thread.depth < %s
+            )
+            SELECT * FROM (
+                SELECT thread.*, ROW_NUMBER() OVER (PARTITION BY thread.reply_to_id ORDER BY thread.id) AS position
+                FROM thread
+            ) ranked
+            WHERE ranked.position <= %s
+            ORDER BY ranked.depth, ranked.id
+        """, [list(root_ids), max_depth, replies_limit]))
+
+
 class Comment(BaseModel):
     body = models.TextField()
     hashtags = models.ManyToManyField(Hashtag, blank=True, through='CommentHashtag')
@@ -77,6 +216,8 @@ class Comment(BaseModel):
     post = models.ForeignKey(Post, on_delete=models.DO_NOTHING, related_name='comment_post')
     reply_to = models.ForeignKey('self', on_delete=models.DO_NOTHING, null=True, blank=True)
 
+    objects = CommentManager()
+
     def extract_hashtags(self):
         hashtags = re.findall(r'#(\w+)', self.body)
         return hashtags
@@ -84,11 +225,8 @@ class Comment(BaseModel):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
-        hashtags = [hashtag.lower() for hashtag in self.extract_hashtags()]
-        self.commenthashtag_set.exclude(hashtag__hashtag_title__in=hashtags).delete()
-        for tag in hashtags:
-            hashtag, created = Hashtag.objects.get_or_create(hashtag_title=tag)
-            self.hashtags.add(hashtag)
+        added = self.sync_hashtags(hashtag.lower() for hashtag in self.extract_hashtags())
+        record_hashtag_usage(added)
 
     def __str__(self):
         return (f"Comment(id={self.id}, body={self.body}, state={self.state},"
@@ -113,9 +251,31 @@ class Like(BaseModel):
         abstract = True
 
 
+class LikePostManager(models.Manager):
+    def set_user_like(self, user, post_id, like_type=None):
+        """
+        Replace the likes of `user` on the post with a single `like_type` one, or just remove them when it is
+        None, and shift the post counters by the difference.
+        """
+        with transaction.atomic():
+            previous = list(self.select_for_update().filter(post_id=post_id, created_by=user).values_list('id', 'type'))
+            self.filter(id__in=[like_id for like_id, _ in previous]).delete()
+            deltas = {}
+            for _, previous_type in previous:
+                deltas[f'{previous_type}_count'] = deltas.get(f'{previous_type}_count', 0) - 1
+            like = None
+            if like_type is not None:
+                like = self.create(created_by=user, updated_by=user, post_id=post_id, type=like_type)
+                deltas[f'{like_type}_count'] = deltas.get(f'{like_type}_count', 0) + 1
+            Post.objects.update_counters([post_id], **deltas)
+        return like
+
+
 class LikePost(Like):
     post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name='post_likes')
 
+    objects = LikePostManager()
+
 
 class LikeComment(Like):
     comment = models.ForeignKey('Comment', on_delete=models.CASCADE, related_name='comment_likes')
@@ -150,12 +310,55 @@ class Category(BaseModel):
         return f"Category(title={self.title} , parent_id={self.parent_id}, created_at={self.created_at})"
 
 
+class UserSeenPostManager(models.Manager):
+    def bulk_mark_seen(self, user_id, post_ids, seen_at=None):
+        seen_at = seen_at or timezone.now()
+        return self.bulk_upsert({(user_id, post_id): (seen_at, seen_at) for post_id in post_ids})
+
+    def bulk_upsert(self, seen_events: dict) -> int:
+        """
+        Insert or refresh `last_seen` of every (user_id, post_id) key of `seen_events` with a single upsert,
+        values are (first_seen, last_seen) pairs. Pairs the upsert inserted rather than updated, `xmax = 0`, are
+        added to `Post.seen_count`. Returns the number of upserted rows.
+        """
+        if not seen_events:
+            return 0
+        user_ids = [user_id for user_id, _ in seen_events]
+        post_ids = [post_id for _, post_id in seen_events]
+        first_seen = [first for first, _ in seen_events.values()]
+        last_seen = [last for _, last in seen_events.values()]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {self.model._meta.db_table} (user_id, post_id, first_seen, last_seen)
+                SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::timestamptz[], %s::timestamptz[])
+                ON CONFLICT (user_id, post_id) DO UPDATE SET last_seen = EXCLUDED.last_seen
+                RETURNING post_id, xmax = 0
+            """, [user_ids, post_ids, first_seen, last_seen])
+            upserted = cursor.fetchall()
+            self.increment_seen_counts([post_id for post_id, inserted in upserted if inserted])
+        return len(upserted)
+
+    @staticmethod
+    def increment_seen_counts(post_ids):
+        # posts gaining the same number of viewers share one update, usually there is a single group
+        new_viewers = {}
+        for post_id in post_ids:
+            new_viewers[post_id] = new_viewers.get(post_id, 0) + 1
+        by_delta = {}
+        for post_id, delta in new_viewers.items():
+            by_delta.setdefault(delta, []).append(post_id)
+        for delta, delta_post_ids in by_delta.items():
+            Post.objects.update_counters(delta_post_ids, seen_count=delta)
+
+
 class UserSeenPost(models.Model):
     user = models.ForeignKey('users.CustomerUser', on_delete=models.CASCADE, related_name='seen_posts',
                              verbose_name=_('user'))
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='user_seen_posts')
-    first_seen = models.DateTimeField(auto_now_add=True)
-    last_seen = models.DateTimeField(auto_now=True)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    objects = UserSeenPostManager()
 
     class Meta:
         unique_together = ('user', 'post')
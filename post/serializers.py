@@ -1,9 +1,10 @@
 from django.core.validators import FileExtensionValidator
-from django.db.models import Count
+from django.db import models
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeoModelSerializer, GeometryField
 
-from albums.models import Media
+from albums.models import Media, UserAvatar
 from albums.serializers import MediaSerializer
 from chat.models import ChatRoom
 from post.models import Post, Comment, Like, LikePost, Category, UserSeenPost
@@ -110,6 +111,43 @@ class PostSerializer(serializers.ModelSerializer):
                   'created_at', 'address_id', 'category')
 
 
+class PostFeedListSerializer(serializers.ListSerializer):
+    """
+    Serializes a page of posts with a fixed number of queries: the viewer's own like and the common
+    direct chat rooms are fetched once for the whole page and handed to the child serializer through
+    the context. Like counts are read from the counters stored on the post.
+    """
+
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.Manager) else data)
+        self.context.update(self.get_feed_context(posts))
+        return super().to_representation(posts)
+
+    def get_feed_context(self, posts):
+        user = self.context['request'].user
+        post_ids = [post.id for post in posts]
+
+        user_likes, common_chats = {}, {}
+        if user is not None:
+            # oldest first, the latest like of a post overwrites the earlier ones in the dict
+            user_likes = dict(LikePost.objects.filter(post_id__in=post_ids, created_by=user)
+                              .order_by('id').values_list('post_id', 'type'))
+            if 'common_chat' in self.child.fields:
+                common_chats = self.get_common_chat_rooms(user, {post.created_by_id for post in posts})
+
+        return {'feed_user_likes': user_likes, 'feed_common_chats': common_chats}
+
+    @staticmethod
+    def get_common_chat_rooms(user, member_ids):
+        memberships = ChatRoom.member.through.objects.filter(
+            chatroom__type='direct', chatroom__member=user, customeruser_id__in=member_ids
+        ).order_by('chatroom_id').values_list('customeruser_id', 'chatroom__room_id')
+        common_chats = {}
+        for member_id, room_id in memberships:
+            common_chats.setdefault(member_id, room_id)
+        return common_chats
+
+
 class MyListPostSerializer(serializers.ModelSerializer):
     created_by = UserPublicSerializer(read_only=True)
     address = AddressSerializer(read_only=True)
@@ -119,19 +157,31 @@ class MyListPostSerializer(serializers.ModelSerializer):
     likes = serializers.SerializerMethodField('get_likes_count')
     user_liked = serializers.SerializerMethodField('get_is_user_like')
     category = ListCategorySerializer(many=True, read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
+    seen_count = serializers.IntegerField(read_only=True)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        queryset = queryset.select_related('created_by', 'address__city')
+        return queryset.prefetch_related(
+            'media', 'category',
+            Prefetch('created_by__avatar', queryset=UserAvatar.objects.order_by('id')),
+        )
 
     def get_likes_count(self, obj):
-        res = LikePost.objects.filter(post_id=obj.id).values('type').annotate(count=Count('type'))
-        res = res.values('type', 'count')
-        return res
+        return obj.likes_summary
 
     def get_is_user_like(self, obj):
+        if 'feed_user_likes' in self.context:
+            return self.context['feed_user_likes'].get(obj.id)
         res = LikePost.objects.filter(post_id=obj.id, created_by=self.context['request'].user).first()
         return res.type if res else None
 
     class Meta:
         model = Post
-        fields = ('id', 'created_by', 'address', 'body', 'title', 'media', 'likes', 'user_liked', 'category')
+        fields = ('id', 'created_by', 'address', 'body', 'title', 'media', 'likes', 'user_liked', 'category',
+                  'comment_count', 'seen_count')
+        list_serializer_class = PostFeedListSerializer
 
 
 class PublicListPostSerializer(MyListPostSerializer):
@@ -140,6 +190,8 @@ class PublicListPostSerializer(MyListPostSerializer):
     common_chat = serializers.SerializerMethodField('get_common_chat_room')
 
     def get_common_chat_room(self, obj):
+        if 'feed_common_chats' in self.context:
+            return self.context['feed_common_chats'].get(obj.created_by_id)
         chat_room = ChatRoom.objects.filter(type='direct', member=self.context['request'].user)
         chat_room = chat_room.filter(member=obj.created_by).first()
         return chat_room.room_id if chat_room else None
@@ -147,7 +199,8 @@ class PublicListPostSerializer(MyListPostSerializer):
     class Meta:
         model = Post
         fields = ('id', 'created_by', 'address', 'body', 'title', 'media', 'distance', 'likes', 'user_liked',
-                  'category', 'is_seen', 'common_chat')
+                  'category', 'comment_count', 'seen_count', 'is_seen', 'common_chat')
+        list_serializer_class = PostFeedListSerializer
 
 
 class ListCountLocationPostsSerializer(GeoModelSerializer):
@@ -159,6 +212,16 @@ class ListCountLocationPostsSerializer(GeoModelSerializer):
         fields = ('posts_count', 'location')
 
 
+class ClusterLocationPostsParamsSerializer(serializers.Serializer):
+    zoom = serializers.IntegerField(required=False, min_value=0, max_value=22)
+    precision = serializers.IntegerField(required=False, min_value=1, max_value=12)
+
+
+class ListClusterLocationPostsSerializer(serializers.Serializer):
+    posts_count = serializers.IntegerField(read_only=True)
+    location = GeometryField(read_only=True)
+
+
 class CommentSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
@@ -174,21 +237,59 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ('id', 'body', 'created_at', 'created_by', 'updated_at')
 
 
+class CommentThreadListSerializer(serializers.ListSerializer):
+    """
+    Serializes a page of root comments with their replies fetched in one query, the thread is assembled in
+    memory and handed to the child serializer through the context.
+    """
+    default_depth = 10
+    default_replies_limit = 50
+
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, models.Manager) else data)
+        if 'comment_replies' not in self.context:
+            self.context['comment_replies'] = self.get_replies_map(comments)
+        return super().to_representation(comments)
+
+    def get_replies_map(self, roots):
+        replies = Comment.objects.thread_of([root.id for root in roots],
+                                            self.context.get('thread_depth', self.default_depth),
+                                            self.context.get('replies_limit', self.default_replies_limit))
+        replies_map = {root.id: [] for root in roots}
+        # replies come ordered by depth, a reply is kept only when its parent made it into the thread
+        for reply in replies:
+            if reply.reply_to_id in replies_map:
+                replies_map[reply.reply_to_id].append(reply)
+                replies_map[reply.id] = []
+        return replies_map
+
+
 class ListCommentSerializer(serializers.ModelSerializer):
     replies = serializers.SerializerMethodField('get_replies')
     is_owner = serializers.SerializerMethodField('get_is_owner')
 
     def get_replies(self, obj):
-        replies = Comment.objects.filter(reply_to=obj)
+        if 'comment_replies' in self.context:
+            replies = self.context['comment_replies'].get(obj.id, [])
+        else:
+            replies = Comment.objects.filter(reply_to=obj)
         return ListCommentSerializer(instance=replies, context=self.context, many=True).data
 
     def get_is_owner(self, obj):
         user = self.context['request'].user
-        return obj.created_by == user
+        return user is not None and obj.created_by_id == user.id
 
     class Meta:
         model = Comment
         fields = ('id', 'body', 'replies', 'is_owner', 'created_at', 'created_by', 'updated_at')
+        list_serializer_class = CommentThreadListSerializer
+
+
+class ListCommentParamsSerializer(serializers.Serializer):
+    depth = serializers.IntegerField(required=False, min_value=1, max_value=50,
+                                     default=CommentThreadListSerializer.default_depth)
+    replies_limit = serializers.IntegerField(required=False, min_value=1, max_value=500,
+                                             default=CommentThreadListSerializer.default_replies_limit)
 
 
 class LikePostSerializer(serializers.ModelSerializer):
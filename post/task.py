@@ -1,14 +1,22 @@
 from NeighborsHub.celery import app as celery_app
-from NeighborsHub.openai_manager import GetPostCategory
 
 
 @celery_app.task
 def celery_get_category_post(post_id: int) -> None:
-    from post.models import Category, Post
-
-    categories = [category.title for category in Category.objects.all()]
-    post = Post.objects.get(id=post_id)
-    category_title = GetPostCategory(categories, post.body).run()
-    post.category.clear()
-    post.category.add(Category.objects.get(title=category_title))
-    return
+    from post.categorization import categorize_posts
+
+    categorize_posts([post_id])
+
+
+@celery_app.task(ignore_result=True)
+def celery_categorize_pending_posts() -> None:
+    from post.categorization import categorize_pending_posts
+
+    categorize_pending_posts()
+
+
+@celery_app.task(ignore_result=True)
+def celery_flush_seen_posts() -> None:
+    from post.utils import flush_seen_post_events
+
+    flush_seen_post_events()
@@ -1,8 +1,14 @@
+import base64
+import json
 import time
+from unittest.mock import patch
 
+from django.conf import settings
 from django.contrib.gis.geos import Point
+from django.db import DatabaseError, connection
 from django.template.defaulttags import lorem
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from model_bakery import baker
 from rest_framework import status
 from rest_framework.reverse import reverse
@@ -11,7 +17,13 @@ from NeighborsHub.test_function import test_object_attributes_existence
 from albums.models import Media
 from chat.models import ChatRoom
 from core.models import Hashtag
+from NeighborsHub.gis import encode_geohash
+from NeighborsHub.redis_management import SeenPostEventsRedis, PostCategorizationRedis
+from post.categorization import categorize_posts, categorize_pending_posts, hash_post_body
+from post.classifier import CategoryClassifier, categorized_post_samples, reset_category_classifier
 from post.models import Post, PostHashtag, Comment, CommentHashtag, LikePost, LikeComment, Category, UserSeenPost
+from post.utils import flush_seen_post_events
+from post.views import ListPostAPI
 from users.models import Address, CustomerUser
 from users.tests import _create_user
 from rest_framework.test import APIClient
@@ -41,6 +53,25 @@ class TsetPostModel(TestCase):
         hashtag = Hashtag.objects.filter(hashtag_title="hello").first()
         self.assertIsNotNone(hashtag)
 
+    def test_hashtag_sync_query_count_does_not_grow_with_tags(self):
+        post = baker.make(Post, body='#existing')
+        with CaptureQueriesContext(connection) as few_tags:
+            post.sync_hashtags(['existing', 'one', 'two'])
+        post = baker.make(Post, body='#existing')
+        with CaptureQueriesContext(connection) as many_tags:
+            post.sync_hashtags(['existing'] + [f'tag_{index}' for index in range(20)])
+        self.assertEqual(len(few_tags), len(many_tags))
+        self.assertEqual(21, PostHashtag.objects.filter(post=post).count())
+        self.assertEqual(1, Hashtag.objects.filter(hashtag_title='existing').count())
+
+    def test_hashtag_sync_removes_only_dropped_tags(self):
+        post = baker.make(Post, body='#first #second')
+        first = PostHashtag.objects.get(post=post, hashtag__hashtag_title='first')
+        post.body = '#first #third'
+        post.save()
+        self.assertEqual({'first', 'third'}, set(post.hashtags.values_list('hashtag_title', flat=True)))
+        self.assertTrue(PostHashtag.objects.filter(id=first.id).exists())
+
 
 class TestCreatePost(TestCase):
     def setUp(self) -> None:
@@ -214,6 +245,15 @@ class TestListPost(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response_json['status'], 'ok')
         self.assertEqual(12, response_json['data']['posts']['count'])
+        self.assertEqual('exact', response_json['data']['posts']['count_precision'])
+
+    def test_post_count_is_capped(self):
+        with patch.object(ListPostAPI, 'count_cap', 10):
+            response = self.client.get(reverse('post_list'), data={'limit': 5}, format='json')
+        posts = response.json()['data']['posts']
+        self.assertEqual(10, posts['count'])
+        self.assertEqual('capped', posts['count_precision'])
+        self.assertIsNotNone(posts['next'])
 
     def test_user_can_see_neighbors_posts(self):
         params = {'user_latitude': -75.5673, 'user_longitude': 40.5432, 'to_distance': 100}
@@ -304,6 +344,105 @@ class TestListPost(TestCase):
         self.assertIn('common_chat', response_json['data']['posts']['results'][0])
         self.assertEqual(chat_room.room_id, response_json['data']['posts']['results'][0]['common_chat'])
 
+    def test_feed_shows_the_latest_like_of_the_user(self):
+        post = Post.objects.filter(created_by=self.user).first()
+        baker.make(LikePost, post=post, created_by=self.dummy_user, type='like')
+        baker.make(LikePost, post=post, created_by=self.dummy_user, type='dislike')
+        self.client.force_authenticate(self.dummy_user)
+        response_json = self.client.get(reverse('post_list'), data={'limit': 100}).json()
+        [result] = [result for result in response_json['data']['posts']['results'] if result['id'] == post.id]
+        self.assertEqual('dislike', result['user_liked'])
+
+
+class TestListPostQueryCount(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        category = baker.make(Category, title='testing', internal_code='test')
+        for _ in range(10):
+            author = baker.make(CustomerUser)
+            address = baker.make(Address, location=Point(40.5432, -75.5673))
+            post = baker.make(Post, address=address, created_by=author, media=baker.make(Media, 2))
+            post.category.add(category)
+            LikePost.objects.set_user_like(author, post.id, 'like')
+
+    def test_feed_query_count_does_not_grow_with_page_size(self):
+        # count, page, media, category, avatars
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('post_list'), data={'limit': 2}, format='json')
+        self.assertEqual(2, len(response.json()['data']['posts']['results']))
+
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('post_list'), data={'limit': 10}, format='json')
+        response_json = response.json()
+        self.assertEqual(10, len(response_json['data']['posts']['results']))
+        self.assertEqual([{'type': 'like', 'count': 1}], response_json['data']['posts']['results'][0]['likes'])
+
+    def test_authenticated_feed_query_count_does_not_grow_with_page_size(self):
+        user = _create_user()
+        self.client.force_authenticate(user)
+        # count, page, media, category, avatars, user likes, common chats,
+        # savepoint, seen upsert, seen counters, release savepoint
+        with self.assertNumQueries(11):
+            self.client.get(reverse('post_list'), data={'limit': 2}, format='json')
+        with self.assertNumQueries(11):
+            self.client.get(reverse('post_list'), data={'limit': 10}, format='json')
+        self.assertEqual(10, UserSeenPost.objects.filter(user=user).count())
+        self.assertEqual(10, Post.objects.filter(seen_count=1).count())
+
+    def test_cursor_pages_cost_the_same_and_skip_count(self):
+        url = reverse('post_list')
+        # page, media, category, avatars
+        with self.assertNumQueries(4):
+            response_json = self.client.get(url, data={'paginate': 'cursor', 'limit': 4}).json()
+        ids = [post['id'] for post in response_json['data']['posts']['results']]
+        self.assertNotIn('count', response_json['data']['posts'])
+        while response_json['data']['posts']['next'] is not None:
+            with self.assertNumQueries(4):
+                response_json = self.client.get(response_json['data']['posts']['next']).json()
+            ids += [post['id'] for post in response_json['data']['posts']['results']]
+        expected = Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(list(expected), ids)
+
+    def test_cursor_pages_by_distance(self):
+        nearest = baker.make(Post, address=baker.make(Address, location=Point(40.5433, -75.5673)))
+        data = {'paginate': 'cursor', 'limit': 6, 'user_longitude': 40.5433, 'user_latitude': -75.5673}
+        response_json = self.client.get(reverse('post_list'), data=data).json()
+        self.assertEqual(nearest.id, response_json['data']['posts']['results'][0]['id'])
+        response_json = self.client.get(response_json['data']['posts']['next']).json()
+        self.assertEqual(5, len(response_json['data']['posts']['results']))
+        self.assertIsNone(response_json['data']['posts']['next'])
+
+    def test_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('post_list'), data={'paginate': 'cursor', 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        for position in (['not a date', 1], ['2024-07-01T12:00:00+00:00', 'x'], [None, 1], [[], 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get(reverse('post_list'), data={'paginate': 'cursor', 'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_seen_posts_refresh_last_seen(self):
+        user = _create_user()
+        post = Post.objects.first()
+        UserSeenPost.objects.bulk_mark_seen(user.id, [post.id])
+        first = UserSeenPost.objects.get(user=user, post=post)
+        UserSeenPost.objects.bulk_mark_seen(user.id, [post.id, post.id])
+        second = UserSeenPost.objects.get(user=user, post=post)
+        self.assertEqual(first.first_seen, second.first_seen)
+        self.assertGreaterEqual(second.last_seen, first.last_seen)
+        post.refresh_from_db()
+        self.assertEqual(1, post.seen_count)
+
+    def test_saving_a_post_keeps_concurrent_counter_updates(self):
+        post = Post.objects.first()
+        Post.objects.update_counters([post.id], like_count=2, seen_count=1)
+        post.title = 'edited title'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual('edited title', post.title)
+        self.assertEqual(2, post.like_count)
+        self.assertEqual(1, post.seen_count)
+
+
 class TestListCountLocationPost(TestCase):
     def setUp(self) -> None:
         self.client = APIClient()
@@ -342,6 +481,49 @@ class TestListCountLocationPost(TestCase):
         self.assertEqual(response_json['status'], 'ok')
         self.assertEqual(1, response_json['data']['posts']['count'])
 
+    def test_location_posts_clustered_by_zoom(self):
+        response = self.client.get(reverse('post_location_count'), data={'zoom': 1}, format='json')
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, response_json['data']['posts']['count'])
+        self.assertEqual(9, response_json['data']['posts']['results'][0]['posts_count'])
+        self.assertEqual('Point', response_json['data']['posts']['results'][0]['location']['type'])
+
+    def test_location_posts_clustered_by_precision(self):
+        response = self.client.get(reverse('post_location_count'), data={'precision': 12}, format='json')
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(3, response_json['data']['posts']['count'])
+        self.assertEqual(4, response_json['data']['posts']['results'][0]['posts_count'])
+
+    def test_precision_clusters_addresses_without_stored_geohash(self):
+        Address.objects.filter(location=Point(41.5435, -79.5680)).update(geohash=None)
+        baker.make(Post, address=None)
+        response = self.client.get(reverse('post_location_count'), data={'precision': 12}, format='json')
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(3, response_json['data']['posts']['count'])
+        self.assertEqual(4, response_json['data']['posts']['results'][0]['posts_count'])
+
+    def test_location_posts_filtered_by_geohash_prefix(self):
+        data = {'geohash': encode_geohash(Point(41.5435, -79.5680), precision=6)}
+        response = self.client.get(reverse('post_location_count'), data=data, format='json')
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, response_json['data']['posts']['count'])
+        self.assertEqual(4, response_json['data']['posts']['results'][0]['posts_count'])
+
+    def test_location_posts_clustered_with_filters(self):
+        data = {'zoom': 1, 'hashtag_title': 'hello_world'}
+        response = self.client.get(reverse('post_location_count'), data=data, format='json')
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(2, response_json['data']['posts']['results'][0]['posts_count'])
+
+    def test_rejects_invalid_zoom(self):
+        response = self.client.get(reverse('post_location_count'), data={'zoom': 50}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class TsetCommentModel(TestCase):
     @staticmethod
@@ -402,6 +584,8 @@ class TestCreateComment(TestCase):
         self.assertEqual('ok', response_json['status'])
         self.assertEqual(1, Comment.objects.filter(post_id=self.post.id).count())
         self.assertEqual(1, Hashtag.objects.filter(hashtag_title='comment').count())
+        self.post.refresh_from_db()
+        self.assertEqual(1, self.post.comment_count)
 
 
 class TestListComment(TestCase):
@@ -431,6 +615,35 @@ class TestListComment(TestCase):
         self.assertTrue(response_json['data']['comments']['results'][0]['is_owner'])
         self.assertFalse(response_json['data']['comments']['results'][0]['replies'][0]['is_owner'])
 
+    def test_thread_is_fetched_with_constant_queries(self):
+        root = Comment.objects.filter(post=self.post, reply_to__isnull=True).first()
+        baker.make(Comment, post=self.post, reply_to=root, _quantity=5)
+        # count, root page, thread
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('list_post_comment', kwargs={'post_pk': self.post.id}))
+        self.assertEqual(6, len(response.json()['data']['comments']['results'][0]['replies']))
+
+    def test_thread_depth_and_replies_limit(self):
+        root = Comment.objects.filter(post=self.post, reply_to__isnull=True).first()
+        baker.make(Comment, post=self.post, reply_to=root, _quantity=5)
+        data = {'depth': 1, 'replies_limit': 2}
+        response = self.client.get(reverse('list_post_comment', kwargs={'post_pk': self.post.id}), data=data)
+        replies = response.json()['data']['comments']['results'][0]['replies']
+        self.assertEqual(2, len(replies))
+        self.assertEqual([], replies[0]['replies'])
+
+    def test_cursor_pagination_of_root_comments(self):
+        baker.make(Comment, post=self.post, _quantity=2)
+        url = reverse('list_post_comment', kwargs={'post_pk': self.post.id})
+        response_json = self.client.get(url, data={'paginate': 'cursor', 'limit': 2}).json()
+        self.assertEqual(2, len(response_json['data']['comments']['results']))
+        self.assertNotIn('count', response_json['data']['comments'])
+
+        response_json = self.client.get(response_json['data']['comments']['next']).json()
+        self.assertEqual(1, len(response_json['data']['comments']['results']))
+        self.assertEqual(1, len(response_json['data']['comments']['results'][0]['replies']))
+        self.assertIsNone(response_json['data']['comments']['next'])
+
 
 class TestRetrievePost(TestCase):
     def setUp(self) -> None:
@@ -559,6 +772,18 @@ class LikePostTestCase(TestCase):
         self.assertIsNotNone(LikePost.objects.filter(post_id=self.post.id, type='support').first())
         self.assertIsNone(LikePost.objects.filter(post_id=self.post.id, type='like').first())
 
+    def test_user_changes_like_updates_counters(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('post_like', kwargs={'post_pk': self.post.id})
+        self.client.post(url, data={'type': 'support'}, format='json')
+        self.client.post(url, data={'type': 'like'}, format='json')
+        self.post.refresh_from_db()
+        self.assertEqual((0, 1, 0), (self.post.support_count, self.post.like_count, self.post.dislike_count))
+
+        self.client.delete(url, data={}, format='json')
+        self.post.refresh_from_db()
+        self.assertEqual(0, self.post.like_count)
+
     def test_user_removes_like_successful(self):
         self.client.force_authenticate(self.user)
         baker.make(LikePost, post_id=self.post.id, created_by=self.user)
@@ -567,6 +792,14 @@ class LikePostTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertIsNone(LikePost.objects.filter(post_id=self.post.id).first())
 
+    def test_reconcile_repairs_drifted_counters(self):
+        baker.make(LikePost, post_id=self.post.id, type='dislike', _quantity=2)
+        baker.make(Comment, post=self.post)
+        self.assertEqual(1, Post.objects.reconcile_counters())
+        self.post.refresh_from_db()
+        self.assertEqual((2, 1), (self.post.dislike_count, self.post.comment_count))
+        self.assertEqual(0, Post.objects.reconcile_counters())
+
 
 class LikeCommentTestCase(TestCase):
     def setUp(self) -> None:
@@ -653,3 +886,202 @@ class TsetUserSeenPostModel(TestCase):
         created = baker.make(UserSeenPost)
         test_obj = UserSeenPost.objects.filter(id=created.id).first()
         self.assertIsNotNone(test_obj)
+
+
+class TestSeenPostBuffer(TestCase):
+    def setUp(self) -> None:
+        self.user = _create_user()
+        self.posts = baker.make(Post, _quantity=2)
+        self.buffer = SeenPostEventsRedis(key='SeenPost/events/test')
+        self.buffer.connection.delete(self.buffer.key, self.buffer.claims_key)
+
+    def tearDown(self) -> None:
+        self.buffer.connection.delete(self.buffer.key, self.buffer.claims_key)
+
+    def test_flush_collapses_duplicate_events(self):
+        self.buffer.push(self.user.id, [self.posts[0].id, self.posts[1].id], 1700000000.0)
+        self.buffer.push(self.user.id, [self.posts[0].id], 1700000100.0)
+        self.buffer.push(self.user.id, [self.posts[1].id + 1000], 1700000100.0)
+
+        flushed = flush_seen_post_events(self.buffer, batch_size=2)
+        self.assertEqual(2, flushed)
+        self.assertEqual(0, self.buffer.size())
+        seen_post = UserSeenPost.objects.get(user=self.user, post=self.posts[0])
+        self.assertEqual(1700000000.0, seen_post.first_seen.timestamp())
+        self.assertEqual(1700000100.0, seen_post.last_seen.timestamp())
+
+    def test_events_of_deleted_users_are_dropped(self):
+        self.buffer.push(self.user.id, [self.posts[0].id], 1700000000.0)
+        self.buffer.push(self.user.id + 1000, [self.posts[0].id], 1700000000.0)
+        self.assertEqual(1, flush_seen_post_events(self.buffer, batch_size=10))
+        self.assertEqual(0, self.buffer.size())
+
+    def test_failed_write_keeps_events(self):
+        self.buffer.push(self.user.id, [self.posts[0].id, self.posts[1].id], 1700000000.0)
+        with patch.object(UserSeenPost.objects, 'bulk_upsert', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                flush_seen_post_events(self.buffer, batch_size=10)
+        self.assertEqual(2, self.buffer.size())
+        self.assertEqual(2, flush_seen_post_events(self.buffer, batch_size=10))
+        self.assertEqual(0, self.buffer.connection.zcard(self.buffer.claims_key))
+
+    def test_abandoned_claims_are_flushed_again(self):
+        self.buffer.push(self.user.id, [self.posts[0].id], 1700000000.0)
+        self.buffer.claim(10)
+        self.assertEqual(0, self.buffer.size())
+        self.assertEqual(1, self.buffer.release_stale(older_than=0))
+        self.assertEqual(1, flush_seen_post_events(self.buffer, batch_size=10))
+
+
+@override_settings(POST_CATEGORIZATION={**settings.POST_CATEGORIZATION, 'BACKEND': 'stub', 'STUB_LATENCY': 0,
+                                        'LOCAL_CLASSIFIER': False})
+class TestPostCategorization(TestCase):
+    def setUp(self) -> None:
+        baker.make(Category, title='sport', description='football match running team game')
+        baker.make(Category, title='music', description='concert band song guitar singer')
+        self.queue = PostCategorizationRedis(key_prefix='PostCategory/test')
+        reset_category_classifier()
+
+    def tearDown(self) -> None:
+        keys = self.queue.connection.keys('PostCategory/test/*')
+        if keys:
+            self.queue.connection.delete(*keys)
+
+    def test_body_hash_follows_body(self):
+        post = baker.make(Post, body='first body')
+        self.assertEqual(hash_post_body('first body'), post.body_hash)
+        post.title = 'new title'
+        post.save()
+        self.assertEqual(hash_post_body('first body'), Post.objects.get(id=post.id).body_hash)
+        post.body = 'second body'
+        post.save()
+        self.assertEqual(hash_post_body('second body'), Post.objects.get(id=post.id).body_hash)
+
+    def test_post_is_queued_for_categorization_once_committed(self):
+        with patch('post.models.enqueue_post_categorization') as mock_enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                post = baker.make(Post, body='first body')
+                mock_enqueue.assert_not_called()
+        mock_enqueue.assert_called_once_with(post.id)
+
+    def test_categorize_posts_caches_by_body(self):
+        posts = [baker.make(Post, body='sport day in the park'), baker.make(Post, body='sport day in the park'),
+                 baker.make(Post, body='music tonight')]
+        self.assertEqual(3, categorize_posts([post.id for post in posts], cache=self.queue))
+        self.assertEqual(['sport'], [category.title for category in posts[1].category.all()])
+        self.assertEqual(['music'], [category.title for category in posts[2].category.all()])
+        self.assertEqual({posts[0].body_hash: 'sport'}, self.queue.get_cached([posts[0].body_hash]))
+
+    def test_categorize_pending_posts_in_batches(self):
+        posts = baker.make(Post, body='weekend sport', _quantity=5)
+        self.queue.push_pending([post.id for post in posts])
+        self.assertEqual(5, categorize_pending_posts(self.queue, batch_size=2))
+        self.assertEqual([], self.queue.pop_pending(10))
+        self.assertEqual(5, Post.category.through.objects.filter(category__title='sport').count())
+
+    def test_failing_batch_does_not_block_the_others(self):
+        posts = baker.make(Post, body='weekend sport', _quantity=4)
+        self.queue.push_pending([post.id for post in posts])
+
+        def categorize(post_ids, cache):
+            if posts[0].id in post_ids:
+                raise ValueError('bad post')
+            return categorize_posts(post_ids, cache=cache)
+
+        with patch('post.categorization.categorize_posts', side_effect=categorize):
+            self.assertEqual(3, categorize_pending_posts(self.queue, batch_size=1))
+            self.assertEqual([posts[0].id], self.queue.pop_pending(10))
+            self.queue.push_pending([posts[0].id])
+            for _ in range(settings.POST_CATEGORIZATION['MAX_ATTEMPTS'] - 1):
+                categorize_pending_posts(self.queue, batch_size=1)
+        self.assertEqual([], self.queue.pop_pending(10))
+        self.assertEqual({posts[0].id}, self.queue.dead_letters())
+
+    def test_local_classifier_answers_confident_posts(self):
+        post = baker.make(Post, body='the band played one more song at the concert')
+        categorization = {**settings.POST_CATEGORIZATION, 'LOCAL_CLASSIFIER': True, 'LOCAL_THRESHOLD': 0.0}
+        with override_settings(POST_CATEGORIZATION=categorization):
+            self.assertEqual(1, categorize_posts([post.id], cache=self.queue))
+        self.assertEqual(['music'], [category.title for category in post.category.all()])
+        # only model answers are cached
+        self.assertEqual({}, self.queue.get_cached([post.body_hash]))
+        self.assertEqual('local', Post.objects.get(id=post.id).category_source)
+
+    def test_classifier_trains_on_model_and_curated_labels_only(self):
+        posts = [baker.make(Post, body='sport day in the park'), baker.make(Post, body='music tonight'),
+                 baker.make(Post, body='guitar concert')]
+        categorize_posts([posts[0].id], cache=self.queue)
+        self.assertEqual('model', Post.objects.get(id=posts[0].id).category_source)
+        music = Category.objects.get(title='music')
+        for post, source in zip(posts[1:], ('curated', 'local')):
+            post.category.add(music)
+            Post.objects.filter(id=post.id).update(category_source=source)
+        self.assertEqual({('sport day in the park', 'sport'), ('music tonight', 'music')},
+                         set(categorized_post_samples(10)))
+
+
+class TestCategoryClassifier(TestCase):
+    def setUp(self) -> None:
+        self.classifier = CategoryClassifier(dimensions=2 ** 12).fit(
+            ['football match tonight', 'our team won the game', 'guitar lessons for beginners', 'live band concert'],
+            ['sport', 'sport', 'music', 'music'],
+        )
+
+    def test_predicts_nearest_centroid(self):
+        predictions = self.classifier.predict(['who wants to play football this weekend', 'selling my old guitar'])
+        self.assertEqual(['sport', 'music'], [label for label, _ in predictions])
+        self.assertTrue(all(confidence > 0 for _, confidence in predictions))
+
+    def test_unrelated_text_has_no_confidence(self):
+        [(_, confidence)] = self.classifier.predict(['xyzzy'])
+        self.assertLess(confidence, 0.1)
+
+
+class TestPostSearch(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        address = baker.make(Address, location=Point(40.5432, -75.5673))
+        self.title_match = baker.make(Post, address=address, title='Neighborhood garden party', body='come along')
+        self.body_match = baker.make(Post, address=address, title='Saturday', body='bring food to the garden')
+        baker.make(Post, address=address, title='Lost cat', body='black and white')
+
+    def test_search_vector_is_maintained_on_save(self):
+        self.assertEqual([self.title_match.id], list(Post.objects.search('party').values_list('id', flat=True)))
+        self.title_match.title = 'Neighborhood garden picnic'
+        self.title_match.save()
+        self.assertFalse(Post.objects.search('party').exists())
+
+    def test_search_vector_is_maintained_without_save(self):
+        Post.objects.filter(id=self.body_match.id).update(body='bring drinks to the barbecue')
+        [created] = Post.objects.bulk_create([Post(title='Yard sale', body='old bikes')])
+        self.assertFalse(Post.objects.search('food').exists())
+        self.assertEqual([self.body_match.id], list(Post.objects.search('barbecue').values_list('id', flat=True)))
+        self.assertEqual([created.id], list(Post.objects.search('bikes').values_list('id', flat=True)))
+
+    def test_search_ranks_title_matches_first_and_matches_prefixes(self):
+        response = self.client.get(reverse('post_list'), data={'search': 'gard'}, format='json')
+        results = response.json()['data']['posts']['results']
+        self.assertEqual([self.title_match.id, self.body_match.id], [post['id'] for post in results])
+
+    def test_search_requires_every_word(self):
+        response = self.client.get(reverse('post_list'), data={'search': 'garden food'}, format='json')
+        self.assertEqual([self.body_match.id], [post['id'] for post in response.json()['data']['posts']['results']])
+
+    def test_fuzzy_search_matches_similar_titles(self):
+        response = self.client.get(reverse('post_list'), data={'search': 'Lost cta', 'fuzzy': 'true'}, format='json')
+        self.assertEqual(1, response.json()['data']['posts']['count'])
+
+    def test_cursor_pages_through_equal_ranks(self):
+        address = baker.make(Address, location=Point(40.5432, -75.5673))
+        posts = baker.make(Post, address=address, title='Garden tools', body='to lend', _quantity=5)
+        data = {'search': 'tools', 'paginate': 'cursor', 'limit': 2}
+        response_json = self.client.get(reverse('post_list'), data=data, format='json').json()
+        ids = [post['id'] for post in response_json['data']['posts']['results']]
+        while response_json['data']['posts']['next'] is not None:
+            response_json = self.client.get(response_json['data']['posts']['next']).json()
+            ids += [post['id'] for post in response_json['data']['posts']['results']]
+        self.assertEqual(sorted([post.id for post in posts], reverse=True), ids)
+
+    def test_search_in_location_count(self):
+        response = self.client.get(reverse('post_location_count'), data={'search': 'garden'}, format='json')
+        self.assertEqual(2, response.json()['data']['posts']['results'][0]['posts_count'])
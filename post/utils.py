@@ -0,0 +1,91 @@
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
+
+from NeighborsHub.redis_management import SeenPostEventsRedis
+from NeighborsHub.utils import is_testing
+from post.models import Post, UserSeenPost
+from post.task import celery_flush_seen_posts
+from users.models import CustomerUser
+
+logger = logging.getLogger(__name__)
+
+
+def mark_posts_seen(user_id: int, post_ids: list[int]) -> None:
+    """
+    Buffer seen-post events in Redis for the celery worker, falls back to a synchronous upsert when
+    buffering is disabled or Redis is not reachable.
+    """
+    if not post_ids:
+        return
+    if settings.SEEN_POST_BUFFER['ENABLED'] and not is_testing():
+        try:
+            buffered = SeenPostEventsRedis().push(user_id, post_ids, time.time())
+        except RedisError as exc:
+            logger.warning('Seen posts buffer is unavailable, writing synchronously: %s', exc)
+        else:
+            if buffered >= settings.SEEN_POST_BUFFER['BATCH_SIZE']:
+                try:
+                    celery_flush_seen_posts.apply_async()
+                except OperationalError as exc:
+                    logger.warning('Could not trigger seen posts flush: %s', exc)
+            return
+    UserSeenPost.objects.bulk_mark_seen(user_id, post_ids)
+
+
+def collapse_seen_events(events: list[tuple[int, int, float]]) -> dict:
+    """Reduce events to the first and last timestamp of every (user_id, post_id) pair."""
+    seen_events = {}
+    for user_id, post_id, seen_at in events:
+        first_seen, last_seen = seen_events.get((user_id, post_id), (seen_at, seen_at))
+        seen_events[(user_id, post_id)] = (min(first_seen, seen_at), max(last_seen, seen_at))
+    return seen_events
+
+
+def _to_datetime(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def flush_seen_post_events(buffer: SeenPostEventsRedis = None, batch_size: int = None,
+                           max_batches: int = None) -> int:
+    """
+    Drain buffered seen-post events into `UserSeenPost`, returns the number of upserted rows. A batch is only
+    removed from the buffer once written, a failing batch goes back to the buffer.
+    """
+    buffer = buffer or SeenPostEventsRedis()
+    batch_size = batch_size or settings.SEEN_POST_BUFFER['BATCH_SIZE']
+    max_batches = max_batches or settings.SEEN_POST_BUFFER['MAX_BATCHES']
+    buffer.release_stale(settings.SEEN_POST_BUFFER['CLAIM_TIMEOUT'])
+
+    flushed = 0
+    for _ in range(max_batches):
+        claim_key, events = buffer.claim(batch_size)
+        try:
+            flushed += write_seen_post_events(collapse_seen_events(events))
+        except Exception:
+            buffer.release(claim_key)
+            raise
+        buffer.ack(claim_key)
+        if len(events) < batch_size:
+            break
+    return flushed
+
+
+def write_seen_post_events(seen_events: dict) -> int:
+    # posts and users may be deleted between being seen and being flushed
+    existing_posts = set(Post.objects.filter(id__in={post_id for _, post_id in seen_events})
+                         .values_list('id', flat=True))
+    existing_users = set(CustomerUser.objects.filter(id__in={user_id for user_id, _ in seen_events})
+                         .values_list('id', flat=True))
+    seen_events = {
+        (user_id, post_id): (_to_datetime(first_seen), _to_datetime(last_seen))
+        for (user_id, post_id), (first_seen, last_seen) in seen_events.items()
+        if post_id in existing_posts and user_id in existing_users
+    }
+    if seen_events:
+        UserSeenPost.objects.bulk_upsert(seen_events)
+    return len(seen_events)
@@ -1,4 +1,7 @@
+from django.contrib.gis.db.models.aggregates import Collect
+from django.contrib.gis.db.models.functions import Centroid, GeoHash, SnapToGrid
 from django.db.models import Count
+from django.db.models.functions import Coalesce, Substr
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status
 from rest_framework.filters import SearchFilter
@@ -10,16 +13,19 @@ from django.contrib.gis.geos import Polygon
 from NeighborsHub.custom_view_mixin import ExpressiveCreateModelMixin, ExpressiveListModelMixin, \
     ExpressiveUpdateModelMixin, ExpressiveRetrieveModelMixin
 from NeighborsHub.exceptions import NotOwnAddressException, ObjectNotFoundException
+from NeighborsHub.pagination import LimitOffsetOrCursorPagination
 from NeighborsHub.permission import CustomAuthentication, IsOwnerAuthentication, CustomAuthenticationWithoutEffect
-from django.db import models
-from post.filters import ListPostFilter
+from django.db import models, transaction
+from post.filters import ListPostFilter, PostSearchFilter
 from post.models import Post, Comment, LikePost, LikeComment, Category, UserSeenPost
 from post.serializers import PostSerializer, MyListPostSerializer, CommentSerializer, ListCommentSerializer, \
     LikePostSerializer, LikeCommentSerializer, ListCountLocationPostsSerializer, PublicListPostSerializer, \
-    ListCategorySerializer
+    ListCategorySerializer, ListClusterLocationPostsSerializer, ClusterLocationPostsParamsSerializer, \
+    ListCommentParamsSerializer
 from post.models import Post, Comment
 from post.serializers import PostSerializer, MyListPostSerializer, CommentSerializer, ListCommentSerializer, \
     RetrievePostSerializer
+from post.utils import mark_posts_seen
 from users.models import Address
 from django.contrib.gis.geos import Point
 
@@ -41,15 +47,17 @@ class CreateUserPostAPI(ExpressiveCreateModelMixin, generics.CreateAPIView):
 class ListUserPostAPI(ExpressiveListModelMixin, generics.ListAPIView):
     authentication_classes = (CustomAuthentication,)
     serializer_class = MyListPostSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, PostSearchFilter]
     queryset = Post.objects.all()
     filterset_fields = ['address_id', ]
-    search_fields = ['title', 'body']
+    pagination_class = LimitOffsetOrCursorPagination
+    cursor_ordering = ('-created_at', '-id')
 
     plural_name = 'posts'
 
     def get_queryset(self):
-        return Post.objects.filter(created_by=self.request.user)
+        posts = Post.objects.filter(created_by=self.request.user)
+        return self.get_serializer_class().setup_eager_loading(posts)
 
 
 class RetrieveUpdateDeleteUserPostAPI(ExpressiveUpdateModelMixin, ExpressiveRetrieveModelMixin,
@@ -85,7 +93,7 @@ class RetrievePost(ExpressiveRetrieveModelMixin, generics.RetrieveAPIView):
 
     def seen_post(self):
         if self.request.user is not None:
-            return UserSeenPost.objects.update_or_create(user=self.request.user, post_id=self.kwargs['post_pk'])
+            return mark_posts_seen(self.request.user.id, [self.kwargs['post_pk']])
 
     def get(self, request, *args, **kwargs):
         response = self.retrieve(request, *args, **kwargs)
@@ -96,11 +104,20 @@ class RetrievePost(ExpressiveRetrieveModelMixin, generics.RetrieveAPIView):
 class ListPostAPI(generics.ListAPIView):
     authentication_classes = (CustomAuthenticationWithoutEffect,)
     serializer_class = PublicListPostSerializer
-    filter_backends = [InBBoxFilter, DjangoFilterBackend, SearchFilter]
+    filter_backends = [InBBoxFilter, DjangoFilterBackend, PostSearchFilter]
     filterset_class = ListPostFilter
+    pagination_class = LimitOffsetOrCursorPagination
+    # the distance, bbox and hashtag filters throw the planner's estimate off, count up to the cap instead
+    count_precision = 'capped'
     plural_name = 'posts'
     bbox_filter_field = 'address__location'
-    search_fields = ['title', 'body']
+
+    def get_cursor_ordering(self):
+        if Post.objects.search_query(self.request.query_params.get(PostSearchFilter.search_param, '')) is not None:
+            return '-search_rank', '-id'
+        if self.get_user_location_point() is not None:
+            return 'distance', 'id'
+        return '-created_at', '-id'
 
     def get_user_location_point(self):
         if (self.request.query_params.get('user_latitude') is not None and
@@ -118,8 +135,7 @@ class ListPostAPI(generics.ListAPIView):
 
     def seen_posts(self, page_posts):
         if self.request.user is not None:
-            for post in page_posts:
-                UserSeenPost.objects.update_or_create(user=self.request.user, post=post)
+            mark_posts_seen(self.request.user.id, [post.id for post in page_posts])
 
     def set_is_seen(self, post):
         seen_posts = UserSeenPost.objects.filter(user=self.request.user)
@@ -140,7 +156,7 @@ class ListPostAPI(generics.ListAPIView):
         if self.request.user is not None:
             posts = posts.exclude(created_by=self.request.user)
             posts = self.set_is_seen(posts)
-        return posts
+        return self.get_serializer_class().setup_eager_loading(posts)
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
@@ -162,11 +178,10 @@ class ListPostAPI(generics.ListAPIView):
 class ListPublicUserPostAPI(ListPostAPI):
     authentication_classes = (CustomAuthenticationWithoutEffect,)
     serializer_class = PublicListPostSerializer
-    filter_backends = [InBBoxFilter, DjangoFilterBackend, SearchFilter]
+    filter_backends = [InBBoxFilter, DjangoFilterBackend, PostSearchFilter]
     filterset_class = ListPostFilter
     plural_name = 'posts'
     bbox_filter_field = 'address__location'
-    search_fields = ['title', 'body']
 
     def get_queryset(self):
         posts = Post.objects.filter_posts_location_user_distance(
@@ -175,17 +190,18 @@ class ListPublicUserPostAPI(ListPostAPI):
             from_distance=self.request.query_params.get('from_distance', None),
             to_distance=self.request.query_params.get('to_distance', None)
         ).filter(created_by_id=self.kwargs['user_pk'])
-        return posts
+        return self.get_serializer_class().setup_eager_loading(posts)
 
 
 class ListCountLocationPostAPI(ExpressiveListModelMixin, generics.ListAPIView):
     authentication_classes = (CustomAuthenticationWithoutEffect,)
     serializer_class = ListCountLocationPostsSerializer
-    filter_backends = [InBBoxFilter, DjangoFilterBackend, SearchFilter]
+    filter_backends = [InBBoxFilter, DjangoFilterBackend, PostSearchFilter]
     filterset_class = ListPostFilter
     plural_name = 'posts'
     bbox_filter_field = 'address__location'
-    search_fields = ['title', 'body']
+    search_ranked = False  # posts are grouped by location after filtering
+    cluster_cells_per_tile = 4  # cluster cells along one side of a map tile in `zoom` mode
 
     def get_user_near_post(self):
         if (self.request.query_params.get('user_latitude') is not None and
@@ -209,14 +225,44 @@ class ListCountLocationPostAPI(ExpressiveListModelMixin, generics.ListAPIView):
         ))
         return posts
 
+    def get_cluster_params(self):
+        serializer = ClusterLocationPostsParamsSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def get_serializer_class(self):
+        params = self.get_cluster_params()
+        if params.get('zoom') is not None or params.get('precision') is not None:
+            return ListClusterLocationPostsSerializer
+        return self.serializer_class
+
+    def group_posts(self, posts):
+        params = self.get_cluster_params()
+        if params.get('precision') is not None:
+            # prefix of the geohash stored on the address, computed only for addresses not backfilled yet
+            posts = posts.filter(address__location__isnull=False)
+            cluster = Coalesce(Substr('address__geohash', 1, params['precision']),
+                               GeoHash('address__location', precision=params['precision']),
+                               output_field=models.CharField())
+        elif params.get('zoom') is not None:
+            cluster = SnapToGrid('address__location', 360 / (2 ** params['zoom'] * self.cluster_cells_per_tile))
+        else:
+            return posts.values('address__location').annotate(posts_count=Count('id', distinct=True))
+        posts = posts.annotate(cluster=cluster).values('cluster')
+        return posts.annotate(posts_count=Count('id', distinct=True),
+                              location=Centroid(Collect('address__location'))).order_by('-posts_count')
+
     def get_queryset(self):
         posts = self.get_user_near_post()
         if self.request.user is not None:
             posts = posts.exclude(created_by=self.request.user)
         posts = self.set_is_seen(posts)
-        posts = posts.values('address__location').annotate(posts_count=Count('address__location'))
         return posts
 
+    def filter_queryset(self, queryset):
+        # filters work on posts, grouping by location or cluster happens on the filtered posts
+        return self.group_posts(super().filter_queryset(queryset))
+
 
 class CreateCommentAPI(ExpressiveCreateModelMixin, generics.CreateAPIView):
     authentication_classes = (CustomAuthentication,)
@@ -226,7 +272,9 @@ class CreateCommentAPI(ExpressiveCreateModelMixin, generics.CreateAPIView):
 
     def perform_create(self, serializer):
         post = Post.objects.get(pk=self.kwargs['post_pk'])
-        comment = serializer.save(user=self.request.user, post=post)
+        with transaction.atomic():
+            comment = serializer.save(user=self.request.user, post=post)
+            Post.objects.update_counters([post.id], comment_count=1)
         return comment
 
 
@@ -246,12 +294,27 @@ class RetrieveUpdateDeleteCommentAPI(ExpressiveUpdateModelMixin, ExpressiveRetri
             raise ObjectNotFoundException
         return obj
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            Post.objects.update_counters([instance.post_id], comment_count=-1)
+
 
 class ListCommentAPI(ExpressiveListModelMixin, generics.ListAPIView):
     authentication_classes = (CustomAuthenticationWithoutEffect,)
     serializer_class = ListCommentSerializer
+    pagination_class = LimitOffsetOrCursorPagination
+    cursor_ordering = '-id'
     plural_name = 'comments'
 
+    def get_serializer_context(self):
+        params = ListCommentParamsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        context = super().get_serializer_context()
+        context.update(thread_depth=params.validated_data['depth'],
+                       replies_limit=params.validated_data['replies_limit'])
+        return context
+
     def get_queryset(self):
         return Comment.objects.filter(post_id=self.kwargs['post_pk'], reply_to__isnull=True).order_by('-id')
 
@@ -263,17 +326,12 @@ class LikePostAPI(APIView):
     def post(request, post_pk):
         serializer = LikePostSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        LikePost.objects.filter(post_id=post_pk, created_by=request.user).delete()
-        like_post = LikePost.objects.create(
-            created_by=request.user, updated_by=request.user,
-            post_id=post_pk, type=serializer.validated_data['type']
-        )
-        like_post.save()
+        LikePost.objects.set_user_like(request.user, post_pk, serializer.validated_data['type'])
         return Response(data={"status": "ok", "data": {}, "message": "Like post successfully"})
 
     @staticmethod
     def delete(request, post_pk):
-        LikePost.objects.filter(created_by=request.user, post_id=post_pk).delete()
+        LikePost.objects.set_user_like(request.user, post_pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
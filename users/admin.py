@@ -1,5 +1,4 @@
 from django.contrib import admin
-from .models import CustomerUser, OnlineUser
+from .models import CustomerUser
 
 admin.site.register(CustomerUser)
-admin.site.register(OnlineUser)
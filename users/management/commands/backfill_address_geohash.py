@@ -0,0 +1,25 @@
+from django.contrib.gis.db.models.functions import GeoHash
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from NeighborsHub.gis import GEOHASH_MAX_PRECISION
+from users.models import Address
+
+
+class Command(BaseCommand):
+    help = 'Fill `Address.geohash` of existing addresses in id ranges of --chunk-size rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10_000)
+        parser.add_argument('--all', action='store_true', help='recompute addresses that already have a geohash')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = Address.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        updated = 0
+        for start in range(0, last_id + 1, chunk_size):
+            addresses = Address.objects.filter(id__gte=start, id__lt=start + chunk_size, location__isnull=False)
+            addresses = addresses if options['all'] else addresses.filter(geohash__isnull=True)
+            updated += addresses.update(geohash=GeoHash('location', precision=GEOHASH_MAX_PRECISION))
+            self.stdout.write(f'{min(start + chunk_size, last_id + 1)}/{last_id + 1} ids scanned, {updated} updated')
+        self.stdout.write(self.style.SUCCESS(f'Backfilled geohash of {updated} addresses'))
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2024-06-05 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_onlineuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['geohash'], name='users_address_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
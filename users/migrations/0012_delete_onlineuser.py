@@ -0,0 +1,16 @@
+# Generated by Django 4.2.7 on 2024-06-27 09:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_address_geohash_and_more'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='OnlineUser',
+        ),
+    ]
@@ -1,14 +1,18 @@
 import datetime
 import re
+from functools import partial
 from uuid import uuid4
 
 from django.contrib.gis.db import models
 from django.contrib.auth.models import AbstractUser, Group, UserManager
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, Permission
+from django.db import transaction
 from django.db.models import Q
 from django.utils.translation import gettext as _
 
 from NeighborsHub.exceptions import NotOwnAddressException
+from NeighborsHub.gis import encode_geohash, GEOHASH_MAX_PRECISION
+from NeighborsHub.token_cache import invalidate_cached_user
 from core.models import BaseModel, City, States, Hashtag
 
 
@@ -87,12 +91,26 @@ class CustomerUser(AbstractBaseUser, PermissionsMixin):
 
     def save(self, *args, **kwargs):
         self.username = self.username if self.username is not None else uuid4().hex
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if not adding:
+            # authenticated requests must not see the previous state of the user from a token cache
+            transaction.on_commit(partial(invalidate_cached_user, self.id))
+
+    def delete(self, *args, **kwargs):
+        user_id = self.id
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(partial(invalidate_cached_user, user_id))
+        return result
 
     def __str__(self):
         return self.username
 
     def get_avatar(self):
+        # Avatars prefetched with `order_by('id')` are resolved without another query.
+        if 'avatar' in getattr(self, '_prefetched_objects_cache', {}):
+            avatars = list(self.avatar.all())
+            return avatars[-1] if avatars else None
         return self.avatar.last()
 
 
@@ -114,8 +132,15 @@ class Address(BaseModel):
     zip_code = models.CharField(max_length=10, blank=True, null=True)
     is_main_address = models.BooleanField(default=False, null=True, blank=True)
     location = models.PointField(null=True, blank=True)
+    # full precision geohash of `location`, any prefix of it is a coarser neighborhood cell
+    geohash = models.CharField(max_length=GEOHASH_MAX_PRECISION, null=True, blank=True, editable=False)
     is_public = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['geohash'], name='users_address_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
     def is_user_owner(self, user, raise_exception=False):
         is_owner = self.user == user
         if raise_exception and not is_owner:
@@ -125,16 +150,9 @@ class Address(BaseModel):
     def save(self, *args, **kwargs):
         if self.is_main_address:
             Address.objects.filter(user=self.user).update(is_main_address=False)
+        self.geohash = encode_geohash(self.location) if self.location is not None else None
         super().save(*args, **kwargs)
 
     def __str__(self):
         return (f"Address(id={self.id}, status={self.state}, user_id={self.user.id},  "
                 f"created_at={self.created_at}, updated_at={self.updated_at})")
-
-
-class OnlineUser(models.Model):
-    user = models.OneToOneField(CustomerUser, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
-
-    def __str__(self):
-        return self.user.username
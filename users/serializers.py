@@ -267,7 +267,7 @@ class UserPublicSerializer(serializers.ModelSerializer):
         return obj.mobile
 
     def get_last_user_avatar(self, obj):
-        qs = obj.avatar.last()
+        qs = obj.get_avatar()
         return UserAvatarSerializer(instance=qs, many=False).data
 
     #
@@ -8,6 +8,7 @@ from rest_framework import status
 from rest_framework.reverse import reverse
 
 from NeighborsHub.test_function import test_object_attributes_existence
+from NeighborsHub.token_cache import TokenCache
 from core.models import City
 from users.models import CustomerUser, Address, Follow
 from rest_framework.test import APIClient
@@ -776,6 +777,13 @@ class TestAddressModel(TestCase):
         test_obj = Address.objects.filter(id=created_address.id).first()
         self.assertIsNotNone(test_obj)
 
+    def test_address_geohash_is_set_on_save(self):
+        address = baker.make(Address, location=Point(10.40744, 57.64911))
+        self.assertEqual('u4pruydqqvj', address.geohash[:11])
+        address.location = None
+        address.save()
+        self.assertIsNone(address.geohash)
+
 
 class TestCreateListAddress(TestCase):
     def setUp(self) -> None:
@@ -1147,3 +1155,57 @@ class TestUpdateUserName(TestCase):
         response_json = response.json()
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('ok', response_json['status'])
+
+
+class TestTokenCache(TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        self.cache = TokenCache(max_size=2, ttl=30, clock=lambda: self.now)
+        self.user = _create_user()
+
+    def test_cached_user_is_a_copy(self):
+        self.cache.set('token', self.user)
+        cached_user = self.cache.get('token')
+        self.assertEqual(self.user.id, cached_user.id)
+        cached_user.first_name = 'changed'
+        self.assertEqual(USER_VALID_DATA['first_name'], self.cache.get('token').first_name)
+
+    def test_entries_expire(self):
+        self.cache.set('token', self.user)
+        self.cache.set('short', self.user, token_expires_at=self.now + 5)
+        self.now += 10
+        self.assertIsNone(self.cache.get('short'))
+        self.assertIsNotNone(self.cache.get('token'))
+        self.now += 30
+        self.assertIsNone(self.cache.get('token'))
+        self.assertEqual(0, len(self.cache))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('first', self.user)
+        self.cache.set('second', self.user)
+        self.cache.get('first')
+        self.cache.set('third', self.user)
+        self.assertIsNotNone(self.cache.get('first'))
+        self.assertIsNone(self.cache.get('second'))
+
+    def test_invalidate_messages(self):
+        other_user = baker.make(CustomerUser)
+        self.cache.set('first', self.user)
+        self.cache.set('second', other_user)
+        self.cache.invalidate(f'user:{self.user.id}')
+        self.assertIsNone(self.cache.get('first'))
+        self.cache.invalidate('token:second')
+        self.assertEqual(0, len(self.cache))
+
+    def test_token_validated_before_an_invalidation_is_not_cached(self):
+        version = self.cache.version
+        self.cache.invalidate_token('token')
+        self.cache.set('token', self.user, version=version)
+        self.assertIsNone(self.cache.get('token'))
+
+    def test_user_change_invalidates_cached_tokens(self):
+        with patch('users.models.invalidate_cached_user') as mock_invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.first_name = 'changed'
+                self.user.save()
+        mock_invalidate.assert_called_once_with(self.user.id)
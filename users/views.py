@@ -16,6 +16,7 @@ from NeighborsHub.exceptions import TokenIsNotValidAPIException, UserDoesNotExis
 from NeighborsHub.permission import CustomAuthentication, IsOwnerAuthentication, IsVerifiedUserPermission, \
     CustomAuthenticationWithoutEffect
 from NeighborsHub.redis_management import VerificationEmailRedis, VerificationOTPRedis, AuthenticationTokenRedis
+from NeighborsHub.token_cache import invalidate_cached_token
 from NeighborsHub.utils import create_random_chars
 from albums.models import UserAvatar
 from chat.models import ChatRoom
@@ -313,6 +314,7 @@ class LogoutApi(APIView):
         token = request.META.get('HTTP_AUTHORIZATION')
         token = token.split()[1]
         redis_manager.revoke(token)
+        invalidate_cached_token(token)
         return Response(data={"status": "ok", "data": {}, "message": _("Logout successfully")})
 
 